@@ -1,64 +1,25 @@
 import csv
 import matplotlib.pyplot as plt # type: ignore
-from typing import Dict, Set
 import glob
 import os
+import sys
 
-# Function to process a single CSV file and generate a distribution plot
-def process_csv(file_path: str):
-    # Initialize dictionaries to store points and user ID to name mapping
-    points = {}
-    user_id_to_names: Dict[str, Set[str]] = {}
+# The point rules live in rule_sets.yml at the root of the repository (see scoring.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from columnar_store import COMMIT_CSV_COLUMNS
+from scoring import DEFAULT_RULE_SET, aggregate_points, get_rule_set, table_from_rows
 
-    # Keywords to check in commit messages
-    keywords = ["boilerplate", "scaffolding", "scaffold", "scaff", "initial", "setup"]
+# Point policy from rule_sets.yml used to score commits
+rule_set = get_rule_set(os.environ.get('DEVPIE_RULE_SET', DEFAULT_RULE_SET))
 
-    # Read the CSV file
+# Function to process a single CSV file and generate a distribution plot
+def process_csv(file_path: str):
+    # Read the CSV file into rows keyed like the commit store, whichever columns it has
     with open(file_path, mode='r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            author_id = row['Author ID']
-            author_name = row['Author']
-            committer_id = row['Committer ID']
-            committer_name = row['Committer']
-            lines_added = int(row['Lines Added'])
-            lines_deleted = int(row['Lines Deleted'])
-            commit_message = row['Message']
-
-            # Check if the commit message contains any of the keywords
-            if any(keyword in commit_message.lower() for keyword in keywords):
-                author_points = 5
-                committer_points = 5
-            else:
-                author_points = 100 + (25 * lines_added) + (50 * lines_deleted)
-                committer_points = 100 + (25 * lines_added) + (50 * lines_deleted)
-
-            # Update the user ID to names mapping
-            if author_id not in user_id_to_names:
-                user_id_to_names[author_id] = set()
-            user_id_to_names[author_id].add(author_name)
-
-            if committer_id not in user_id_to_names:
-                user_id_to_names[committer_id] = set()
-            user_id_to_names[committer_id].add(committer_name)
-
-            # Exclude GitHub commits from calculations
-            if "GitHub" in author_name:
-                continue
-
-            # Calculate points for the author
-            if author_id not in points:
-                points[author_id] = 0
-            points[author_id] += author_points
-
-            # Exclude GitHub commits from calculations
-            if "GitHub" in committer_name:
-                continue
+        rows = [{field: row.get(header) for header, field in COMMIT_CSV_COLUMNS} for row in csv.DictReader(file)]
 
-            # Calculate points for the committer, excluding GitHub
-            if committer_id not in points:
-                points[committer_id] = 0
-            points[committer_id] += committer_points
+    # Score every commit with the rule set, crediting both its author and its committer
+    points, user_id_to_names = aggregate_points(table_from_rows(rows), rule_set)
 
     # Generate the distribution pie chart
     labels = [f"{', '.join(user_id_to_names[user_id])} ({user_id})" for user_id in points.keys()]
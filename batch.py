@@ -0,0 +1,119 @@
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import progress
+from github_api import iter_pages
+from request_scheduler import DEFAULT_MAX_IN_FLIGHT, scheduler
+from scoring import merge_totals, split_rows
+
+# Names of batch outputs: an organization login or a generated name
+BATCH_NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+# File in a batch's output directory holding the combined and per-repository splits
+BATCH_FILE_NAME = 'split.json'
+
+# Function to list the repositories of an organization
+def list_organization_repositories(session, api_url: str, organization: str, cache=None) -> List[Tuple[str, str]]:
+    """
+    Lists the organization's own repositories (no forks) page by page.
+
+    Returns:
+        list: The (owner, repo) pair of every repository.
+    """
+    repositories = []
+    for page in iter_pages(session, f'{api_url}/orgs/{organization}/repos', {'type': 'sources'}, cache):
+        repositories.extend((repository['owner']['login'], repository['name']) for repository in page)
+    return repositories
+
+# Function to parse repositories given as GitHub URLs or owner/repo names
+def parse_repositories(text: str) -> List[Tuple[str, str]]:
+    """
+    Accepts repositories separated by whitespace or commas.
+
+    Returns:
+        list: The distinct (owner, repo) pairs, in the order given.
+    """
+    repositories = []
+    for entry in re.split(r'[\s,]+', text.strip()):
+        if not entry:
+            continue
+        path = urlparse(entry).path if '://' in entry else entry
+        path_parts = path.strip('/').split('/')
+        if len(path_parts) != 2 or not all(path_parts):
+            raise ValueError(f'Invalid GitHub repository: {entry}')
+        owner, repo = path_parts
+        repositories.append((owner, repo[:-4] if repo.endswith('.git') else repo))
+    return list(dict.fromkeys(repositories))
+
+# Function to share the request budget of the process among the batch workers
+def _init_worker(max_in_flight: int):
+    scheduler.set_max_in_flight(max_in_flight)
+
+# Function to analyze many repositories in parallel and merge their splits
+def analyze_repositories(repositories: List[Tuple[str, str]], analyze: Callable, workers: Optional[int] = None, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT) -> dict:
+    """
+    Runs analyze(owner, repo) in a pool of worker processes, one repository at a
+    time per worker, and merges the per-contributor totals it returns by user ID.
+
+    The pool has one process per core (or per repository, if there are fewer),
+    so scoring and rendering run in parallel, and the cap on GitHub requests in
+    flight is divided among the workers so that together they keep to it.
+    analyze must be a module-level function returning (points, user_id_to_names).
+    Workers are started with spawn, as forking a threaded web server is unsafe.
+
+    Returns:
+        dict: The combined split and, per repository, its own split or the error it failed with.
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(repositories)))
+    progress.report('repositories', total=len(repositories))
+    per_repository: Dict[str, dict] = {}
+    totals = []
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(max(1, max_in_flight // workers),)) as executor:
+        futures = {executor.submit(analyze, owner, repo): f'{owner}/{repo}' for owner, repo in repositories}
+        for future in as_completed(futures):
+            name = futures[future]
+            progress.report('repository', name=name)
+            try:
+                points, user_id_to_names = future.result()
+            except Exception as error:
+                per_repository[name] = {'error': str(error)}
+                continue
+            totals.append((points, user_id_to_names))
+            per_repository[name] = {'total_points': sum(points.values()), 'split': split_rows(points, user_id_to_names)}
+
+    points, user_id_to_names = merge_totals(totals)
+    return {
+        'total_points': sum(points.values()),
+        'split': split_rows(points, user_id_to_names),
+        'repositories': {name: per_repository[name] for name in sorted(per_repository)},
+    }
+
+# Function to read the summary of the last completed batch
+def read_batch_summary(output_dir: str) -> Optional[dict]:
+    """
+    Returns:
+        dict: The summary written by write_batch_summary, or None if there is none.
+    """
+    try:
+        with open(os.path.join(output_dir, BATCH_FILE_NAME), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+# Function to store the summary of a batch
+def write_batch_summary(output_dir: str, summary: dict):
+    """
+    Writes the summary atomically, like the result marker of a single repository.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summary_file = os.path.join(output_dir, BATCH_FILE_NAME)
+    temp_file = f'{summary_file}.{os.getpid()}.tmp'
+    with open(temp_file, 'w') as file:
+        json.dump(summary, file)
+    os.replace(temp_file, summary_file)
@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+from fake_github import FakeGitHub
+
+# Commit counts benchmarked by default, from a small project to a very large one
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+
+# Repository every scenario analyses on the stand-in API
+OWNER = 'bench'
+REPO = 'devpie'
+
+# Wall time a scenario may grow by against a baseline before it counts as a regression
+DEFAULT_TOLERANCE = 0.2
+
+# Function to run one scenario against a stand-in API in a fresh process
+def run_scenario(commits: int, args) -> dict:
+    """
+    Starts a FakeGitHub server, then runs the analysis in a child process with
+    its own working directory, HOME (with a GitHub CLI config holding a dummy
+    token) and DEVPIE_API_URL, so nothing is shared between scenarios and the
+    peak memory is that of one analysis.
+
+    Returns:
+        dict: The timings, requests, peak memory and render time of each step.
+    """
+    api = FakeGitHub(commits, args.latency, args.jitter, args.rate_limit, args.rate_window, files_per_commit=args.files_per_commit)
+    api_url = api.start()
+    try:
+        with tempfile.TemporaryDirectory(prefix='devpie-bench-') as workdir:
+            config_dir = os.path.join(workdir, 'home', '.config', 'gh')
+            os.makedirs(config_dir)
+            with open(os.path.join(config_dir, 'hosts.yml'), 'w') as file:
+                file.write('github.com:\n  oauth_token: benchmark\n')
+            env = {**os.environ, 'HOME': os.path.join(workdir, 'home'), 'DEVPIE_API_URL': api_url, 'DEVPIE_BACKEND': args.backend,
+                   'DEVPIE_CONCURRENCY': str(args.concurrency), 'DEVPIE_GITHUB_TOKENS': '', 'PYTHONPATH': os.path.dirname(os.path.abspath(__file__))}
+            started = time.perf_counter()
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--steps', ','.join(args.steps)],
+                                   cwd=workdir, env=env, capture_output=True, text=True)
+            wall_time = time.perf_counter() - started
+            if child.returncode:
+                raise RuntimeError(f'Scenario with {commits} commits failed:\n{child.stderr}')
+    finally:
+        api.stop()
+
+    result = json.loads(child.stdout.strip().splitlines()[-1])
+    result.update(commits=commits, wall_time=round(wall_time, 3), requests=api.request_count(), requests_by_endpoint=dict(api.requests))
+    return result
+
+# Function to run the analysis steps inside the scenario process
+def run_steps(steps: List[str]) -> dict:
+    """
+    Times the steps of process_repository one by one through the pipeline, then
+    the Flask flow: submitting the repository, waiting for the job and loading
+    the results page and split API. Requests per step are read from the
+    GitHub request counter of the metrics registry.
+
+    Returns:
+        dict: Per step its seconds and requests, plus peak memory and chart render time.
+    """
+    import pipeline
+    from commit_cache import CACHE_FILE_NAME, CommitCache
+    from metrics import registry
+
+    base_url = f'{pipeline.api_url}/repos/{OWNER}/{REPO}'
+    headers = pipeline.github_headers()
+    output_dir = f'{OWNER}_{REPO}'
+    os.makedirs(output_dir, exist_ok=True)
+
+    def request_count() -> int:
+        with registry.lock:
+            return int(sum(registry.values['devpie_github_requests_total'].values()))
+
+    results: Dict[str, dict] = {}
+    def timed(name: str, function, *args):
+        requests_before = request_count()
+        started = time.perf_counter()
+        value = function(*args)
+        results[name] = {'seconds': round(time.perf_counter() - started, 3), 'requests': request_count() - requests_before}
+        return value
+
+    cache = CommitCache(os.path.join(output_dir, CACHE_FILE_NAME), OWNER, REPO)
+    store_path = os.path.join(output_dir, f'{OWNER}_{REPO}_commits.store')
+    if 'fetch' in steps:
+        store_path = timed('fetch', pipeline.fetch_and_write_commits, OWNER, REPO, base_url, headers, output_dir, pipeline.concurrency, cache, False, pipeline.backend)
+    if 'score' in steps:
+        timed('score', pipeline.process_csv, store_path, output_dir, cache)
+        timed('timeline', pipeline.process_timeline, OWNER, REPO, output_dir)
+    if 'refetch' in steps:
+        # A second full run, answered from the commit cache and ETags
+        timed('refetch', pipeline.fetch_and_write_commits, OWNER, REPO, base_url, headers, output_dir, pipeline.concurrency, cache, False, pipeline.backend)
+    cache.close()
+
+    if 'flask' in steps:
+        import flask_app
+        client = flask_app.app.test_client()
+        def submit_and_wait():
+            response = client.post('/', data={'repo_url': f'https://github.com/{OWNER}/{REPO}'}, headers={'Accept': 'application/json'})
+            job_id = response.get_json()['job_id']
+            while job_id:
+                job = client.get(f'/jobs/{job_id}').get_json()
+                if job['status'] in ('done', 'failed'):
+                    if job['status'] == 'failed':
+                        raise RuntimeError(job['error'])
+                    break
+                time.sleep(0.05)
+            client.get(f'/results?owner={OWNER}&repo={REPO}').close()
+            client.get(f'/api/{OWNER}/{REPO}/split').close()
+        timed('flask', submit_and_wait)
+
+    with registry.lock:
+        render_seconds = sum(histogram[-1] for histogram in registry.histograms['devpie_chart_render_seconds'].values())
+    if pipeline.results.chart_pool:
+        pipeline.results.chart_pool.shutdown()
+    return {
+        'steps': results,
+        'render_seconds': round(render_seconds, 3),
+        # Peak resident memory of the analysis process, in MiB (ru_maxrss is in KiB on Linux)
+        'peak_memory_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+# Function to print scenario results as a table
+def print_table(results: List[dict], steps: List[str]):
+    step_names = [name for name in ['fetch', 'score', 'timeline', 'refetch', 'flask'] if any(name in result['steps'] for result in results)]
+    header = f"{'commits':>8} {'wall s':>8} {'requests':>9} {'peak MiB':>9} {'render s':>9} " + ' '.join(f'{name + " s":>10}' for name in step_names)
+    print(header)
+    for result in results:
+        step_times = ' '.join(f"{result['steps'][name]['seconds']:>10.2f}" if name in result['steps'] else f"{'-':>10}" for name in step_names)
+        print(f"{result['commits']:>8} {result['wall_time']:>8.2f} {result['requests']:>9} {result['peak_memory_mb']:>9.1f} {result['render_seconds']:>9.2f} {step_times}")
+
+# Function to compare results with a baseline run
+def find_regressions(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """
+    Returns:
+        list: A description of every step of a scenario that got slower than the baseline by more than the tolerance.
+    """
+    previous = {result['commits']: result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(result['commits'])
+        if not before:
+            continue
+        for name, step in result['steps'].items():
+            old = before['steps'].get(name)
+            if old and step['seconds'] > old['seconds'] * (1 + tolerance) and step['seconds'] - old['seconds'] > 0.05:
+                regressions.append(f"{result['commits']} commits, {name}: {old['seconds']:.2f}s -> {step['seconds']:.2f}s")
+    return regressions
+
+# Function to run the benchmark suite from the command line
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark DevPie against a local stand-in GitHub API.')
+    parser.add_argument('--commits', type=int, nargs='+', default=DEFAULT_SIZES, help='commit counts of the scenarios')
+    parser.add_argument('--steps', type=lambda value: value.split(','), default=['fetch', 'score', 'refetch', 'flask'],
+                        help='comma-separated steps: fetch, score (with timeline), refetch, flask')
+    parser.add_argument('--backend', default='rest', choices=['rest', 'graphql'])
+    parser.add_argument('--concurrency', type=int, default=8, help='commit detail requests in flight')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every API response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra seconds per response')
+    parser.add_argument('--files-per-commit', type=int, default=3)
+    parser.add_argument('--rate-limit', type=int, default=1000000, help='requests per token and window')
+    parser.add_argument('--rate-window', type=float, default=3600, help='seconds until a token budget resets')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='allowed slowdown against the baseline, e.g. 0.2 for 20%%')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_steps(args.steps)))
+        return 0
+
+    results = []
+    for commits in args.commits:
+        print(f'Running {commits} commits...', file=sys.stderr)
+        results.append(run_scenario(commits, args))
+    print_table(results, args.steps)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = find_regressions(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from concurrent.futures import Executor
+from typing import BinaryIO, Dict, List, Optional, Union
+import numpy as np # type: ignore
+from metrics import registry
+
+# Number of processes that draw charts for the web app
+DEFAULT_RENDER_WORKERS = 2
+
+# Suffix of the file next to each chart holding the hash of the data it was drawn from
+DIGEST_SUFFIX = '.sha256'
+
+# Function to describe a pie chart as plain data
+def pie_chart(labels: List[str], values: List[float], title: str) -> dict:
+    return {'kind': 'pie', 'labels': list(labels), 'values': list(values), 'title': title}
+
+# Function to describe a labelled bar chart as plain data
+def bar_chart(labels: List[str], values: List[float], title: str, ylabel: str, xlabel: Optional[str] = None) -> dict:
+    return {'kind': 'bar', 'labels': list(labels), 'values': list(values), 'title': title, 'ylabel': ylabel, 'xlabel': xlabel}
+
+# Function to describe a line chart over dates as plain data
+def line_chart(dates: List[str], series: Dict[str, List[float]], title: str, ylabel: str) -> dict:
+    return {'kind': 'line', 'dates': list(dates), 'series': {label: list(values) for label, values in series.items()}, 'title': title, 'ylabel': ylabel}
+
+# Function to hash the data a chart is drawn from
+def chart_digest(spec: dict) -> str:
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+# Function to read the data hash of a rendered chart
+def read_digest(image_path: str) -> Optional[str]:
+    """
+    Returns:
+        str: The hash stored next to the image, or None if it has not been rendered.
+    """
+    try:
+        with open(image_path + DIGEST_SUFFIX, 'r') as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+# Function to draw a chart to a PNG file with the Agg backend
+def draw_chart(spec: dict, output_file: Union[str, BinaryIO]):
+    """
+    Draws a chart with the object-oriented Figure API. No pyplot state is
+    involved, so this is safe to run in worker processes and threads.
+    """
+    import matplotlib # type: ignore
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure # type: ignore
+
+    figure = Figure(figsize=(10, 5))
+    axes = figure.subplots()
+    if spec['kind'] == 'pie':
+        axes.pie(spec['values'], labels=spec['labels'], autopct='%1.1f%%', startangle=140)
+        axes.set_title(spec['title'], loc='left')
+        axes.axis('equal')
+    elif spec['kind'] == 'line':
+        dates = np.array(spec['dates'], dtype='datetime64[s]')
+        for label, values in spec['series'].items():
+            axes.plot(dates, values, label=label)
+        axes.set_ylabel(spec['ylabel'])
+        axes.set_title(spec['title'], loc='left')
+        axes.legend(loc='upper left', fontsize='small')
+        figure.autofmt_xdate()
+    else:
+        bars = axes.bar(spec['labels'], spec['values'])
+        if spec.get('xlabel'):
+            axes.set_xlabel(spec['xlabel'])
+        axes.set_ylabel(spec['ylabel'])
+        axes.set_title(spec['title'])
+        axes.tick_params(axis='x', labelrotation=0)
+
+        # Label the bars with their values
+        for bar, value in zip(bars, spec['values']):
+            axes.text(bar.get_x() + bar.get_width() / 2, bar.get_height(), str(value), ha='center', va='bottom')
+
+    figure.savefig(output_file, format='png')
+
+# Function to draw a chart to PNG bytes
+def draw_chart_png(spec: dict) -> bytes:
+    buffer = io.BytesIO()
+    draw_chart(spec, buffer)
+    return buffer.getvalue()
+
+# Function to name a temporary file next to a file it will replace
+def temporary_path(path: str) -> str:
+    """
+    The name includes the process and thread, so renders of the same chart
+    running at the same time do not write to each other's files.
+
+    Returns:
+        str: The path of the temporary file.
+    """
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+# Function to render a chart unless the same data has already been rendered
+def render_chart(spec: dict, output_file: str, executor: Optional[Executor] = None) -> str:
+    """
+    Renders the chart to output_file, in the executor if one is given. The hash
+    of the chart data is stored next to the image, and an image whose hash
+    matches is left as it is, so unchanged results are never drawn twice.
+
+    Returns:
+        str: The hash of the chart data, usable as the image's ETag.
+    """
+    digest = chart_digest(spec)
+    if os.path.exists(output_file) and read_digest(output_file) == digest:
+        registry.increment('devpie_charts_total', kind=spec['kind'], result='unchanged')
+        return digest
+
+    image_file, digest_file = temporary_path(output_file), temporary_path(output_file + DIGEST_SUFFIX)
+    try:
+        with registry.timer('devpie_chart_render_seconds', kind=spec['kind']):
+            if executor:
+                executor.submit(draw_chart, spec, image_file).result()
+            else:
+                draw_chart(spec, image_file)
+        with open(digest_file, 'w') as file:
+            file.write(digest)
+
+        # Both files are complete before either is swapped in. The old hash is
+        # dropped first, so it never vouches for an image it was not drawn from;
+        # until the new one lands the chart just counts as not rendered.
+        try:
+            os.remove(output_file + DIGEST_SUFFIX)
+        except FileNotFoundError:
+            pass
+        os.replace(image_file, output_file)
+        os.replace(digest_file, output_file + DIGEST_SUFFIX)
+    finally:
+        for temporary_file in (image_file, digest_file):
+            if os.path.exists(temporary_file):
+                os.remove(temporary_file)
+    registry.increment('devpie_charts_total', kind=spec['kind'], result='drawn')
+    return digest
+
+# Function to render a chart in memory, for charts that are not kept on disk
+def render_chart_png(spec: dict, executor: Optional[Executor] = None) -> bytes:
+    """
+    Renders the chart in the executor if one is given, like render_chart, but
+    returns the image instead of writing it next to the results.
+
+    Returns:
+        bytes: The PNG image.
+    """
+    with registry.timer('devpie_chart_render_seconds', kind=spec['kind']):
+        if executor:
+            png = executor.submit(draw_chart_png, spec).result()
+        else:
+            png = draw_chart_png(spec)
+    registry.increment('devpie_charts_total', kind=spec['kind'], result='drawn')
+    return png
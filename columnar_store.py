@@ -0,0 +1,346 @@
+import csv
+import json
+import os
+import re
+import shutil
+from typing import Dict, Iterator, List, Optional
+import numpy as np # type: ignore
+from metrics import registry
+
+# Column types of a store
+INT64 = 'int64'
+BOOL = 'bool'
+# Low-cardinality strings (names, IDs), stored as int32 codes into the store's string table
+DICT = 'dict'
+# Free-form strings (SHAs, dates, messages), stored as UTF-8 bytes with an array of end offsets
+TEXT = 'text'
+
+FIXED_DTYPES = {INT64: np.int64, BOOL: np.bool_}
+
+COMMIT_SCHEMA = {
+    'sha': TEXT,
+    'author': DICT,
+    'author_id': DICT,
+    'committer': DICT,
+    'committer_id': DICT,
+    'date': TEXT,
+    'message': TEXT,
+    'lines_added': INT64,
+    'lines_deleted': INT64,
+    'verified': BOOL,
+    'points': INT64,
+}
+
+# Per-file line counts of the commits in a commit store, in commit row order
+FILE_SCHEMA = {
+    'commit_row': INT64,
+    'path': DICT,
+    'additions': INT64,
+    'deletions': INT64,
+}
+
+# Directory inside a commit store holding its file store, so clearing the commits clears their files
+FILES_STORE_NAME = 'files'
+
+CONTRIBUTOR_SCHEMA = {
+    'login': TEXT,
+    'id': INT64,
+    'contributions': INT64,
+}
+
+# CSV export headers for each store column, matching the files DevPie used to write
+COMMIT_CSV_COLUMNS = [
+    ('SHA', 'sha'), ('Author', 'author'), ('Author ID', 'author_id'), ('Committer', 'committer'),
+    ('Committer ID', 'committer_id'), ('Date', 'date'), ('Message', 'message'), ('Lines Added', 'lines_added'),
+    ('Lines Deleted', 'lines_deleted'), ('Verified', 'verified'), ('Points', 'points'),
+]
+CONTRIBUTOR_CSV_COLUMNS = [('Login', 'login'), ('ID', 'id'), ('Contributions', 'contributions')]
+
+# Variable-width string dtype used when string columns are materialized
+STRING_DTYPE = np.dtypes.StringDType()
+
+META_FILE_NAME = 'meta.json'
+
+# Number of rows buffered by writers before they are appended to a store
+APPEND_BATCH_SIZE = 1000
+
+class DictColumn:
+    """
+    A dictionary-encoded string column: one code per row into a table of distinct values.
+    """
+
+    def __init__(self, codes: np.ndarray, values: np.ndarray):
+        self.codes = codes
+        self.values = values
+
+    def __len__(self):
+        return len(self.codes)
+
+    def materialize(self) -> np.ndarray:
+        return self.values[self.codes]
+
+    def slice(self, begin: int, end: int) -> 'DictColumn':
+        return DictColumn(self.codes[begin:end], self.values)
+
+    def contains_any(self, keywords: List[str]) -> np.ndarray:
+        # Match against the distinct values only, then map the result onto the rows
+        lowercase = np.strings.lower(self.values)
+        matches = np.zeros(len(self.values), dtype=bool)
+        for keyword in keywords:
+            matches |= np.strings.find(lowercase, keyword) >= 0
+        return matches[self.codes]
+
+class BlobColumn:
+    """
+    A free-form string column: the UTF-8 bytes of all rows back to back, and the end offset of each row.
+    """
+
+    def __init__(self, ends: np.ndarray, data: np.ndarray, start: int = 0):
+        self.ends = ends
+        self.data = data
+        self.start = start
+
+    def __len__(self):
+        return len(self.ends)
+
+    def value(self, row: int) -> str:
+        begin = self.ends[row - 1] if row else self.start
+        return self.data[begin - self.start:self.ends[row] - self.start].tobytes().decode('utf-8')
+
+    def materialize(self) -> np.ndarray:
+        return np.array([self.value(row) for row in range(len(self))], dtype=STRING_DTYPE)
+
+    def slice(self, begin: int, end: int) -> 'BlobColumn':
+        first = int(self.ends[begin - 1]) if begin else self.start
+        last = int(self.ends[end - 1]) if end > begin else first
+        return BlobColumn(self.ends[begin:end], self.data[first - self.start:last - self.start], first)
+
+    def contains_any(self, keywords: List[str]) -> np.ndarray:
+        """
+        Searches the raw bytes for ASCII-lowercased keywords and maps each hit to its row
+        with a binary search over the end offsets. Hits that run past the end of their
+        row span two messages and are ignored.
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        if not len(self):
+            return mask
+        blob = self.data.tobytes().lower()
+        ends = self.ends - self.start
+        for keyword in keywords:
+            needle = keyword.encode('utf-8')
+            positions = np.array([match.start() for match in re.finditer(re.escape(needle), blob)], dtype=np.int64)
+            if not len(positions):
+                continue
+            rows = np.searchsorted(ends, positions, side='right')
+            inside = positions + len(needle) <= ends[np.minimum(rows, len(ends) - 1)]
+            mask[rows[inside & (rows < len(ends))]] = True
+        return mask
+
+class ColumnarStore:
+    """
+    Append-only, typed column files for one table, readable through memory maps.
+
+    Every column is its own file, so a reader only touches the columns it needs,
+    and numeric columns are mapped straight into numpy arrays without parsing.
+    Strings that repeat (names, IDs) share one string table per store. The row
+    count in meta.json is only advanced after a batch has been written
+    completely; bytes past it (e.g. from an interrupted write) are cut off
+    before the next append.
+    """
+
+    def __init__(self, path: str, schema: Dict[str, str]):
+        self.path = path
+        self.schema = schema
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META_FILE_NAME)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            self.rows = meta['rows']
+            self.string_count = meta['strings']
+        else:
+            self.rows = 0
+            self.string_count = 0
+        self._string_codes: Optional[Dict[str, int]] = None
+        self._values: Optional[np.ndarray] = None
+
+    # Paths of the column files
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _map(self, name: str, dtype, count: int) -> np.ndarray:
+        if not count:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode='r', shape=(count,))
+
+    def _write_meta(self):
+        meta_path = os.path.join(self.path, META_FILE_NAME)
+        with open(f'{meta_path}.tmp', 'w') as file:
+            json.dump({'schema': self.schema, 'rows': self.rows, 'strings': self.string_count}, file)
+        os.replace(f'{meta_path}.tmp', meta_path)
+
+    def _string_ends(self) -> np.ndarray:
+        return self._map('strings.ends', np.int64, self.string_count)
+
+    def string_values(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: The string table, indexed by the codes of the DICT columns.
+        """
+        if self._values is None or len(self._values) != self.string_count:
+            column = BlobColumn(self._string_ends(), self._map('strings.data', np.uint8, int(self._string_ends()[-1]) if self.string_count else 0))
+            self._values = column.materialize()
+        return self._values
+
+    def column(self, name: str, start: int = 0):
+        """
+        Returns the rows from `start` on of one column: a read-only numpy array for
+        numeric columns, a DictColumn or a BlobColumn for strings.
+        """
+        column_type = self.schema[name]
+        if column_type in FIXED_DTYPES:
+            return self._map(f'{name}.bin', FIXED_DTYPES[column_type], self.rows)[start:]
+        if column_type == DICT:
+            return DictColumn(self._map(f'{name}.codes', np.int32, self.rows)[start:], self.string_values())
+        ends = self._map(f'{name}.ends', np.int64, self.rows)
+        begin = int(ends[start - 1]) if start else 0
+        end = int(ends[-1]) if self.rows else 0
+        data = self._map(f'{name}.data', np.uint8, end)[begin:]
+        return BlobColumn(ends[start:], data, begin)
+
+    def _truncate_to_meta(self):
+        # Cut off anything written after the last completed append
+        string_bytes = int(self._string_ends()[-1]) if self.string_count else 0
+        self._truncate('strings.ends', self.string_count * 8)
+        self._truncate('strings.data', string_bytes)
+        for name, column_type in self.schema.items():
+            if column_type in FIXED_DTYPES:
+                self._truncate(f'{name}.bin', self.rows * np.dtype(FIXED_DTYPES[column_type]).itemsize)
+            elif column_type == DICT:
+                self._truncate(f'{name}.codes', self.rows * 4)
+            else:
+                ends = self._map(f'{name}.ends', np.int64, self.rows)
+                self._truncate(f'{name}.ends', self.rows * 8)
+                self._truncate(f'{name}.data', int(ends[-1]) if self.rows else 0)
+
+    def _truncate(self, name: str, size: int):
+        with open(self._file(name), 'ab') as file:
+            file.truncate(size)
+
+    def append(self, rows: List[dict]):
+        """
+        Appends rows (dicts keyed by column name) to every column file.
+        """
+        if not rows:
+            return
+        with registry.timer('devpie_store_append_seconds'):
+            self._append(rows)
+        registry.increment('devpie_store_rows_written_total', len(rows))
+
+    def _append(self, rows: List[dict]):
+        self._truncate_to_meta()
+        if self._string_codes is None:
+            self._string_codes = {value: code for code, value in enumerate(self.string_values().tolist())}
+
+        new_strings: List[bytes] = []
+        def code_of(value) -> int:
+            value = '' if value is None else str(value)
+            if value not in self._string_codes:
+                self._string_codes[value] = len(self._string_codes)
+                new_strings.append(value.encode('utf-8'))
+            return self._string_codes[value]
+
+        for name, column_type in self.schema.items():
+            values = [row.get(name) for row in rows]
+            if column_type in FIXED_DTYPES:
+                array = np.array([value or 0 for value in values], dtype=FIXED_DTYPES[column_type])
+                with open(self._file(f'{name}.bin'), 'ab') as file:
+                    file.write(array.tobytes())
+            elif column_type == DICT:
+                with open(self._file(f'{name}.codes'), 'ab') as file:
+                    file.write(np.array([code_of(value) for value in values], dtype=np.int32).tobytes())
+            else:
+                ends = self._map(f'{name}.ends', np.int64, self.rows)
+                self._append_blob(name, [('' if value is None else str(value)).encode('utf-8') for value in values], int(ends[-1]) if self.rows else 0)
+
+        string_bytes = int(self._string_ends()[-1]) if self.string_count else 0
+        self._append_blob('strings', new_strings, string_bytes)
+        self.rows += len(rows)
+        self.string_count += len(new_strings)
+        self._write_meta()
+
+    def _append_blob(self, name: str, encoded: List[bytes], offset: int):
+        ends = offset + np.cumsum([len(value) for value in encoded], dtype=np.int64)
+        with open(self._file(f'{name}.data'), 'ab') as file:
+            file.write(b''.join(encoded))
+        with open(self._file(f'{name}.ends'), 'ab') as file:
+            file.write(ends.astype(np.int64).tobytes())
+
+    def clear(self):
+        """
+        Removes all rows, e.g. before a full refetch.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        self.rows = 0
+        self.string_count = 0
+        self._string_codes = None
+        self._values = None
+        self._write_meta()
+
+    def version(self) -> str:
+        """
+        Every append and clear rewrites meta.json, so its row count and
+        modification time tell whether data derived from the store is stale
+        without reading any column.
+
+        Returns:
+            str: A stamp of the store's current contents.
+        """
+        return f'{self.rows}:{os.stat(os.path.join(self.path, META_FILE_NAME)).st_mtime_ns}'
+
+    def iter_chunks(self, columns: List[str], start: int = 0, chunk_size: int = 10000) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Yields the given columns decoded into arrays, one chunk of rows at a time.
+        The columns are mapped once up front, so rows appended or a store cleared
+        by a refetch while a slow reader is still going do not change what it reads.
+        """
+        mapped = {name: self.column(name, start) for name in columns}
+        rows = self.rows - start
+        for chunk_start in range(0, rows, chunk_size):
+            chunk_end = min(rows, chunk_start + chunk_size)
+            yield {name: column.slice(chunk_start, chunk_end).materialize() if isinstance(column, (DictColumn, BlobColumn)) else np.asarray(column[chunk_start:chunk_end])
+                   for name, column in mapped.items()}
+
+    def iter_rows(self, columns: List[str], start: int = 0, chunk_size: int = 10000) -> Iterator[list]:
+        """
+        Yields the values of the given columns row by row, decoding one chunk at a time.
+        """
+        for chunk in self.iter_chunks(columns, start, chunk_size):
+            yield from (list(row) for row in zip(*(chunk[name].tolist() for name in columns)))
+
+# Function to open the columnar commit store of a repository
+def open_commit_store(path: str) -> ColumnarStore:
+    return ColumnarStore(path, COMMIT_SCHEMA)
+
+# Function to open the file store kept inside a commit store
+def open_file_store(commit_store_path: str) -> ColumnarStore:
+    return ColumnarStore(os.path.join(commit_store_path, FILES_STORE_NAME), FILE_SCHEMA)
+
+# Function to open the columnar contributor store of a repository
+def open_contributor_store(path: str) -> ColumnarStore:
+    return ColumnarStore(path, CONTRIBUTOR_SCHEMA)
+
+# Function to export a store as CSV
+def export_csv(store: ColumnarStore, csv_file_name: str, csv_columns) -> str:
+    """
+    Writes the store to a CSV file with the given (header, column) pairs.
+
+    Returns:
+        str: The name of the CSV file.
+    """
+    with open(csv_file_name, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow([header for header, _ in csv_columns])
+        writer.writerows(store.iter_rows([column for _, column in csv_columns]))
+    return csv_file_name
@@ -0,0 +1,29 @@
+from git_backend import iter_git_commits
+from github_api import iter_commits_with_details, iter_graphql_commits
+
+# Sources of (commit, commit_details) pairs that fetch_and_write_commits can read from.
+# Every backend takes (session, base_url, concurrency, params, cache) plus its own
+# keyword options (e.g. repo_path for 'git') and yields payloads shaped like the
+# REST /commits and /commits/{sha} responses.
+COMMIT_BACKENDS = {
+    'rest': iter_commits_with_details,
+    'graphql': iter_graphql_commits,
+    'git': iter_git_commits,
+}
+
+# Backend used when none is configured
+DEFAULT_BACKEND = 'rest'
+
+# Backends whose commit details carry no per-file line counts
+BACKENDS_WITHOUT_FILES = {'graphql'}
+
+# Function to check that a backend fetches everything a rule set scores
+def check_backend(backend: str, rule_set):
+    """
+    Path rules weigh the lines of each file, so a rule set that has them would
+    silently score commits fetched without files as if it had none. Such a
+    combination fails with a ValueError before anything is fetched.
+    """
+    if backend in BACKENDS_WITHOUT_FILES and rule_set.path_rules:
+        raise ValueError(f"Rule set '{rule_set.name}' weighs lines by path, but the '{backend}' backend does not fetch "
+                         f"per-file line counts; use the 'rest' or 'git' backend")
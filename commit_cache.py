@@ -0,0 +1,239 @@
+import json
+import sqlite3
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+# Name of the cache database created inside each repository's output directory
+CACHE_FILE_NAME = 'cache.sqlite3'
+
+class CommitCache:
+    """
+    On-disk SQLite store for GitHub data that can be reused between analyses.
+
+    Commit details never change once a SHA exists, so their stats, per-file
+    line counts, verification status and author/committer identities are kept
+    per (owner, repo, sha) and never requested again. Pages of list endpoints
+    are kept together with their ETag so they can be revalidated with
+    If-None-Match instead of re-downloaded.
+    For incremental refreshes it also records the newest commit processed and
+    the running per-contributor point totals.
+    """
+
+    def __init__(self, path: str, owner: str, repo: str):
+        self.owner = owner
+        self.repo = repo
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS commit_details (
+                owner TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                sha TEXT NOT NULL,
+                additions INTEGER NOT NULL,
+                deletions INTEGER NOT NULL,
+                verified INTEGER NOT NULL,
+                author_id INTEGER,
+                author_login TEXT,
+                committer_id INTEGER,
+                committer_login TEXT,
+                files_recorded INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (owner, repo, sha)
+            );
+            CREATE TABLE IF NOT EXISTS commit_files (
+                owner TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                sha TEXT NOT NULL,
+                path TEXT NOT NULL,
+                additions INTEGER NOT NULL,
+                deletions INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS commit_files_sha ON commit_files (owner, repo, sha);
+            CREATE TABLE IF NOT EXISTS etags (
+                url TEXT PRIMARY KEY,
+                etag TEXT NOT NULL,
+                body TEXT NOT NULL,
+                next_url TEXT
+            );
+            CREATE TABLE IF NOT EXISTS refresh_state (
+                owner TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                newest_sha TEXT NOT NULL,
+                newest_date TEXT NOT NULL,
+                PRIMARY KEY (owner, repo)
+            );
+            CREATE TABLE IF NOT EXISTS contributor_totals (
+                owner TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                names TEXT NOT NULL,
+                points INTEGER NOT NULL,
+                PRIMARY KEY (owner, repo, user_id)
+            );
+            CREATE TABLE IF NOT EXISTS totals_position (
+                owner TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                row_count INTEGER NOT NULL,
+                PRIMARY KEY (owner, repo)
+            );
+            CREATE TABLE IF NOT EXISTS totals_rule_set (
+                owner TEXT NOT NULL,
+                repo TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                PRIMARY KEY (owner, repo)
+            );
+        """)
+        # Caches created before per-file stats were kept lack the column that marks them
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(commit_details)')]
+        if 'files_recorded' not in columns:
+            with self.connection:
+                self.connection.execute('ALTER TABLE commit_details ADD COLUMN files_recorded INTEGER NOT NULL DEFAULT 0')
+
+    def get_details(self, shas: Iterable[str], require_files: bool = False) -> Dict[str, dict]:
+        """
+        Looks up cached commit details for the given SHAs. Details whose per-file
+        stats were recorded include them under 'files'; with require_files, only
+        those count as found.
+
+        Returns:
+            dict: A /commits/{sha}-shaped payload for every SHA found in the cache.
+        """
+        shas = list(shas)
+        found = {}
+        if not shas:
+            return found
+        placeholders = ", ".join("?" * len(shas))
+        rows = self.connection.execute(
+            'SELECT sha, additions, deletions, verified, author_id, author_login, committer_id, committer_login, files_recorded '
+            f'FROM commit_details WHERE owner = ? AND repo = ? AND sha IN ({placeholders})',
+            (self.owner, self.repo, *shas),
+        )
+        for sha, additions, deletions, verified, author_id, author_login, committer_id, committer_login, files_recorded in rows:
+            if require_files and not files_recorded:
+                continue
+            found[sha] = {
+                'sha': sha,
+                'stats': {'additions': additions, 'deletions': deletions},
+                'commit': {'verification': {'verified': bool(verified)}},
+                'author': {'id': author_id, 'login': author_login} if author_id is not None else None,
+                'committer': {'id': committer_id, 'login': committer_login} if committer_id is not None else None,
+            }
+            if files_recorded:
+                found[sha]['files'] = []
+
+        with_files = [sha for sha, commit_details in found.items() if 'files' in commit_details]
+        if with_files:
+            files = self.connection.execute(
+                f'SELECT sha, path, additions, deletions FROM commit_files WHERE owner = ? AND repo = ? AND sha IN ({", ".join("?" * len(with_files))}) ORDER BY rowid',
+                (self.owner, self.repo, *with_files),
+            )
+            for sha, path, additions, deletions in files:
+                found[sha]['files'].append({'filename': path, 'additions': additions, 'deletions': deletions})
+        return found
+
+    def put_details(self, details: Iterable[dict]):
+        """
+        Stores the stats, verification status and identities of fetched commits,
+        and their per-file line counts when the payload lists files.
+        """
+        rows = []
+        file_rows = []
+        for commit_details in details:
+            stats = commit_details.get('stats', {})
+            verification = commit_details['commit'].get('verification', {})
+            author = commit_details.get('author') or {}
+            committer = commit_details.get('committer') or {}
+            rows.append((
+                self.owner, self.repo, commit_details['sha'],
+                stats.get('additions', 0), stats.get('deletions', 0), int(verification.get('verified', False)),
+                author.get('id'), author.get('login'), committer.get('id'), committer.get('login'), int('files' in commit_details),
+            ))
+            for file in commit_details.get('files') or []:
+                file_rows.append((self.owner, self.repo, commit_details['sha'], file['filename'], file.get('additions', 0), file.get('deletions', 0)))
+        with self.connection:
+            self.connection.executemany('DELETE FROM commit_files WHERE owner = ? AND repo = ? AND sha = ?', [row[:3] for row in rows if row[-1]])
+            self.connection.executemany('INSERT OR REPLACE INTO commit_details VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.connection.executemany('INSERT INTO commit_files VALUES (?, ?, ?, ?, ?, ?)', file_rows)
+
+    def get_page(self, url: str) -> Optional[Tuple[str, list, Optional[str]]]:
+        """
+        Returns the (etag, items, next_url) stored for a list page, if any.
+        """
+        row = self.connection.execute('SELECT etag, body, next_url FROM etags WHERE url = ?', (url,)).fetchone()
+        if row:
+            etag, body, next_url = row
+            return etag, json.loads(body), next_url
+        return None
+
+    def put_page(self, url: str, etag: str, items: list, next_url: Optional[str]):
+        """
+        Stores a list page together with the ETag it was served with.
+        """
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO etags VALUES (?, ?, ?, ?)', (url, etag, json.dumps(items), next_url))
+
+    def get_refresh_state(self) -> Optional[Tuple[str, str]]:
+        """
+        Returns the (sha, committer date) of the newest commit already processed, if any.
+        """
+        return self.connection.execute(
+            'SELECT newest_sha, newest_date FROM refresh_state WHERE owner = ? AND repo = ?', (self.owner, self.repo)
+        ).fetchone()
+
+    def set_refresh_state(self, newest_sha: str, newest_date: str):
+        """
+        Records the newest commit processed so the next run can stop at it.
+        """
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO refresh_state VALUES (?, ?, ?, ?)', (self.owner, self.repo, newest_sha, newest_date))
+
+    def get_totals(self, fingerprint: str = '') -> Tuple[int, Dict[str, int], Dict[str, Set[str]]]:
+        """
+        Returns the running per-contributor point totals. Totals computed with a
+        different rule set (fingerprint) are ignored, so they are rebuilt from scratch.
+
+        Returns:
+            tuple: The number of commit store rows the totals cover, the points per user ID
+            and the names seen for each user ID.
+        """
+        points: Dict[str, int] = {}
+        user_id_to_names: Dict[str, Set[str]] = {}
+        stored_fingerprint = self.connection.execute(
+            'SELECT fingerprint FROM totals_rule_set WHERE owner = ? AND repo = ?', (self.owner, self.repo)
+        ).fetchone()
+        if (stored_fingerprint[0] if stored_fingerprint else '') != fingerprint:
+            return 0, points, user_id_to_names
+
+        row = self.connection.execute(
+            'SELECT row_count FROM totals_position WHERE owner = ? AND repo = ?', (self.owner, self.repo)
+        ).fetchone()
+        rows = self.connection.execute(
+            'SELECT user_id, names, points FROM contributor_totals WHERE owner = ? AND repo = ?', (self.owner, self.repo)
+        )
+        for user_id, names, user_points in rows:
+            points[user_id] = user_points
+            user_id_to_names[user_id] = set(json.loads(names))
+        return (row[0] if row else 0), points, user_id_to_names
+
+    def put_totals(self, row_count: int, points: Dict[str, int], user_id_to_names: Dict[str, Set[str]], fingerprint: str = ''):
+        """
+        Replaces the running point totals, the number of commit store rows they cover and
+        the fingerprint of the rule set they were scored with.
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM contributor_totals WHERE owner = ? AND repo = ?', (self.owner, self.repo))
+            self.connection.executemany(
+                'INSERT INTO contributor_totals VALUES (?, ?, ?, ?, ?)',
+                [(self.owner, self.repo, user_id, json.dumps(sorted(user_id_to_names[user_id])), user_points) for user_id, user_points in points.items()],
+            )
+            self.connection.execute('INSERT OR REPLACE INTO totals_position VALUES (?, ?, ?)', (self.owner, self.repo, row_count))
+            self.connection.execute('INSERT OR REPLACE INTO totals_rule_set VALUES (?, ?, ?)', (self.owner, self.repo, fingerprint))
+
+    def reset_totals(self):
+        """
+        Discards the running point totals, e.g. after the commit store was rewritten.
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM contributor_totals WHERE owner = ? AND repo = ?', (self.owner, self.repo))
+            self.connection.execute('DELETE FROM totals_position WHERE owner = ? AND repo = ?', (self.owner, self.repo))
+            self.connection.execute('DELETE FROM totals_rule_set WHERE owner = ? AND repo = ?', (self.owner, self.repo))
+
+    def close(self):
+        self.connection.close()
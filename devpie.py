@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import sys
+from typing import List, Optional
+from urllib.parse import urlparse
+
+# The pipeline, numpy, requests and matplotlib are imported by the commands that
+# use them, so e.g. --help or a query on stored results does not load them all
+
+# Function to parse an owner/repo argument, or the URL of a repository
+def repository(value: str):
+    path = urlparse(value).path if '://' in value else value
+    path_parts = path.strip('/').split('/')
+    if len(path_parts) != 2 or not all(path_parts):
+        raise argparse.ArgumentTypeError(f'Invalid GitHub repository: {value}')
+    owner, repo = path_parts
+    return owner, repo[:-4] if repo.endswith('.git') else repo
+
+# Function to parse a --since or --until argument
+def date(value: str):
+    from timeline import parse_date
+    try:
+        return parse_date(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+# Function to check a --rule-set argument against rule_sets.yml
+def rule_set_name(value: str) -> str:
+    from scoring import load_rule_sets
+    if value not in load_rule_sets():
+        raise argparse.ArgumentTypeError(f'Unknown rule set: {value}')
+    return value
+
+# Function to parse a comma-separated --compare argument into rule set names
+def rule_set_names(value: str) -> List[str]:
+    names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    if not names:
+        raise argparse.ArgumentTypeError('Expected rule set names separated by commas')
+    for name in names:
+        rule_set_name(name)
+    return names
+
+# Function to load the scoring of stored results with the settings given on the command line
+def load_results(args):
+    """
+    The --rule-set option overrides DEVPIE_RULE_SET. Charts are drawn in this
+    process rather than in a pool of render workers, since a command draws a
+    handful at most. Unlike the pipeline, this does not load the HTTP client.
+
+    Returns:
+        module: The configured results module.
+    """
+    import results
+    from scoring import get_rule_set
+    if args.rule_set:
+        results.rule_set = get_rule_set(args.rule_set)
+    results.chart_pool = None
+    return results
+
+# Function to load the pipeline with the settings given on the command line
+def load_pipeline(args):
+    """
+    Command line options override the DEVPIE_* environment variables the
+    pipeline reads (see load_results for the scoring settings).
+
+    Returns:
+        module: The configured pipeline module.
+    """
+    load_results(args)
+    import pipeline
+    from commit_backends import check_backend
+    if getattr(args, 'backend', None):
+        pipeline.backend = args.backend
+    if getattr(args, 'concurrency', None):
+        pipeline.concurrency = args.concurrency
+    # Quick estimates do not fetch commits, so any backend will do
+    if not getattr(args, 'quick', False):
+        try:
+            check_backend(pipeline.backend, pipeline.results.rule_set)
+        except ValueError as error:
+            sys.exit(str(error))
+    return pipeline
+
+# Function to fail with a message when a repository has not been fetched yet
+def require_store(path: str, owner: str, repo: str):
+    if not os.path.exists(path):
+        sys.exit(f'No commits stored for {owner}/{repo}; run: devpie.py fetch {owner}/{repo}')
+
+# Function to fetch the commits, issues and contributors of a repository into its stores
+def fetch(args) -> int:
+    pipeline = load_pipeline(args)
+    from commit_cache import CACHE_FILE_NAME, CommitCache
+    from columnar_store import open_commit_store
+    from github_api import create_session
+    from issues import fetch_and_write_issues
+    from metrics import stage
+
+    owner, repo = args.repository
+    base_url = f'{pipeline.api_url}/repos/{owner}/{repo}'
+    headers = pipeline.github_headers()
+    output_dir = f'{owner}_{repo}'
+    os.makedirs(output_dir, exist_ok=True)
+
+    cache = CommitCache(os.path.join(output_dir, CACHE_FILE_NAME), owner, repo)
+    try:
+        with stage('commits'):
+            store_path = pipeline.fetch_and_write_commits(owner, repo, base_url, headers, output_dir, pipeline.concurrency, cache, args.incremental, pipeline.backend, pipeline.backend_options)
+        # Issues and pull requests are only needed when the rule set weighs commits by their labels
+        if pipeline.results.rule_set.label_multipliers:
+            with stage('issues'):
+                fetch_and_write_issues(create_session(headers), base_url, os.path.join(output_dir, f'{owner}_{repo}_issues.store'), cache)
+        with stage('contributors'):
+            pipeline.fetch_and_write_contributors(owner, repo, base_url, headers, output_dir, cache)
+    finally:
+        cache.close()
+    print(f'{open_commit_store(store_path).rows} commits stored in {store_path}')
+    return 0
+
+# Function to print the split of the points of a repository from its stores
+def score(args) -> int:
+    results = load_results(args)
+    from commit_cache import CACHE_FILE_NAME, CommitCache
+    from scoring import split_rows
+
+    owner, repo = args.repository
+    output_dir = f'{owner}_{repo}'
+    store_path = os.path.join(output_dir, f'{owner}_{repo}_commits.store')
+    require_store(store_path, owner, repo)
+
+    if args.compare:
+        return compare(results, args, owner, repo)
+
+    # With since and/or until, points come from the timeline and only cover that window
+    since, until = args.since, args.until
+    if since is not None or until is not None:
+        timeline = results.current_timeline(owner, repo)
+        points, user_id_to_names = timeline.points(since, until), timeline.names
+    else:
+        cache = CommitCache(os.path.join(output_dir, CACHE_FILE_NAME), owner, repo)
+        try:
+            points, user_id_to_names = results.update_totals(store_path, cache, issue_index=results.current_issue_index(owner, repo))
+        finally:
+            cache.close()
+
+    rows = split_rows(points, user_id_to_names)[:args.top or None]
+    if args.json:
+        print(json.dumps({'owner': owner, 'repo': repo, 'rule_set': results.rule_set.name, 'total_points': sum(points.values()), 'split': rows}, indent=2))
+        return 0
+    print(f"{'points':>10} {'share':>7}  contributor")
+    for row in rows:
+        print(f"{row['points']:>10} {row['percentage']:>6.1f}%  {', '.join(row['names'])} ({row['user_id']})")
+    return 0
+
+# Function to print the split of a repository under several rule sets side by side
+def compare(results, args, owner: str, repo: str) -> int:
+    if args.since is not None or args.until is not None:
+        sys.exit('--compare scores all stored commits; it cannot be combined with --since or --until')
+    rows = results.compare_split(owner, repo, args.compare)[:args.top or None]
+    if args.json:
+        print(json.dumps({'owner': owner, 'repo': repo, 'rule_sets': args.compare, 'split': rows}, indent=2))
+        return 0
+    widths = {name: max(len(name), 7) for name in args.compare}
+    print(' '.join(f'{name:>{widths[name]}}' for name in args.compare) + '  contributor')
+    for row in rows:
+        shares = ' '.join(f"{row['percentages'][name]:>{widths[name] - 1}.1f}%" for name in args.compare)
+        print(f"{shares}  {', '.join(row['names'])} ({row['user_id']})")
+    return 0
+
+# Function to draw the charts of a repository from its stores
+def render(args) -> int:
+    results = load_results(args)
+    from commit_cache import CACHE_FILE_NAME, CommitCache
+
+    owner, repo = args.repository
+    output_dir = f'{owner}_{repo}'
+    store_path = os.path.join(output_dir, f'{owner}_{repo}_commits.store')
+    require_store(store_path, owner, repo)
+
+    since, until = args.since, args.until
+    if since is not None or until is not None:
+        file_name, _ = results.render_window_chart(owner, repo, since, until)
+        print(os.path.join(output_dir, file_name))
+        return 0
+
+    cache = CommitCache(os.path.join(output_dir, CACHE_FILE_NAME), owner, repo)
+    try:
+        results.process_csv(store_path, output_dir, cache, results.current_issue_index(owner, repo))
+    finally:
+        cache.close()
+    results.process_timeline(owner, repo, output_dir)
+    contributors_store_path = os.path.join(output_dir, f'{owner}_{repo}_contributors.store')
+    if os.path.exists(contributors_store_path):
+        results.process_contributors_csv(contributors_store_path, output_dir, owner, repo)
+    print(output_dir)
+    return 0
+
+# Function to run the whole analysis of a repository, as the web app does
+def analyze(args) -> int:
+    pipeline = load_pipeline(args)
+    owner, repo = args.repository
+    pipeline.analyze_repository(owner, repo, args.incremental, args.quick)
+    print(f'{owner}_{repo}')
+    return 0
+
+# Function to run the command line tool
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='devpie', description='Split the contribution points of a GitHub repository among its contributors.')
+    parser.add_argument('--rule-set', type=rule_set_name, help='point policy from rule_sets.yml (default: DEVPIE_RULE_SET or the default rule set)')
+    parser.add_argument('--metrics', action='store_true', help='print the stage, request and cache metrics when done')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fetch_parser = commands.add_parser('fetch', help='fetch commits, issues and contributors into the stores, without scoring or charts')
+    analyze_parser = commands.add_parser('analyze', help='fetch, score and render unless the results are current for HEAD')
+    for command_parser in (fetch_parser, analyze_parser):
+        command_parser.add_argument('--incremental', action='store_true', help='only fetch commits newer than the last run')
+        command_parser.add_argument('--backend', choices=['rest', 'graphql', 'git'], help='source of commit data (default: DEVPIE_BACKEND or rest)')
+        command_parser.add_argument('--concurrency', type=int, help='commit detail requests in flight')
+    analyze_parser.add_argument('--quick', action='store_true', help='estimate the split from GitHub contributor statistics')
+
+    score_parser = commands.add_parser('score', help='print the split from the stored commits, without any API calls')
+    score_parser.add_argument('--top', type=int, help='only print the largest contributors')
+    score_parser.add_argument('--json', action='store_true', help='print the split as JSON')
+    score_parser.add_argument('--compare', type=rule_set_names, help='print the share of each contributor under these comma-separated rule sets side by side')
+    render_parser = commands.add_parser('render', help='draw the charts from the stored commits, without any API calls')
+    for command_parser in (score_parser, render_parser):
+        command_parser.add_argument('--since', type=date, help='only count commits from this date (YYYY-MM-DD or ISO 8601)')
+        command_parser.add_argument('--until', type=date, help='only count commits before this date')
+
+    for command_parser in (fetch_parser, analyze_parser, score_parser, render_parser):
+        command_parser.add_argument('repository', type=repository, help='owner/repo or a GitHub URL')
+    fetch_parser.set_defaults(run=fetch)
+    score_parser.set_defaults(run=score)
+    render_parser.set_defaults(run=render)
+    analyze_parser.set_defaults(run=analyze)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.run(args)
+    finally:
+        if args.metrics:
+            from metrics import registry
+            print(registry.summary(), file=sys.stderr)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import re
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np # type: ignore
+from columnar_store import COMMIT_CSV_COLUMNS, open_commit_store
+from scoring import RuleSet, load_commit_table
+
+# Export file names: the table, the format and an optional .gz for gzip compression
+EXPORT_FILE_PATTERN = re.compile(r'^(commits|scored|contributors)\.(csv|ndjson)(\.gz)?$')
+
+# Content type of each export format
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+# (CSV header, field) pairs of each export; NDJSON objects are keyed by field
+SCORED_COLUMNS = [
+    ('SHA', 'sha'), ('Author', 'author'), ('Author ID', 'author_id'), ('Committer', 'committer'), ('Committer ID', 'committer_id'),
+    ('Date', 'date'), ('Lines Added', 'lines_added'), ('Lines Deleted', 'lines_deleted'), ('Verified', 'verified'), ('Points', 'points'),
+]
+TOTAL_COLUMNS = [('User ID', 'user_id'), ('Names', 'names'), ('Points', 'points'), ('Percentage', 'percentage'), ('Contributions', 'contributions')]
+EXPORT_COLUMNS = {'commits': COMMIT_CSV_COLUMNS, 'scored': SCORED_COLUMNS, 'contributors': TOTAL_COLUMNS}
+
+# Commits read from the store, scored and encoded at a time
+EXPORT_CHUNK_ROWS = 2000
+
+# Function to parse an export file name
+def parse_export_name(file_name: str) -> Tuple[str, str, bool]:
+    """
+    E.g. commits.csv, scored.ndjson or contributors.csv.gz.
+
+    Returns:
+        tuple: The table, the format and whether to gzip the export.
+    """
+    match = EXPORT_FILE_PATTERN.match(file_name)
+    if not match:
+        raise ValueError(f'Unknown export: {file_name}')
+    return match.group(1), match.group(2), bool(match.group(3))
+
+# Function to select the commits of a chunk by date and contributor
+def commit_mask(chunk: Dict[str, np.ndarray], since: Optional[np.datetime64] = None, until: Optional[np.datetime64] = None, contributor: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    Keeps commits dated in [since, until) whose author or committer has the
+    contributor's user ID or name (case-insensitive).
+
+    Returns:
+        np.ndarray: The mask of the rows to keep, or None to keep them all.
+    """
+    mask = None
+    if since is not None or until is not None:
+        # GitHub dates end in Z; the first 19 characters are an ISO timestamp in UTC
+        dates = chunk['date'].astype('U19').astype('datetime64[s]')
+        mask = np.ones(len(dates), dtype=bool)
+        if since is not None:
+            mask &= dates >= since
+        if until is not None:
+            mask &= dates < until
+    if contributor:
+        name = contributor.lower()
+        matches = ((chunk['author_id'] == contributor) | (chunk['committer_id'] == contributor)
+                   | (np.strings.lower(chunk['author']) == name) | (np.strings.lower(chunk['committer']) == name))
+        mask = matches if mask is None else mask & matches
+    return mask
+
+# Function to stream the raw rows of a commit store
+def iter_commit_chunks(store_path: str, since=None, until=None, contributor=None) -> Iterator[Dict[str, np.ndarray]]:
+    store = open_commit_store(store_path)
+    for chunk in store.iter_chunks([field for _, field in COMMIT_CSV_COLUMNS], chunk_size=EXPORT_CHUNK_ROWS):
+        mask = commit_mask(chunk, since, until, contributor)
+        yield chunk if mask is None else {field: values[mask] for field, values in chunk.items()}
+
+# Function to stream the commits of a commit store with their points under a rule set
+def iter_scored_chunks(store_path: str, rule_set: RuleSet, issue_index=None, since=None, until=None, contributor=None) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Rescores the stored commits slice by slice, so commits fetched under
+    another rule set get the points of the current one and only one slice of
+    messages is decoded at a time.
+    """
+    table, rows = load_commit_table(store_path, issue_index=issue_index)
+    for start in range(0, rows, EXPORT_CHUNK_ROWS):
+        chunk_table = table.slice(start, min(rows, start + EXPORT_CHUNK_ROWS))
+        chunk = {field: chunk_table[field] for _, field in SCORED_COLUMNS if field != 'points'}
+        chunk['points'] = rule_set.score(chunk_table)
+        mask = commit_mask(chunk, since, until, contributor)
+        yield chunk if mask is None else {field: values[mask] for field, values in chunk.items()}
+
+# Function to select the contributor totals of one contributor
+def filter_totals(rows: List[dict], contributor: Optional[str] = None) -> List[dict]:
+    if not contributor:
+        return rows
+    name = contributor.lower()
+    return [row for row in rows if row['user_id'] == contributor or name in (row_name.lower() for row_name in row['names'])]
+
+# Function to encode chunks of columns as CSV
+def encode_csv(columns: List[Tuple[str, str]], chunks: Iterable[Dict[str, object]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in columns])
+    for chunk in chunks:
+        values = [chunk[field].tolist() if isinstance(chunk[field], np.ndarray) else chunk[field] for _, field in columns]
+        writer.writerows([', '.join(value) if isinstance(value, list) else value for value in row] for row in zip(*values))
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+# Function to encode chunks of columns as newline-delimited JSON
+def encode_ndjson(columns: List[Tuple[str, str]], chunks: Iterable[Dict[str, object]]) -> Iterator[bytes]:
+    fields = [field for _, field in columns]
+    for chunk in chunks:
+        values = [chunk[field].tolist() if isinstance(chunk[field], np.ndarray) else chunk[field] for field in fields]
+        yield ''.join(json.dumps(dict(zip(fields, row))) + '\n' for row in zip(*values)).encode('utf-8')
+
+# Function to gzip a stream of bytes as it is produced
+def gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+# Function to encode an export in the requested format
+def encode_export(export_format: str, columns: List[Tuple[str, str]], chunks: Iterable[Dict[str, object]], compress: bool = False) -> Iterator[bytes]:
+    """
+    Encodes chunk by chunk, so a response can stream an export of any size
+    without holding it in memory or writing it to disk first.
+
+    Returns:
+        iterator: The bytes of the export.
+    """
+    encoded = encode_csv(columns, chunks) if export_format == 'csv' else encode_ndjson(columns, chunks)
+    return gzip_stream(encoded) if compress else (chunk for chunk in encoded if chunk)
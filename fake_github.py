@@ -0,0 +1,423 @@
+import argparse
+import calendar
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+from metrics import endpoint_of
+from request_scheduler import resource_of
+from webhooks import SIGNATURE_HEADER, sign
+
+# Page sizes of the GitHub list endpoints: the default, the largest accepted, and files per commit page
+DEFAULT_PER_PAGE = 30
+MAX_PER_PAGE = 100
+FILES_PER_PAGE = 300
+
+# Synthetic commits are dated this far apart, ending at FIRST_COMMIT_AT + commits * COMMIT_INTERVAL
+FIRST_COMMIT_AT = 1672531200
+COMMIT_INTERVAL = 3600
+
+# Commit messages cycled through, so flat rules and multipliers match a share of the commits
+MESSAGES = ['Fix parser edge case', 'Add feature flag', 'Initial scaffolding', 'Refactor store', 'Update docs', 'feat: export API']
+
+# Every UNLINKED_EVERY-th commit is not linked to its author's account, as when the email is not on the profile
+UNLINKED_EVERY = 25
+
+# Paths cycled through, including generated files that path rules exclude
+PATHS = ['src/main.py', 'src/store.py', 'README.md', 'package-lock.json', 'dist/app.min.js', 'tests/test_store.py']
+
+class FakeGitHub:
+    """
+    A local stand-in for the parts of the GitHub API DevPie uses, for
+    benchmarks and offline runs.
+
+    Every repository served has the same synthetic history of `commits`
+    commits, generated from the commit position on each request, so even 100k
+    commits take no memory. It answers /commits, /commits/{sha} (with
+    paginated files), /contributors, /stats/contributors, /issues and /pulls,
+    the GraphQL commit history, and GraphQL user lookups by login and public
+    email. Responses carry GitHub's pagination links, ETags and rate-limit
+    headers.
+
+    Each request is delayed by `latency` seconds (plus up to `jitter`). Each
+    token may send `rate_limit` requests per `rate_window` seconds to each
+    rate-limit resource (core, graphql, search). After that it gets 403
+    responses until its window resets.
+
+    Recorded responses are keyed by path and query (e.g.
+    "/repos/o/r/contributors?per_page=100"). They are served as they are,
+    before anything is generated.
+
+    POST /_push/{owner}/{repo}?count=N adds N commits on top of the history and
+    answers with the push event GitHub would deliver for them, for replaying
+    against DevPie's webhook (see deliver).
+    """
+
+    def __init__(self, commits: int = 1000, latency: float = 0.0, jitter: float = 0.0, rate_limit: int = 5000, rate_window: float = 3600,
+                 authors: int = 20, files_per_commit: int = 3, stats_pending: int = 1, recorded: Optional[Dict[str, dict]] = None):
+        self.commits = commits
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.authors = authors
+        self.files_per_commit = files_per_commit
+        self.stats_pending = stats_pending
+        self.recorded = recorded or {}
+        self.requests: Counter = Counter()
+        self.lock = threading.Lock()
+        self.budgets: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    def start(self, port: int = 0) -> str:
+        """
+        Serves on localhost from a background thread; port 0 picks a free port.
+
+        Returns:
+            str: The API URL to use instead of https://api.github.com.
+        """
+        handler = type('Handler', (FakeGitHubHandler,), {'api': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def request_count(self) -> int:
+        with self.lock:
+            return sum(self.requests.values())
+
+    def charge(self, token: str, resource: str = 'core') -> Tuple[int, int, float]:
+        """
+        Counts a request against the token's budget for the resource.
+
+        Returns:
+            tuple: The limit, the requests remaining and the reset time, before this request was counted.
+        """
+        with self.lock:
+            now = time.time()
+            # GitHub reports the reset as whole epoch seconds, so windows end on one
+            reset_at, used = self.budgets.get((token, resource), (math.ceil(now + self.rate_window), 0))
+            if now >= reset_at:
+                reset_at, used = math.ceil(now + self.rate_window), 0
+            remaining = self.rate_limit - used
+            self.budgets[(token, resource)] = (reset_at, used + 1 if remaining > 0 else used)
+            return self.rate_limit, remaining, reset_at
+
+    # Synthetic history: position 0 is the newest commit. Commits are generated from their number
+    # counted from the oldest, which the SHA encodes, so pushes leave existing commits unchanged.
+    def number(self, position: int) -> int:
+        return self.commits - position
+
+    def sha(self, position: int) -> str:
+        return format(self.number(position), '040x')
+
+    def position(self, sha: str) -> Optional[int]:
+        if not re.fullmatch(r'[0-9a-f]{40}', sha) or not 0 < int(sha, 16) <= self.commits:
+            return None
+        return self.commits - int(sha, 16)
+
+    def date(self, position: int) -> str:
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(FIRST_COMMIT_AT + (self.commits - position) * COMMIT_INTERVAL))
+
+    def account(self, position: int) -> Tuple[dict, str]:
+        # Every tenth commit comes from a bot, which DevPie leaves out of the split
+        if self.number(position) % 10 == 9:
+            return {'id': 49699333, 'login': 'dependabot[bot]', 'type': 'Bot'}, 'dependabot[bot]'
+        number = self.number(position) * 7 % self.authors + 1
+        return {'id': number, 'login': f'dev{number}', 'type': 'User'}, f'Developer {number}'
+
+    def user(self, login: str) -> Optional[dict]:
+        match = re.fullmatch(r'dev(\d+)', login)
+        if not match or not 0 < int(match.group(1)) <= self.authors:
+            return None
+        return {'databaseId': int(match.group(1)), 'login': login}
+
+    def commit(self, position: int) -> dict:
+        account, name = self.account(position)
+        linked = self.number(position) % UNLINKED_EVERY != UNLINKED_EVERY // 2
+        return {
+            'sha': self.sha(position),
+            'commit': {
+                'author': {'name': name, 'email': f"{account['login']}@example.com", 'date': self.date(position)},
+                'committer': {'name': name, 'email': f"{account['login']}@example.com", 'date': self.date(position)},
+                'message': f'{MESSAGES[self.number(position) % len(MESSAGES)]} (#{self.number(position)})',
+                'verification': {'verified': self.number(position) % 2 == 0},
+            },
+            'author': account if linked else None,
+            'committer': account if linked else None,
+            'parents': [{'sha': self.sha(position + 1)}] if position + 1 < self.commits else [],
+        }
+
+    def commits_since(self, since: Optional[str]) -> int:
+        # Commits are dated in order, so "since" keeps the newest ones up to a position
+        if not since:
+            return self.commits
+        seconds = calendar.timegm(time.strptime(since.rstrip('Z')[:19], '%Y-%m-%dT%H:%M:%S'))
+        oldest_kept = max(1, -(-(seconds - FIRST_COMMIT_AT) // COMMIT_INTERVAL))
+        return max(0, self.commits - oldest_kept + 1)
+
+    def contributor(self, index: int) -> dict:
+        return {'login': f'dev{index + 1}', 'id': index + 1, 'type': 'User', 'contributions': self.commits // self.authors}
+
+    def files(self, position: int) -> List[dict]:
+        number = self.number(position)
+        return [{'filename': PATHS[(number + index) % len(PATHS)] if index < len(PATHS) else f'src/generated_{index}.py',
+                 'additions': (number + index) % 40, 'deletions': (number * 3 + index) % 15}
+                for index in range(self.files_per_commit)]
+
+    def push(self, owner: str, repo: str, count: int = 1) -> dict:
+        """
+        Adds `count` commits on top of the history, as if they were pushed to the default branch.
+
+        Returns:
+            dict: The push event payload, with the commits oldest first.
+        """
+        with self.lock:
+            before = self.sha(0)
+            self.commits += count
+        commits = []
+        for position in reversed(range(count)):
+            commit = self.commit(position)
+            # GitHub only names the account of linked authors and committers
+            people = {role: {'name': commit['commit'][role]['name'], 'email': commit['commit'][role]['email'],
+                             **({'username': commit[role]['login']} if commit[role] else {})} for role in ('author', 'committer')}
+            commits.append({
+                'id': commit['sha'], 'distinct': True, 'message': commit['commit']['message'],
+                'timestamp': commit['commit']['committer']['date'].replace('Z', '+00:00'), **people,
+            })
+        return {
+            'ref': 'refs/heads/main', 'before': before, 'after': commits[-1]['id'] if commits else before,
+            'created': False, 'deleted': False, 'forced': False,
+            'repository': {'name': repo, 'full_name': f'{owner}/{repo}', 'owner': {'login': owner}, 'default_branch': 'main'},
+            'commits': commits, 'head_commit': commits[-1] if commits else None,
+        }
+
+    def commit_details(self, position: int, page: int) -> Tuple[dict, bool]:
+        files = self.files(position)
+        details = {**self.commit(position), 'stats': {'additions': sum(file['additions'] for file in files), 'deletions': sum(file['deletions'] for file in files)},
+                   'files': files[(page - 1) * FILES_PER_PAGE:page * FILES_PER_PAGE]}
+        return details, page * FILES_PER_PAGE < len(files)
+
+    def graphql_history(self, variables: dict) -> dict:
+        start = int(variables.get('cursor') or 0)
+        end = min(self.commits, start + MAX_PER_PAGE)
+        nodes = []
+        for position in range(start, end):
+            commit = self.commit(position)
+            files = self.files(position)
+            user = {'databaseId': commit['author']['id'], 'login': commit['author']['login']} if commit['author'] else None
+            nodes.append({
+                'oid': commit['sha'], 'message': commit['commit']['message'],
+                'additions': sum(file['additions'] for file in files), 'deletions': sum(file['deletions'] for file in files),
+                'authoredDate': commit['commit']['author']['date'], 'committedDate': commit['commit']['committer']['date'],
+                'author': {'name': commit['commit']['author']['name'], 'email': commit['commit']['author']['email'], 'user': user},
+                'committer': {'name': commit['commit']['committer']['name'], 'email': commit['commit']['committer']['email'], 'user': user},
+                'signature': {'isValid': True} if commit['commit']['verification']['verified'] else None,
+            })
+        history = {'pageInfo': {'hasNextPage': end < self.commits, 'endCursor': str(end)}, 'nodes': nodes}
+        return {'data': {'repository': {'defaultBranchRef': {'target': {'history': history}}}}}
+
+    def identities(self, variables: dict) -> dict:
+        # Variables e0.. search emails ("x in:email") and l0.. look up logins; every user's email is public
+        data: Dict[str, Optional[dict]] = {}
+        for name, value in variables.items():
+            if name.startswith('e'):
+                email = value[:-len(' in:email')] if value.endswith(' in:email') else value
+                login, _, domain = email.partition('@')
+                user = self.user(login) if domain == 'example.com' else None
+                data[name] = {'userCount': int(user is not None), 'nodes': [user] if user else []}
+            else:
+                data[name] = self.user(value)
+        return {'data': data}
+
+    def contributor_stats(self) -> List[dict]:
+        # All of an author's commits are reported in a single week
+        stats: Dict[int, dict] = {}
+        for position in range(self.commits):
+            account, _ = self.account(position)
+            files = self.files(position)
+            entry = stats.setdefault(account['id'], {'author': account, 'total': 0, 'weeks': [{'w': FIRST_COMMIT_AT, 'a': 0, 'd': 0, 'c': 0}]})
+            entry['total'] += 1
+            entry['weeks'][0]['a'] += sum(file['additions'] for file in files)
+            entry['weeks'][0]['d'] += sum(file['deletions'] for file in files)
+            entry['weeks'][0]['c'] += 1
+        return list(stats.values())
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this, keep-alive clients wait for delayed ACKs
+    disable_nagle_algorithm = True
+    api: FakeGitHub
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def handle_request(self):
+        api = self.api
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0)) if self.command == 'POST' else b''
+        with api.lock:
+            api.requests[endpoint_of(self.path)] += 1
+
+        push = re.fullmatch(r'/_push/([^/]+)/([^/]+)', url.path)
+        if push and self.command == 'POST':
+            return self.send_json(api.push(push.group(1), push.group(2), int(query.get('count', 1))), 200, {})
+
+        if api.latency or api.jitter:
+            time.sleep(api.latency + random.random() * api.jitter)
+
+        resource = resource_of(self.path)
+        limit, remaining, reset_at = api.charge(self.headers.get('Authorization', ''), resource)
+        rate_headers = {'X-RateLimit-Limit': str(limit), 'X-RateLimit-Remaining': str(max(0, remaining - 1)),
+                        'X-RateLimit-Reset': str(int(reset_at)), 'X-RateLimit-Used': str(limit - remaining + 1), 'X-RateLimit-Resource': resource}
+        if remaining <= 0:
+            rate_headers.update({'X-RateLimit-Remaining': '0', 'X-RateLimit-Used': str(limit)})
+            return self.send_json({'message': 'API rate limit exceeded'}, 403, rate_headers)
+
+        if self.path in api.recorded:
+            recorded = api.recorded[self.path]
+            return self.send_json(recorded.get('body'), recorded.get('status', 200), {**rate_headers, **recorded.get('headers', {})})
+        if url.path == '/graphql':
+            query = json.loads(body or b'{}')
+            if 'history(' in (query.get('query') or ''):
+                return self.send_json(api.graphql_history(query.get('variables') or {}), 200, rate_headers)
+            return self.send_json(api.identities(query.get('variables') or {}), 200, rate_headers)
+
+        match = re.fullmatch(r'/repos/[^/]+/[^/]+/(commits|contributors|stats/contributors|issues|pulls)(?:/([^/]+))?', url.path)
+        if not match:
+            return self.send_json({'message': 'Not Found'}, 404, rate_headers)
+        resource, sha = match.groups()
+
+        if resource == 'commits' and sha == 'HEAD':
+            return self.send_text(api.sha(0), rate_headers)
+        if resource == 'commits' and sha:
+            position = api.position(sha)
+            if position is None:
+                return self.send_json({'message': 'No commit found for SHA'}, 422, rate_headers)
+            page = int(query.get('page', 1))
+            details, more = api.commit_details(position, page)
+            links = {'next': f"{url.path}?page={page + 1}"} if more else {}
+            return self.send_json(details, 200, rate_headers, links)
+        if resource == 'commits':
+            return self.send_page(url.path, query, api.commits_since(query.get('since')), api.commit, rate_headers)
+        if resource == 'contributors':
+            return self.send_page(url.path, query, api.authors, api.contributor, rate_headers)
+        if resource == 'stats/contributors':
+            with api.lock:
+                pending = api.requests[endpoint_of(self.path)] <= api.stats_pending
+            if pending:
+                return self.send_json({}, 202, rate_headers)
+            return self.send_json(api.contributor_stats(), 200, rate_headers)
+        return self.send_json([], 200, rate_headers)
+
+    def send_page(self, path: str, query: dict, total: int, item, headers: dict):
+        per_page = min(MAX_PER_PAGE, int(query.get('per_page', DEFAULT_PER_PAGE)))
+        page = int(query.get('page', 1))
+        items = [item(index) for index in range((page - 1) * per_page, min(total, page * per_page))]
+        last = max(1, -(-total // per_page))
+        links = {}
+        if page < last:
+            links['next'] = f'{path}?{urlencode({**query, "page": page + 1})}'
+            links['last'] = f'{path}?{urlencode({**query, "page": last})}'
+        return self.send_json(items, 200, headers, links)
+
+    def send_json(self, payload, status: int, headers: dict, links: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            status, body = 304, b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        if links:
+            host = f'http://{self.headers["Host"]}'
+            self.send_header('Link', ', '.join(f'<{host}{target}>; rel="{rel}"' for rel, target in links.items()))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_text(self, text: str, headers: dict):
+        body = text.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.github.sha; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+# Function to deliver a push event to a DevPie webhook the way GitHub does
+def deliver(url: str, payload: dict, secret: str) -> Tuple[int, str]:
+    """
+    Returns:
+        tuple: The status and body of the response.
+    """
+    body = json.dumps(payload).encode()
+    request = urllib.request.Request(url, body, {'Content-Type': 'application/json', 'X-GitHub-Event': 'push', SIGNATURE_HEADER: sign(body, secret)})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read().decode()
+
+# Function to run the stand-in API from the command line
+def main():
+    parser = argparse.ArgumentParser(description='Serve a synthetic GitHub API for DevPie on localhost.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--commits', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra seconds per response')
+    parser.add_argument('--rate-limit', type=int, default=5000, help='requests per token and window')
+    parser.add_argument('--rate-window', type=float, default=3600, help='seconds until a token budget resets')
+    parser.add_argument('--recorded', help='JSON file of recorded responses: {"/path?query": {"status", "headers", "body"}}')
+    parser.add_argument('--replay', help='instead of serving, deliver the push payloads in this JSON file (one or a list) to --webhook-url')
+    parser.add_argument('--webhook-url', default='http://127.0.0.1:5000/webhooks/github')
+    parser.add_argument('--webhook-secret', help='the DEVPIE_WEBHOOK_SECRET of the server')
+    args = parser.parse_args()
+
+    if args.replay:
+        if not args.webhook_secret:
+            parser.error('--replay needs --webhook-secret')
+        with open(args.replay, 'r') as file:
+            payloads = json.load(file)
+        for payload in payloads if isinstance(payloads, list) else [payloads]:
+            status, body = deliver(args.webhook_url, payload, args.webhook_secret)
+            print(status, body.strip())
+        return
+
+    recorded = None
+    if args.recorded:
+        with open(args.recorded, 'r') as file:
+            recorded = json.load(file)
+    api = FakeGitHub(args.commits, args.latency, args.jitter, args.rate_limit, args.rate_window, recorded=recorded)
+    print(f'Serving {args.commits} commits at {api.start(args.port)} (set DEVPIE_API_URL to use it)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        api.stop()
+
+if __name__ == '__main__':
+    main()
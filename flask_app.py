@@ -1,24 +1,39 @@
-import requests # type: ignore
-import csv
-import matplotlib.pyplot as plt # type: ignore
-from typing import Dict, Set
+import functools
+import hashlib
+import json
 import os
-import yaml # type: ignore
-from flask import Flask, request, render_template, redirect, url_for, send_from_directory
+import time
+from flask import Flask, Response, request, render_template, redirect, url_for, send_from_directory, jsonify, abort, stream_with_context
 from urllib.parse import urlparse
+from batch import BATCH_NAME_PATTERN, analyze_repositories, list_organization_repositories, parse_repositories, read_batch_summary, write_batch_summary
+from charts import chart_digest, pie_chart, read_digest, render_chart, render_chart_png
+from exports import EXPORT_COLUMNS, EXPORT_MIMETYPES, encode_export, filter_totals, iter_commit_chunks, iter_scored_chunks, parse_export_name
+from github_api import create_session
+from jobs import DEFAULT_WORKERS, JobQueue
+from metrics import registry, stage
+from pipeline import analyze_repository, analyze_repository_totals, api_url, apply_push, github_headers
+from results import chart_pool, current_issue_index, rule_set, split_summary, window_chart
+from request_scheduler import scheduler
+from result_cache import read_result_head
+from timeline import parse_date
+from webhooks import SIGNATURE_HEADER, parse_push, verify_signature
 
 app = Flask(__name__)
 
-# Path to the user's local GitHub CLI configuration file
-config_path = os.path.expanduser('~/.config/gh/hosts.yml')
+# Analyses run in the background so web workers are not blocked while a repository is fetched
+job_queue = JobQueue(int(os.environ.get('DEVPIE_WORKERS', DEFAULT_WORKERS)))
 
-# Read the GitHub API token from the configuration file
-with open(config_path, 'r') as file:
-    config = yaml.safe_load(file)
-    token = config['github.com']['oauth_token']
+# Number of worker processes analysing the repositories of a batch; by default one per core
+batch_workers = int(os.environ.get('DEVPIE_BATCH_WORKERS', 0)) or None
 
-# Keywords to check in commit messages for boilerplate
-keywords = ["boilerplate", "scaffolding", "scaffold", "scaff", "initial", "setup"]
+# Minimum seconds between progress events sent to a browser
+PROGRESS_INTERVAL = 0.5
+
+# Secret of the GitHub webhook that reports pushes; without one the webhook route is disabled
+webhook_secret = os.environ.get('DEVPIE_WEBHOOK_SECRET')
+
+# Browsers may keep a chart this long when its URL names the version of the data it shows
+IMAGE_MAX_AGE = 365 * 24 * 3600
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -28,175 +43,285 @@ def index():
         path_parts = parsed_url.path.strip('/').split('/')
         if len(path_parts) == 2:
             owner, repo = path_parts
-            process_repository(owner, repo)
-            return redirect(url_for('results', owner=owner, repo=repo))
+            quick = 'quick' in request.form
+
+            # Concurrent submissions for the same repository and mode share one job. The
+            # job checks HEAD itself and returns at once if the results are current, so
+            # this request never waits on GitHub.
+            job_id = job_queue.submit(analyze_repository, owner, repo, 'incremental' in request.form, quick,
+                                      key=(owner, repo, quick), owner=owner, repo=repo, quick=quick)
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify(job_id=job_id, status_url=url_for('job_status', job_id=job_id)), 202
+            return redirect(url_for('results', owner=owner, repo=repo, job=job_id, quick=1 if quick else None))
         else:
             return "Invalid GitHub URL", 400
     return render_template('index.html')
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    Streams the progress of a job as Server-Sent Events: a 'progress' event with
+    the counters whenever they change, at most every PROGRESS_INTERVAL seconds
+    and at least every KEEPALIVE_INTERVAL, then one 'done' or 'failed' event
+    with the job record, after which the stream ends.
+    """
+    job_progress = job_queue.get_progress(job_id)
+    if job_progress is None:
+        abort(404)
+
+    def events():
+        version = None
+        while True:
+            snapshot = job_progress.snapshot()
+            if snapshot['status'] != 'running':
+                yield f"event: {snapshot['status']}\ndata: {json.dumps({**(job_queue.get(job_id) or {}), 'progress': snapshot})}\n\n"
+                return
+            if snapshot['version'] != version:
+                version = snapshot['version']
+                yield f"event: progress\nid: {version}\ndata: {json.dumps(snapshot)}\n\n"
+            else:
+                yield ': keepalive\n\n'
+            time.sleep(PROGRESS_INTERVAL)
+            job_progress.wait_for_change(version)
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus text format of the stage, API, cache and chart metrics of this process
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/results')
 def results():
     owner = request.args.get('owner')
     repo = request.args.get('repo')
     output_dir = f'{owner}_{repo}'
-    return render_template('results.html', owner=owner, repo=repo, output_dir=output_dir)
+
+    # While the analysis is still running, show a page that polls the job status
+    job_id = request.args.get('job')
+    job = job_queue.get(job_id) if job_id else None
+    quick = bool(request.args.get('quick'))
+    if job and job['status'] != 'done':
+        return render_template('job.html', subject=f'{owner}/{repo}', job=job,
+                               results_url=url_for('results', owner=owner, repo=repo, quick=1 if quick else None))
+    # With since and/or until the pie shows only the commits dated in that window
+    try:
+        since, until = parse_date(request.args.get('since')), parse_date(request.args.get('until'))
+    except ValueError as error:
+        return str(error), 400
+    window_version = None
+    if (since is not None or until is not None) and read_result_head(output_dir) is not None:
+        window_version = chart_digest(window_chart(owner, repo, since, until))
+
+    # With charts=client the page draws its charts in the browser from the split API
+    client_charts = request.args.get('charts') == 'client'
+    return render_template('results.html', owner=owner, repo=repo, output_dir=output_dir, client_charts=client_charts, quick=quick,
+                           since=request.args.get('since', ''), until=request.args.get('until', ''),
+                           window_version=window_version,
+                           timeline_version=read_digest(os.path.join(output_dir, f'{owner}_{repo}_timeline.png')),
+                           quick_version=read_digest(os.path.join(output_dir, f'{owner}_{repo}_quick.png')),
+                           commits_version=read_digest(os.path.join(output_dir, f'{owner}_{repo}_commits.png')),
+                           contributors_version=read_digest(os.path.join(output_dir, f'{owner}_{repo}_contributors.png')))
+
+@app.route('/batch', methods=['GET', 'POST'])
+def batch():
+    if request.method == 'POST':
+        organization = request.form.get('organization', '').strip()
+        try:
+            repositories = parse_repositories(request.form.get('repositories', ''))
+        except ValueError as error:
+            return str(error), 400
+        if not organization and not repositories:
+            return "Enter an organization or a list of repositories", 400
+
+        # A list of repositories is named after its contents, so resubmitting it reuses the output
+        name = organization or 'repos-' + hashlib.sha256(repr(sorted(repositories)).encode()).hexdigest()[:12]
+        if not BATCH_NAME_PATTERN.match(name):
+            return "Invalid organization name", 400
+
+        job_id = job_queue.submit(analyze_batch, name, organization, repositories, 'incremental' in request.form, key=('batch', name), batch=name)
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(job_id=job_id, status_url=url_for('job_status', job_id=job_id), results_url=url_for('batch_results', name=name)), 202
+        return redirect(url_for('batch_results', name=name, job=job_id))
+    return render_template('batch.html')
+
+@app.route('/batch/<name>')
+def batch_results(name):
+    output_dir = f'batch_{name}'
+    job_id = request.args.get('job')
+    job = job_queue.get(job_id) if job_id else None
+    if job and job['status'] != 'done':
+        return render_template('job.html', subject=name, job=job, results_url=url_for('batch_results', name=name))
+
+    summary = read_batch_summary(output_dir)
+    if summary is None:
+        abort(404)
+    return render_template('batch_results.html', name=name, summary=summary, output_dir=output_dir,
+                           split_version=read_digest(os.path.join(output_dir, f'{name}_split.png')))
+
+@app.route('/api/batch/<name>')
+def batch_split(name):
+    summary = read_batch_summary(f'batch_{name}')
+    if summary is None:
+        abort(404)
+    response = jsonify(summary)
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route('/images/<owner_repo>/<filename>')
 def serve_image(owner_repo, filename):
-    return send_from_directory(owner_repo, filename)
-
-def process_repository(owner, repo):
-    base_url = f'https://api.github.com/repos/{owner}/{repo}'
-    headers = {
-        'Authorization': f'token {token}'
-    }
+    response = send_from_directory(owner_repo, filename)
+    digest = read_digest(os.path.join(owner_repo, filename))
+    if digest:
+        # The hash of the chart data is a strong validator for the image
+        response.set_etag(digest)
+        if request.args.get('v') == digest:
+            # Versioned URLs never change content
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMAGE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        response = response.make_conditional(request)
+    return response
+
+@app.route('/images/<owner>/<repo>/window.png')
+def window_image(owner, repo):
+    """
+    Draws the pie of the commits dated in the since/until window in memory.
+    Nothing is written to disk, as every window a visitor asks for would
+    otherwise leave an image behind; the hash of the chart data serves as the
+    ETag, so a browser that has the image gets a 304 without any drawing.
+    """
+    if read_result_head(f'{owner}_{repo}') is None:
+        abort(404)
+    try:
+        since, until = parse_date(request.args.get('since')), parse_date(request.args.get('until'))
+    except ValueError as error:
+        return str(error), 400
+    spec = window_chart(owner, repo, since, until)
+    digest = chart_digest(spec)
+    if digest in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(render_chart_png(spec, chart_pool), mimetype='image/png')
+    response.set_etag(digest)
+    if request.args.get('v') == digest:
+        # Versioned URLs never change content
+        response.cache_control.public = True
+        response.cache_control.max_age = IMAGE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+@app.route('/api/<owner>/<repo>/split')
+def split(owner, repo):
+    if read_result_head(f'{owner}_{repo}') is None:
+        abort(404)
+    try:
+        since, until = parse_date(request.args.get('since')), parse_date(request.args.get('until'))
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+    response = jsonify(split_summary(owner, repo, since, until))
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/export/<owner>/<repo>/<file_name>')
+def export(owner, repo, file_name):
+    """
+    Streams the stored commits (commits), the commits rescored under the
+    current rule set (scored) or the per-contributor totals (contributors) as
+    CSV or NDJSON, gzipped when the file name ends in .gz, e.g.
+    /export/octo/cat/scored.ndjson.gz?since=2024-01-01&contributor=octocat.
+    Commits are read from the store and encoded a chunk at a time.
+    """
     output_dir = f'{owner}_{repo}'
+    store_path = os.path.join(output_dir, f'{owner}_{repo}_commits.store')
+    try:
+        table, export_format, compress = parse_export_name(file_name)
+        since, until = parse_date(request.args.get('since')), parse_date(request.args.get('until'))
+    except ValueError as error:
+        return str(error), 400
+    if not os.path.isdir(store_path):
+        abort(404)
+    contributor = request.args.get('contributor', '').strip() or None
+
+    if table == 'commits':
+        chunks = iter_commit_chunks(store_path, since, until, contributor)
+    elif table == 'scored':
+        chunks = iter_scored_chunks(store_path, rule_set, current_issue_index(owner, repo), since, until, contributor)
+    else:
+        rows = filter_totals(split_summary(owner, repo, since, until)['split'], contributor)
+        chunks = iter([{field: [row.get(field) for row in rows] for _, field in EXPORT_COLUMNS[table]}])
+
+    response = Response(encode_export(export_format, EXPORT_COLUMNS[table], chunks, compress),
+                        mimetype='application/gzip' if compress else EXPORT_MIMETYPES[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{owner}_{repo}_{file_name}"'
+    return response
+
+@app.route('/webhooks/github', methods=['POST'])
+def github_webhook():
+    """
+    Receives GitHub push events. A push to the default branch of an analysed
+    repository queues a job that scores just the pushed commits and updates the
+    stored totals and charts; other events and repositories are acknowledged
+    and ignored. Deliveries must be signed with DEVPIE_WEBHOOK_SECRET.
+    """
+    if not webhook_secret:
+        abort(404)
+    body = request.get_data()
+    if not verify_signature(body, request.headers.get(SIGNATURE_HEADER), webhook_secret):
+        return jsonify(error='Invalid signature'), 401
+
+    event = request.headers.get('X-GitHub-Event')
+    if event == 'ping':
+        return jsonify(status='pong')
+    if event != 'push':
+        return jsonify(status='ignored'), 202
+    try:
+        push = parse_push(json.loads(body))
+    except (ValueError, AttributeError) as error:
+        return jsonify(error=str(error) or 'Invalid push payload'), 400
+    if push is None or read_result_head(f"{push['owner']}_{push['repo']}") is None:
+        return jsonify(status='ignored'), 202
+
+    # Redeliveries of the same push share one job
+    job_id = job_queue.submit(apply_push, push, key=('push', push['owner'], push['repo'], push['after']),
+                              owner=push['owner'], repo=push['repo'], push=push['after'])
+    return jsonify(job_id=job_id, status_url=url_for('job_status', job_id=job_id)), 202
+
+def analyze_batch(name, organization, repositories, incremental=False):
+    headers = github_headers()
+    if organization:
+        repositories = list_organization_repositories(create_session(headers, 1), api_url, organization)
+
+    # Repositories are analysed in parallel worker processes, each with its own share of the request budget
+    with stage('repositories'):
+        summary = analyze_repositories(repositories, functools.partial(analyze_repository_totals, incremental=incremental), batch_workers, scheduler.max_in_flight)
+    summary.update(name=name, organization=organization or None, rule_set=rule_set.name)
+
+    output_dir = f'batch_{name}'
+    labels = [f"{', '.join(row['names'])} ({row['user_id']})" for row in summary['split']]
+    scores = [row['points'] for row in summary['split']]
     os.makedirs(output_dir, exist_ok=True)
-
-    # Fetch commit data and write to CSV
-    csv_file_name = fetch_and_write_commits(owner, repo, base_url, headers, output_dir)
-
-    # Process the generated CSV file
-    process_csv(csv_file_name, output_dir)
-
-    # Fetch contributors data and write to CSV
-    contributors_csv_file_name = fetch_and_write_contributors(owner, repo, base_url, headers, output_dir)
-
-    # Process the contributors CSV file
-    process_contributors_csv(contributors_csv_file_name, output_dir, owner, repo)
-
-def fetch_and_write_commits(owner, repo, base_url, headers, output_dir):
-    commits_url = f'{base_url}/commits'
-    response = requests.get(commits_url, headers=headers)
-    commits = response.json()
-
-    csv_file_name = os.path.join(output_dir, f'{owner}_{repo}_commits.csv')
-    with open(csv_file_name, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["SHA", "Author", "Author ID", "Committer", "Committer ID", "Date", "Message", "Lines Added", "Lines Deleted", "Verified", "Points"])
-
-        for commit in commits:
-            sha = commit['sha']
-            author = commit['commit']['author']['name']
-            author_id = commit['author']['id'] if commit['author'] else None
-            committer = commit['commit']['committer']['name']
-            committer_id = commit['committer']['id'] if commit['committer'] else None
-            date = commit['commit']['author']['date']
-            message = commit['commit']['message']
-
-            commit_url = f'{base_url}/commits/{sha}'
-            commit_response = requests.get(commit_url, headers=headers)
-            commit_details = commit_response.json()
-
-            stats = commit_details.get('stats', {})
-            lines_added = stats.get('additions', 0)
-            lines_deleted = stats.get('deletions', 0)
-
-            verification = commit_details['commit'].get('verification', {})
-            verified = verification.get('verified', False)
-
-            if any(keyword in message.lower() for keyword in keywords):
-                points = 5
-            else:
-                points = 100 + (25 * lines_added) + (50 * lines_deleted)
-
-            if verified:
-                points += 25
-
-            if "github" in author.lower() or "bot" in author.lower():
-                author_id = None
-            if "github" in committer.lower() or "bot" in committer.lower():
-                committer_id = None
-
-            if author_id:
-                writer.writerow([sha, author, author_id, committer, committer_id, date, message, lines_added, lines_deleted, verified, points])
-
-    return csv_file_name
-
-def fetch_and_write_contributors(owner, repo, base_url, headers, output_dir):
-    contributors_url = f'{base_url}/contributors'
-    response = requests.get(contributors_url, headers=headers)
-    contributors = response.json()
-
-    csv_file_name = os.path.join(output_dir, f'{owner}_{repo}_contributors.csv')
-    with open(csv_file_name, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["Login", "ID", "Contributions"])
-
-        for contributor in contributors:
-            if contributor['type'] == 'Bot':
-                continue
-            login = contributor['login']
-            user_id = contributor['id']
-            contributions = contributor['contributions']
-            writer.writerow([login, user_id, contributions])
-
-    return csv_file_name
-
-def process_csv(file_path: str, output_dir: str):
-    points: Dict[str, int] = {}
-    user_id_to_names: Dict[str, Set[str]] = {}
-
-    with open(file_path, mode='r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            author_id = row['Author ID']
-            author_name = row['Author']
-            committer_id = row['Committer ID']
-            committer_name = row['Committer']
-
-            if "github" in author_name.lower() or "bot" in author_name.lower():
-                author_id = None
-            if "github" in committer_name.lower() or "bot" in committer_name.lower():
-                committer_id = None
-
-            if author_id:
-                points[author_id] = points.get(author_id, 0) + int(row['Points'])
-                if author_id not in user_id_to_names:
-                    user_id_to_names[author_id] = set()
-                user_id_to_names[author_id].add(author_name)
-
-            if committer_id:
-                points[committer_id] = points.get(committer_id, 0) + int(row['Points'])
-                if committer_id not in user_id_to_names:
-                    user_id_to_names[committer_id] = set()
-                user_id_to_names[committer_id].add(committer_name)
-
-    labels = [f"{', '.join(user_id_to_names[user_id])} ({user_id})" for user_id in points.keys()]
-    scores = list(points.values())
-
-    plt.figure(figsize=(10, 5))
-    plt.pie(scores, labels=labels, autopct='%1.1f%%', startangle=140)
-    plt.title('Contribution Points Distribution', loc='left')
-    plt.axis('equal')
-
-    output_file = os.path.join(output_dir, os.path.splitext(os.path.basename(file_path))[0] + '.png')
-    plt.savefig(output_file)
-    plt.close()
-
-def process_contributors_csv(file_path: str, output_dir: str, owner, repo):
-    contributors = []
-    contributions = []
-
-    with open(file_path, mode='r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            contributors.append(f"{row['Login']}")
-            contributions.append(int(row['Contributions']))
-
-    plt.figure(figsize=(10, 5))
-    bars = plt.bar(contributors, contributions)
-    plt.ylabel('Number of Contributions')
-    plt.title(f'{repo} Contributors')
-    plt.xticks(rotation=0)
-
-    # Label the bars with the number of contributions
-    for bar, contribution in zip(bars, contributions):
-        plt.text(bar.get_x() + bar.get_width() / 2, bar.get_height(), str(contribution), ha='center', va='bottom')
-
-    output_file = os.path.join(output_dir, f'{owner}_{repo}_contributors.png')
-    plt.savefig(output_file)
-    plt.close()
+    with stage('rendering'):
+        render_chart(pie_chart(labels, scores, 'Contribution Points Distribution'), os.path.join(output_dir, f'{name}_split.png'), chart_pool)
+    write_batch_summary(output_dir, summary)
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
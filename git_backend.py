@@ -0,0 +1,237 @@
+import base64
+import os
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+import requests # type: ignore
+import progress
+from github_api import DEFAULT_CONCURRENCY
+from identities import NOREPLY_EMAIL
+
+# Field and record separators used in the git log format, which cannot appear in names or messages
+FIELD_SEPARATOR = '\x1f'
+RECORD_START = '\x1e'
+MESSAGE_END = '\x1d'
+
+# One commit header per record: SHA, author, committer, signature status and raw message
+# Dates are written in UTC in the same format as the GitHub API (see DATE_ARGS)
+LOG_FORMAT = RECORD_START + FIELD_SEPARATOR.join(['%H', '%an', '%ae', '%ad', '%cn', '%ce', '%cd', '%G?', '%B']) + MESSAGE_END
+
+# Options making git print dates like the GitHub API does, e.g. 2024-01-31T12:00:00Z
+DATE_ARGS = ['--date=format-local:%Y-%m-%dT%H:%M:%SZ']
+DATE_ENV = {**os.environ, 'TZ': 'UTC'}
+
+# Renamed paths in --numstat output, e.g. "src/{old => new}/main.py"
+RENAMED_PART = re.compile(r'\{([^{}]*) => ([^{}]*)\}')
+
+# Function to stream commits from a local clone instead of the API
+def iter_git_commits(session, base_url: str, concurrency: int = DEFAULT_CONCURRENCY, params: Optional[Dict[str, str]] = None, cache=None, repo_path: Optional[str] = None, identities=None) -> Iterator[Tuple[dict, dict]]:
+    """
+    Yields (commit, commit_details) pairs read from a local or bare git repository.
+
+    Lines added and deleted are computed by git itself from a single streaming
+    `git log --numstat` pass, so no per-commit API requests are made. Merge
+    commits are diffed against their first parent, as GitHub does for its stats.
+    GitHub user IDs are resolved in bulk before the pass, with one lookup per
+    distinct email address not already in the identity index (see resolve_identities).
+
+    When repo_path is not given, a bare mirror of the repository is kept in the
+    output directory and refreshed with `git fetch` on every run. A commit is
+    treated as verified when git reports a good signature (%G? == 'G'), which
+    requires the signers' keys to be known to the local gpg installation.
+
+    Returns:
+        Iterator[tuple]: Payloads shaped like the REST /commits and /commits/{sha} responses.
+    """
+    if repo_path is None:
+        repo_path = update_mirror(session, base_url)
+
+    revision_args = [f"--since={params['since']}"] if params and params.get('since') else []
+    accounts = resolve_identities(session, base_url, repo_path, revision_args, concurrency, cache, identities)
+
+    command = ['git', '-C', repo_path, 'log', '--numstat', '--diff-merges=first-parent', *DATE_ARGS, f'--format={LOG_FORMAT}', *revision_args]
+    with subprocess.Popen(command, stdout=subprocess.PIPE, env=DATE_ENV, text=True, encoding='utf-8', errors='replace') as process:
+        record: List[str] = []
+        for line in process.stdout:
+            if line.startswith(RECORD_START) and record:
+                yield parse_log_record(''.join(record), accounts)
+                record = []
+            record.append(line)
+        if record:
+            yield parse_log_record(''.join(record), accounts)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+# Function to parse one git log record into REST-shaped payloads
+def parse_log_record(record: str, identities: Dict[str, Optional[dict]]) -> Tuple[dict, dict]:
+    """
+    Parses a header written with LOG_FORMAT and the --numstat lines that follow it.
+
+    Returns:
+        tuple: The list entry and the detail payload of the commit.
+    """
+    header, _, numstat = record[len(RECORD_START):].partition(MESSAGE_END)
+    sha, author_name, author_email, author_date, committer_name, committer_email, committer_date, signature, message = header.split(FIELD_SEPARATOR, 8)
+
+    additions = deletions = 0
+    files = []
+    for line in numstat.splitlines():
+        parts = line.split('\t', 2)
+        # Binary files are reported as "-\t-\tpath" and do not count towards line totals
+        if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+            additions += int(parts[0])
+            deletions += int(parts[1])
+            files.append({'filename': numstat_path(parts[2]), 'additions': int(parts[0]), 'deletions': int(parts[1])})
+
+    verified = signature == 'G'
+    commit = {
+        'sha': sha,
+        'commit': {
+            'author': {'name': author_name, 'email': author_email, 'date': author_date},
+            'committer': {'name': committer_name, 'email': committer_email, 'date': committer_date},
+            'message': message.rstrip('\n'),
+            'verification': {'verified': verified},
+        },
+        'author': identities.get(author_email.lower()),
+        'committer': identities.get(committer_email.lower()),
+    }
+    commit_details = {
+        'sha': sha,
+        'stats': {'additions': additions, 'deletions': deletions},
+        'commit': {'verification': {'verified': verified}},
+        'author': commit['author'],
+        'committer': commit['committer'],
+        'files': files,
+    }
+    return commit, commit_details
+
+# Function to get the path a file has after the commit from a --numstat path
+def numstat_path(path: str) -> str:
+    """
+    Renames are printed as "old => new", or with only the changed part in braces.
+
+    Returns:
+        str: The new path of the file.
+    """
+    if ' => ' not in path:
+        return path
+    if RENAMED_PART.search(path):
+        return RENAMED_PART.sub(lambda match: match.group(2), path).replace('//', '/')
+    return path.split(' => ', 1)[1]
+
+# Function to map every author and committer email to a GitHub account in bulk
+def resolve_identities(session, base_url: str, repo_path: str, revision_args: List[str], concurrency: int = DEFAULT_CONCURRENCY, cache=None, index=None) -> Dict[str, Optional[dict]]:
+    """
+    Resolves the GitHub account behind each distinct email address in the history.
+
+    Noreply addresses are decoded locally. For every other address one commit
+    that uses it is looked up through /commits/{sha}, concurrently and through
+    the commit cache, so the cost is one request per person rather than per
+    commit. Addresses already in the identity index, from this or any other
+    repository, are not looked up again, and the accounts found are added to
+    it. Addresses without an account, or whose lookup failed (e.g. offline),
+    map to None, so their commits are left out like the unlinked commits of
+    the other backends rather than counted under a second kind of ID.
+
+    Returns:
+        dict: The {'id', 'login'} account, or None, for each lowercased email address.
+    """
+    command = ['git', '-C', repo_path, 'log', '--format=%H%x1f%ae%x1f%ce', *revision_args]
+    output = subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace').stdout
+
+    identities: Dict[str, Optional[dict]] = {}
+    lookups: Dict[str, Tuple[str, str]] = {}
+    for line in output.splitlines():
+        sha, author_email, committer_email = line.split(FIELD_SEPARATOR)
+        for role, email in (('author', author_email.lower()), ('committer', committer_email.lower())):
+            if email in identities or email in lookups:
+                continue
+            match = NOREPLY_EMAIL.match(email)
+            if match:
+                identities[email] = {'id': int(match.group(1)), 'login': match.group(2)}
+            else:
+                lookups[email] = (sha, role)
+
+    known = index.get('email', lookups) if index else {}
+    for email, account in known.items():
+        identities[email] = {'id': account['id'], 'login': account['login']} if account else None
+        del lookups[email]
+
+    shas = list({sha for sha, _ in lookups.values()})
+    details = cache.get_details(shas) if cache else {}
+
+    def fetch(sha):
+        try:
+            response = session.get(f'{base_url}/commits/{sha}')
+            response.raise_for_status()
+            commit_details = response.json()
+            # Only the first page of files is included, which must not be cached as the full list
+            commit_details.pop('files', None)
+            return commit_details
+        except requests.RequestException:
+            return None
+
+    missing = [sha for sha in shas if sha not in details]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        fetched = {sha: commit_details for sha, commit_details in zip(missing, executor.map(progress.bind(fetch), missing)) if commit_details}
+    if cache and fetched:
+        cache.put_details(fetched.values())
+    details.update(fetched)
+
+    found = []
+    for email, (sha, role) in lookups.items():
+        account = details[sha].get(role) if sha in details else None
+        identities[email] = {'id': account['id'], 'login': account['login']} if account else None
+        # Addresses whose commit could not be fetched are looked up again next time
+        if sha in details:
+            found.append((email, {'id': account['id'], 'login': account['login'], 'bot': account['login'].endswith('[bot]')} if account else None))
+    if index:
+        index.put('email', found)
+    return identities
+
+# Function to derive the clone URL of a repository from its API URL
+def clone_url(base_url: str) -> str:
+    """
+    Maps https://api.github.com/repos/{owner}/{repo} to https://github.com/{owner}/{repo}.git.
+    GitHub Enterprise serves its API under /api/v3 of the web host, and any
+    other API root (e.g. fake_github.py) is taken to serve git on the same host.
+
+    Returns:
+        str: The URL git clones the repository from.
+    """
+    api_root, _, path = base_url.partition('/repos/')
+    owner, repo = path.strip('/').split('/')
+    parsed = urlparse(api_root)
+    host = 'github.com' if parsed.netloc == 'api.github.com' else parsed.netloc
+    prefix = parsed.path.rstrip('/')
+    if prefix.endswith('/api/v3'):
+        prefix = prefix[:-len('/api/v3')]
+    return f'{parsed.scheme}://{host}{prefix}/{owner}/{repo}.git'
+
+# Function to create or refresh a bare mirror of the repository in its output directory
+def update_mirror(session, base_url: str) -> str:
+    """
+    Clones the repository with `git clone --bare`, or fetches new commits into an
+    existing clone. Failures to fetch are ignored so that an existing mirror can
+    still be analysed offline.
+
+    Returns:
+        str: The path of the bare repository.
+    """
+    owner, repo = base_url.rpartition('/repos/')[2].strip('/').split('/')
+    repo_path = os.path.join(f'{owner}_{repo}', f'{repo}.git')
+
+    # Pass the API token to git through the environment rather than the command line
+    env = dict(os.environ)
+    authorization = session.headers.get('Authorization', '')
+    if authorization.startswith('token '):
+        credentials = base64.b64encode(f"x-access-token:{authorization[len('token '):]}".encode()).decode()
+        env.update({'GIT_CONFIG_COUNT': '1', 'GIT_CONFIG_KEY_0': 'http.extraHeader', 'GIT_CONFIG_VALUE_0': f'Authorization: Basic {credentials}'})
+
+    if os.path.isdir(repo_path):
+        subprocess.run(['git', '-C', repo_path, 'fetch', '--quiet', 'origin', '+refs/heads/*:refs/heads/*'], env=env, capture_output=True)
+    else:
+        subprocess.run(['git', 'clone', '--quiet', '--bare', clone_url(base_url), repo_path], env=env, check=True, capture_output=True)
+    return repo_path
@@ -0,0 +1,314 @@
+import os
+import time
+import requests # type: ignore
+import yaml # type: ignore
+from requests.adapters import HTTPAdapter # type: ignore
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import progress
+from metrics import record_lookups
+from request_scheduler import scheduler
+from webhooks import utc_date
+
+# Default number of commit detail requests in flight at once
+DEFAULT_CONCURRENCY = 8
+
+# Largest page size accepted by the GitHub list endpoints
+PER_PAGE = 100
+
+# Polling of the statistics endpoints while GitHub computes them (202 Accepted):
+# the first wait in seconds, doubled after every poll, and the number of polls
+STATS_POLL_INTERVAL = 2
+STATS_MAX_POLLS = 7
+
+class GitHubSession(requests.Session):
+    """
+    Session whose requests all pass through the shared rate-limit scheduler.
+    """
+
+    def __init__(self, request_scheduler=scheduler):
+        super().__init__()
+        self.scheduler = request_scheduler
+
+    def request(self, method, url, **kwargs):
+        return self.scheduler.send(super().request, method, url, **kwargs)
+
+# Function to read the GitHub API tokens available to DevPie
+def load_tokens(config_path: str) -> List[str]:
+    """
+    Reads the oauth_token of the GitHub CLI configuration file, the tokens of any
+    other accounts logged in to the CLI, and any extra tokens listed in the
+    comma-separated DEVPIE_GITHUB_TOKENS environment variable.
+
+    Returns:
+        list: The tokens, with the CLI's active token first.
+    """
+    with open(config_path, 'r') as file:
+        host = yaml.safe_load(file)['github.com']
+
+    tokens = [host['oauth_token']]
+    for user in (host.get('users') or {}).values():
+        if user and user.get('oauth_token'):
+            tokens.append(user['oauth_token'])
+    tokens.extend(token.strip() for token in os.environ.get('DEVPIE_GITHUB_TOKENS', '').split(','))
+    return list(dict.fromkeys(token for token in tokens if token))
+
+# Function to create a keep-alive session shared by all GitHub API calls
+def create_session(headers: Dict[str, str], concurrency: int = DEFAULT_CONCURRENCY):
+    """
+    Creates a GitHubSession that reuses pooled keep-alive connections.
+
+    The connection pool is sized to the concurrency limit so that every worker
+    in the detail fetch pool can hold its own connection to api.github.com.
+    Requests are scheduled by the process-wide RequestScheduler, which also
+    picks the token they are sent with.
+
+    Returns:
+        GitHubSession: The configured session.
+    """
+    session = GitHubSession()
+    session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# Function to fetch the details of many commits concurrently
+def fetch_commit_details(session, base_url: str, shas: Iterable[str], concurrency: int = DEFAULT_CONCURRENCY, cache=None) -> List[dict]:
+    """
+    Fetches /commits/{sha} for every SHA using a bounded pool of worker threads.
+
+    Results are returned in the same order as the given SHAs, so callers can
+    zip them back onto the commit list and write rows deterministically. When a
+    CommitCache is given, cached SHAs are served from it and only the missing
+    ones are requested and then stored.
+
+    The changed files of a commit are listed 300 per page, so the rel="next"
+    pages of large commits are followed until every file is collected. Only
+    the path and line counts of each file are kept.
+
+    Returns:
+        list: The commit detail payloads, one per SHA.
+    """
+    def fetch(sha):
+        response = session.get(f'{base_url}/commits/{sha}')
+        response.raise_for_status()
+        commit_details = response.json()
+        files = list(commit_details.get('files') or [])
+        next_url = response.links.get('next', {}).get('url')
+        while next_url:
+            response = session.get(next_url)
+            response.raise_for_status()
+            files.extend(response.json().get('files') or [])
+            next_url = response.links.get('next', {}).get('url')
+        commit_details['files'] = [{'filename': file['filename'], 'additions': file.get('additions', 0), 'deletions': file.get('deletions', 0)} for file in files]
+        return commit_details
+
+    shas = list(shas)
+    cached = cache.get_details(shas, require_files=True) if cache else {}
+    missing = [sha for sha in shas if sha not in cached]
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        fetched = dict(zip(missing, executor.map(progress.bind(fetch), missing)))
+
+    if cache and fetched:
+        cache.put_details(fetched.values())
+    if cache:
+        record_lookups('commit_details', len(shas) - len(missing), len(missing))
+    progress.report('details', fetched=len(fetched), cached=len(shas) - len(missing))
+    return [cached[sha] if sha in cached else fetched[sha] for sha in shas]
+
+# Function to walk every page of a GitHub list endpoint
+def iter_pages(session, url: str, params: Optional[Dict[str, str]] = None, cache=None) -> Iterator[List[dict]]:
+    """
+    Yields the items of a GitHub list endpoint one page at a time.
+
+    Pages are requested with per_page=100 and followed through the rel="next"
+    URL of the Link header, so only a single page is held in memory at once.
+    When a CommitCache is given, each page is revalidated with If-None-Match
+    and a 304 response is answered from the cached copy.
+
+    Returns:
+        Iterator[list]: The items of each page, in API order.
+    """
+    url = requests.Request('GET', url, params={'per_page': PER_PAGE, **(params or {})}).prepare().url
+    progress.report('listing', url=url)
+    while url:
+        cached = cache.get_page(url) if cache else None
+        conditional_headers = {'If-None-Match': cached[0]} if cached else {}
+        response = session.get(url, headers=conditional_headers)
+        revalidated = cached is not None and response.status_code == 304
+        if revalidated:
+            _, items, next_url = cached
+        else:
+            response.raise_for_status()
+            items = response.json()
+            # The next link already carries per_page and page in its query string
+            next_url = response.links.get('next', {}).get('url')
+            if cache and response.headers.get('ETag'):
+                cache.put_page(url, response.headers['ETag'], items, next_url)
+        if cache:
+            record_lookups('page', int(revalidated), int(not revalidated))
+        progress.report('page', cached=revalidated, last=progress.last_page(response.links))
+        yield items
+        url = next_url
+
+# Function to stream commits paired with their details, page by page
+def iter_commits_with_details(session, base_url: str, concurrency: int = DEFAULT_CONCURRENCY, params: Optional[Dict[str, str]] = None, cache=None) -> Iterator[Tuple[dict, dict]]:
+    """
+    Yields (commit, commit_details) pairs for the whole history of a repository.
+
+    Each page of /commits is handed to the concurrent detail fetcher as soon as
+    it arrives, so the first rows are available before the last page is read.
+
+    Returns:
+        Iterator[tuple]: The list entry and the /commits/{sha} payload of each commit.
+    """
+    for commits in iter_pages(session, f'{base_url}/commits', params, cache):
+        details = fetch_commit_details(session, base_url, [commit['sha'] for commit in commits], concurrency, cache)
+        yield from zip(commits, details)
+
+# GraphQL query returning a page of up to 100 commits with their stats and signature
+COMMIT_HISTORY_QUERY = """
+query($owner: String!, $repo: String!, $cursor: String, $since: GitTimestamp) {
+  repository(owner: $owner, name: $repo) {
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          history(first: 100, after: $cursor, since: $since) {
+            pageInfo { hasNextPage endCursor }
+            nodes {
+              oid
+              message
+              additions
+              deletions
+              authoredDate
+              committedDate
+              author { name email user { databaseId login } }
+              committer { name email user { databaseId login } }
+              signature { isValid }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+# Function to stream commits with their stats from the GraphQL API, 100 at a time
+def iter_graphql_commits(session, base_url: str, concurrency: int = DEFAULT_CONCURRENCY, params: Optional[Dict[str, str]] = None, cache=None) -> Iterator[Tuple[dict, dict]]:
+    """
+    Yields (commit, commit_details) pairs using the GraphQL commit history connection.
+
+    A single query returns additions, deletions and signature status for 100
+    commits, replacing 100 /commits/{sha} requests of the REST path. Nodes are
+    converted to the same shape as the REST list and detail payloads, so the
+    CSV writer does not need to know which backend produced them. The GraphQL
+    endpoint is derived from base_url, which lets a local stand-in server
+    answer both APIs.
+
+    Returns:
+        Iterator[tuple]: The list entry and the detail payload of each commit.
+    """
+    api_url, _, owner_repo = base_url.rpartition('/repos/')
+    owner, repo = owner_repo.strip('/').split('/')
+    variables = {'owner': owner, 'repo': repo, 'cursor': None, 'since': (params or {}).get('since')}
+
+    while True:
+        response = session.post(f'{api_url}/graphql', json={'query': COMMIT_HISTORY_QUERY, 'variables': variables})
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get('errors'):
+            raise RuntimeError(f"GraphQL query failed: {payload['errors'][0].get('message')}")
+
+        history = payload['data']['repository']['defaultBranchRef']['target']['history']
+        pairs = [graphql_node_to_rest(node) for node in history['nodes']]
+        if cache and pairs:
+            cache.put_details(details for _, details in pairs)
+        yield from pairs
+
+        if not history['pageInfo']['hasNextPage']:
+            break
+        variables['cursor'] = history['pageInfo']['endCursor']
+
+# Function to convert a GraphQL commit node to the REST list and detail payloads
+def graphql_node_to_rest(node: dict) -> Tuple[dict, dict]:
+    """
+    Converts a GraphQL history node to a (commit, commit_details) pair shaped like
+    the /commits and /commits/{sha} responses.
+
+    Returns:
+        tuple: The list entry and the detail payload of the commit.
+    """
+    def account(person):
+        user = person.get('user') if person else None
+        return {'id': user['databaseId'], 'login': user['login']} if user else None
+
+    author = node.get('author') or {}
+    committer = node.get('committer') or {}
+    verified = bool(node.get('signature') and node['signature'].get('isValid'))
+    # GraphQL dates carry the author's and committer's UTC offsets; the store uses UTC like REST
+    commit = {
+        'sha': node['oid'],
+        'commit': {
+            'author': {'name': author.get('name'), 'email': author.get('email'), 'date': utc_date(node['authoredDate'])},
+            'committer': {'name': committer.get('name'), 'email': committer.get('email'), 'date': utc_date(node['committedDate'])},
+            'message': node['message'],
+            'verification': {'verified': verified},
+        },
+        'author': account(author),
+        'committer': account(committer),
+    }
+    commit_details = {
+        'sha': node['oid'],
+        'stats': {'additions': node['additions'], 'deletions': node['deletions']},
+        'commit': {'verification': {'verified': verified}},
+        'author': commit['author'],
+        'committer': commit['committer'],
+    }
+    return commit, commit_details
+
+# Function to look up the SHA the default branch currently points to
+def fetch_head_sha(session, base_url: str) -> str:
+    """
+    Fetches /commits/HEAD with the sha media type, which returns only the SHA.
+
+    Returns:
+        str: The SHA of the newest commit on the default branch.
+    """
+    response = session.get(f'{base_url}/commits/HEAD', headers={'Accept': 'application/vnd.github.sha'})
+    response.raise_for_status()
+    return response.text.strip()
+
+# Function to fetch the weekly per-author totals of a repository
+def fetch_contributor_stats(session, base_url: str, cache=None) -> List[dict]:
+    """
+    Fetches /stats/contributors, which returns the weekly additions, deletions
+    and commit counts of every author in a single request. GitHub answers 202
+    while it computes the statistics in the background, so the request is
+    repeated with a growing wait until they are ready. When a CommitCache is
+    given, the statistics are revalidated with If-None-Match like list pages.
+
+    Returns:
+        list: One entry per author with its `author`, `total` and `weeks`.
+    """
+    url = f'{base_url}/stats/contributors'
+    for poll in range(STATS_MAX_POLLS):
+        cached = cache.get_page(url) if cache else None
+        response = session.get(url, headers={'If-None-Match': cached[0]} if cached else {})
+        if cache:
+            record_lookups('page', int(cached is not None and response.status_code == 304), int(response.status_code == 200))
+        if cached and response.status_code == 304:
+            return cached[1]
+        if response.status_code == 202:
+            progress.report('wait', reason='statistics', seconds=STATS_POLL_INTERVAL * 2 ** poll)
+            time.sleep(STATS_POLL_INTERVAL * 2 ** poll)
+            continue
+        response.raise_for_status()
+        # Empty repositories are answered with 204 No Content
+        stats = response.json() if response.status_code != 204 else []
+        if cache and response.headers.get('ETag'):
+            cache.put_page(url, response.headers['ETag'], stats, None)
+        return stats
+    raise RuntimeError('GitHub is still computing the contributor statistics, try again later')
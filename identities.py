@@ -0,0 +1,268 @@
+import re
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+import requests # type: ignore
+from metrics import record_lookups
+
+# Name of the identity index, shared by all repositories analysed from the same directory
+IDENTITY_FILE_NAME = 'identities.sqlite3'
+
+# Seconds an account found for an email, login or name is trusted, and a failed lookup is remembered
+IDENTITY_TTL = 30 * 24 * 3600
+MISS_TTL = 24 * 3600
+
+# Entries kept at most; the least recently used are evicted beyond it
+IDENTITY_MAX_ENTRIES = 200000
+
+# Emails and logins looked up per GraphQL query
+IDENTITY_BATCH_SIZE = 20
+
+# GitHub noreply addresses embed the account ID and login, e.g. 123+octocat@users.noreply.github.com;
+# older ones only the login, e.g. octocat@users.noreply.github.com
+NOREPLY_EMAIL = re.compile(r'^(\d+)\+([^@]+)@users\.noreply\.github\.com$', re.IGNORECASE)
+LOGIN_NOREPLY_EMAIL = re.compile(r'^([^@+]+)@users\.noreply\.github\.com$', re.IGNORECASE)
+
+# Accounts and addresses GitHub itself commits with, e.g. web edits and merges (web-flow, noreply@github.com)
+BOT_LOGINS = {'web-flow', 'github-actions'}
+BOT_EMAILS = {'noreply@github.com', 'action@github.com'}
+
+class IdentityIndex:
+    """
+    On-disk SQLite index of the GitHub accounts behind commit emails, logins
+    and author names, shared by all repositories and runs.
+
+    Emails and logins are filled by lookups (see lookup_accounts); every linked
+    commit also records its email and name, so later commits with the same
+    identity need no request. An email or name seen with two different
+    accounts is marked ambiguous and attributes nothing. Accounts are kept for
+    IDENTITY_TTL seconds, lookups that found nothing for MISS_TTL, and beyond
+    max_entries the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str = IDENTITY_FILE_NAME, ttl: float = IDENTITY_TTL, miss_ttl: float = MISS_TTL, max_entries: int = IDENTITY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.max_entries = max_entries
+        # Analyses in other threads and batch worker processes write to the same file
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS identities (
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                user_id INTEGER,
+                login TEXT,
+                bot INTEGER NOT NULL DEFAULT 0,
+                ambiguous INTEGER NOT NULL DEFAULT 0,
+                resolved_at REAL NOT NULL,
+                used_at REAL NOT NULL,
+                PRIMARY KEY (kind, value)
+            );
+            CREATE INDEX IF NOT EXISTS identities_used_at ON identities (used_at);
+        """)
+        self.evict()
+
+    def get(self, kind: str, values: Iterable[str]) -> Dict[str, Optional[dict]]:
+        """
+        Looks up the current entries of one kind ('email', 'login' or 'name'),
+        marking them as used.
+
+        Returns:
+            dict: For every value known, its {'id', 'login', 'bot'} account, or
+            None if it has none or is ambiguous.
+        """
+        values = list(dict.fromkeys(value.lower() for value in values))
+        now = time.time()
+        found: Dict[str, Optional[dict]] = {}
+        # SQLite limits the number of parameters of a statement
+        for start in range(0, len(values), 500):
+            chunk = values[start:start + 500]
+            rows = self.connection.execute(
+                'SELECT value, user_id, login, bot, ambiguous FROM identities '
+                f'WHERE kind = ? AND value IN ({", ".join("?" * len(chunk))}) '
+                'AND resolved_at >= CASE WHEN user_id IS NULL AND bot = 0 AND ambiguous = 0 THEN ? ELSE ? END',
+                (kind, *chunk, now - self.miss_ttl, now - self.ttl),
+            )
+            for value, user_id, login, bot, ambiguous in rows:
+                found[value] = {'id': user_id, 'login': login, 'bot': bool(bot)} if not ambiguous and (user_id is not None or bot) else None
+        if found:
+            with self.connection:
+                self.connection.executemany('UPDATE identities SET used_at = ? WHERE kind = ? AND value = ?', [(now, kind, value) for value in found])
+        return found
+
+    def put(self, kind: str, entries: Iterable[Tuple[str, Optional[dict]]], observed: bool = False):
+        """
+        Stores the account found for each value, or None for values without one.
+        Observed entries come from linked commits: a value observed with another
+        account than the one stored becomes ambiguous.
+        """
+        now = time.time()
+        rows = [(kind, value.lower(), (account or {}).get('id'), (account or {}).get('login'), int(bool((account or {}).get('bot'))), now, now)
+                for value, account in entries if value]
+        if not rows:
+            return
+        ambiguous = 'identities.ambiguous OR (identities.user_id IS NOT NULL AND identities.user_id IS NOT excluded.user_id)' if observed else '0'
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO identities (kind, value, user_id, login, bot, resolved_at, used_at) VALUES (?, ?, ?, ?, ?, ?, ?) '
+                f'ON CONFLICT (kind, value) DO UPDATE SET ambiguous = {ambiguous}, user_id = excluded.user_id, login = excluded.login, '
+                'bot = excluded.bot, resolved_at = excluded.resolved_at, used_at = excluded.used_at',
+                rows,
+            )
+
+    def evict(self):
+        """
+        Drops expired entries, then the least recently used beyond max_entries.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.execute('DELETE FROM identities WHERE resolved_at < ? OR (user_id IS NULL AND bot = 0 AND ambiguous = 0 AND resolved_at < ?)',
+                                    (now - self.ttl, now - self.miss_ttl))
+            excess = self.connection.execute('SELECT COUNT(*) FROM identities').fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.connection.execute('DELETE FROM identities WHERE rowid IN (SELECT rowid FROM identities ORDER BY used_at LIMIT ?)', (excess,))
+
+    def close(self):
+        self.evict()
+        self.connection.close()
+
+# Function to tell whether a commit author or committer is a bot or GitHub itself
+def is_bot(person: Optional[dict], account: Optional[dict]) -> bool:
+    """
+    Looks at the account type and login ([bot] suffix, web-flow) and at the
+    commit's email and name, so bots are recognised with or without an account.
+
+    Returns:
+        bool: True for bots and for GitHub's own commits.
+    """
+    person = person or {}
+    account = account or {}
+    login = (account.get('login') or '').lower()
+    email = (person.get('email') or '').lower()
+    name = (person.get('name') or '').lower()
+    return bool(account.get('type') == 'Bot' or account.get('bot') or login.endswith('[bot]') or login in BOT_LOGINS
+                or email in BOT_EMAILS or '[bot]@' in email or name.endswith('[bot]'))
+
+# Function to build one GraphQL query looking up emails and logins
+def identity_query(emails: List[str], logins: List[str]) -> Tuple[str, dict]:
+    """
+    Emails are searched among public profile emails; a search is only trusted
+    when exactly one user matches.
+
+    Returns:
+        tuple: The query and its variables, named e0.. for emails and l0.. for logins.
+    """
+    variables = {f'e{index}': f'{email} in:email' for index, email in enumerate(emails)}
+    variables.update({f'l{index}': login for index, login in enumerate(logins)})
+    fields = [f'{name}: search(query: ${name}, type: USER, first: 2) {{ userCount nodes {{ ... on User {{ databaseId login }} }} }}'
+              for name in variables if name.startswith('e')]
+    fields += [f'{name}: user(login: ${name}) {{ databaseId login }}' for name in variables if name.startswith('l')]
+    declarations = ', '.join(f'${name}: String!' for name in variables)
+    return f"query({declarations}) {{ {' '.join(fields)} }}", variables
+
+# Function to find the GitHub accounts behind emails and logins, through the identity index
+def lookup_accounts(session, api_url: str, index: IdentityIndex, emails: Iterable[str] = (), logins: Iterable[str] = ()) -> Tuple[Dict[str, Optional[dict]], Dict[str, Optional[dict]]]:
+    """
+    Answers from the index where it can, decodes noreply addresses locally and
+    looks up the rest with batched GraphQL queries, IDENTITY_BATCH_SIZE at a
+    time. Results, including lookups that found nothing, are stored in the
+    index. When the API cannot be reached the values stay unknown and are
+    looked up again next time.
+
+    Returns:
+        tuple: The account (or None) of every email and of every login, keyed by lowercased value.
+    """
+    emails = list(dict.fromkeys(email.lower() for email in emails if email))
+    logins = list(dict.fromkeys(login.lower() for login in logins if login))
+    email_accounts = index.get('email', emails)
+    login_accounts = index.get('login', logins)
+
+    decoded = []
+    email_logins = {}
+    searches = []
+    for email in emails:
+        if email in email_accounts:
+            continue
+        match = NOREPLY_EMAIL.match(email)
+        login_match = LOGIN_NOREPLY_EMAIL.match(email)
+        if match:
+            decoded.append((email, {'id': int(match.group(1)), 'login': match.group(2), 'bot': match.group(2).endswith('[bot]')}))
+        elif login_match:
+            email_logins[email] = login_match.group(1)
+        # Search terms cannot contain quotes or spaces
+        elif not re.search(r'[\s"]', email):
+            searches.append(email)
+    lookups = [login for login in dict.fromkeys([*logins, *email_logins.values()]) if login not in login_accounts]
+    # Bots are not users to GraphQL; they are recognised by their login alone
+    login_accounts.update({login: {'id': None, 'login': login, 'bot': True} for login in lookups if login.endswith('[bot]')})
+    lookups = [login for login in lookups if not login.endswith('[bot]')]
+    record_lookups('identity', len(email_accounts) + len(login_accounts), len(searches) + len(lookups))
+
+    found_emails = dict(decoded)
+    found_logins: Dict[str, Optional[dict]] = {}
+    for start in range(0, max(len(searches), len(lookups)), IDENTITY_BATCH_SIZE):
+        batch_emails = searches[start:start + IDENTITY_BATCH_SIZE]
+        batch_logins = lookups[start:start + IDENTITY_BATCH_SIZE]
+        query, variables = identity_query(batch_emails, batch_logins)
+        try:
+            response = session.post(f'{api_url}/graphql', json={'query': query, 'variables': variables})
+            response.raise_for_status()
+            data = response.json().get('data')
+        except (requests.RequestException, ValueError):
+            data = None
+        # Logins that do not exist are errors with a null field; only a missing response is a failure
+        if data is None:
+            continue
+        for index_in_batch, email in enumerate(batch_emails):
+            result = data.get(f'e{index_in_batch}') or {}
+            users = [node for node in result.get('nodes') or [] if node and node.get('databaseId')]
+            found_emails[email] = {'id': users[0]['databaseId'], 'login': users[0]['login'], 'bot': False} if result.get('userCount') == 1 and users else None
+        for index_in_batch, login in enumerate(batch_logins):
+            user = data.get(f'l{index_in_batch}')
+            found_logins[login] = {'id': user['databaseId'], 'login': user['login'], 'bot': False} if user and user.get('databaseId') else None
+
+    login_accounts.update(found_logins)
+    for email, login in email_logins.items():
+        if login.lower() in login_accounts:
+            found_emails[email] = login_accounts[login.lower()]
+    index.put('email', found_emails.items())
+    index.put('login', [*found_logins.items(), *((login, account) for login, account in login_accounts.items() if account and account['bot'])])
+    email_accounts.update(found_emails)
+    return email_accounts, login_accounts
+
+# Function to give unlinked commit authors and committers the GitHub account behind them
+def attribute_commits(pairs: List[Tuple[dict, dict]], index: IdentityIndex, session, api_url: str):
+    """
+    Records the email, name and login of every linked author and committer in
+    the index, then looks up the email of each one GitHub did not link to an
+    account, falling back to an unambiguous name seen on linked commits.
+    Attributed accounts are set on the commits in place.
+    """
+    observed: Dict[str, List[Tuple[str, dict]]] = {'email': [], 'name': [], 'login': []}
+    unlinked = []
+    for commit, _ in pairs:
+        for role in ('author', 'committer'):
+            person = commit['commit'].get(role) or {}
+            account = commit.get(role)
+            # Accounts without a login are placeholders, e.g. the git backend's email IDs
+            if account and account.get('login'):
+                entry = {'id': account.get('id'), 'login': account['login'], 'bot': is_bot(person, account)}
+                observed['email'].append((person.get('email'), entry))
+                observed['name'].append((person.get('name'), entry))
+                observed['login'].append((account['login'], entry))
+            # Bots are recognised without an account, and left out either way
+            elif not account and not is_bot(person, None) and (person.get('email') or person.get('name')):
+                unlinked.append((commit, role, person))
+    for kind, entries in observed.items():
+        index.put(kind, entries, observed=True)
+    if not unlinked:
+        return
+
+    email_accounts, _ = lookup_accounts(session, api_url, index, emails=[person.get('email') for _, _, person in unlinked if person.get('email')])
+    name_accounts = index.get('name', [person['name'] for _, _, person in unlinked
+                                       if person.get('name') and not email_accounts.get((person.get('email') or '').lower())])
+    for commit, role, person in unlinked:
+        account = email_accounts.get((person.get('email') or '').lower()) or name_accounts.get((person.get('name') or '').lower())
+        if account:
+            commit[role] = {'id': account['id'], 'login': account['login'], 'type': 'Bot' if account['bot'] else 'User'}
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Optional
+import numpy as np # type: ignore
+from columnar_store import APPEND_BATCH_SIZE, BOOL, DICT, INT64, STRING_DTYPE, TEXT, ColumnarStore
+
+ISSUE_SCHEMA = {
+    'number': INT64,
+    'pull_request': BOOL,
+    'state': DICT,
+    'title': TEXT,
+    # Lowercased label names, comma-separated
+    'labels': TEXT,
+    # SHA of the merge or squash commit of a merged pull request
+    'merge_commit_sha': TEXT,
+    # Issues a pull request closes through a keyword in its description, comma-separated
+    'closes': TEXT,
+}
+
+# GitHub's closing keywords, e.g. "fixes #123" or "Resolved: #7"
+CLOSING_REFERENCE = re.compile(r'\b(?:close[sd]?|fix(?:e[sd])?|resolve[sd]?)\s*:?\s+#(\d+)', re.IGNORECASE)
+
+class IssueIndex:
+    """
+    Index from the rows of a commit store to the issues and pull requests they
+    resolve.
+
+    Links are kept as two parallel arrays sorted by commit row, so the links of
+    a range of rows are a binary search away. Labels are kept per issue number,
+    and labels_column() turns them into a per-commit column that rule sets
+    match label multipliers against.
+    """
+
+    def __init__(self, commit_rows: np.ndarray, numbers: np.ndarray, labels: Dict[int, List[str]]):
+        order = np.lexsort((numbers, commit_rows))
+        self.commit_rows = commit_rows[order]
+        self.numbers = numbers[order]
+        self.labels = labels
+        self.digest = hashlib.sha256(
+            self.commit_rows.tobytes() + self.numbers.tobytes() + json.dumps(sorted(labels.items())).encode()
+        ).hexdigest()
+
+    def labels_column(self, rows: int, start: int = 0) -> np.ndarray:
+        """
+        Returns the labels of the issues linked to each commit row from `start`
+        up to `rows`, as ",label,other," strings (empty for unlinked commits).
+        """
+        column = [''] * (rows - start)
+        low = int(np.searchsorted(self.commit_rows, start, side='left'))
+        linked: Dict[int, set] = {}
+        for row, number in zip(self.commit_rows[low:].tolist(), self.numbers[low:].tolist()):
+            if row < rows:
+                linked.setdefault(row, set()).update(self.labels.get(number, ()))
+        for row, labels in linked.items():
+            if labels:
+                column[row - start] = ',' + ','.join(sorted(labels)) + ','
+        return np.array(column, dtype=STRING_DTYPE)
+
+# Function to open the columnar issue store of a repository
+def open_issue_store(path: str) -> ColumnarStore:
+    return ColumnarStore(path, ISSUE_SCHEMA)
+
+# Function to fetch all issues and pull requests of a repository with their labels
+def fetch_and_write_issues(session, base_url: str, store_path: str, cache=None) -> str:
+    """
+    Walks /issues and /pulls with state=all, 100 per page, and rewrites the
+    issue store. /issues also lists pull requests, which are taken from /pulls
+    instead, as only that endpoint reports the merge commit SHA.
+
+    Returns:
+        str: The path of the issue store.
+    """
+    # Imported here so reading stored issues does not load the HTTP client
+    from github_api import iter_pages
+
+    store = open_issue_store(store_path)
+    store.clear()
+    rows = []
+
+    def add(row):
+        rows.append(row)
+        if len(rows) >= APPEND_BATCH_SIZE:
+            store.append(rows)
+            rows.clear()
+
+    for page in iter_pages(session, f'{base_url}/issues', {'state': 'all'}, cache):
+        for issue in page:
+            if 'pull_request' in issue:
+                continue
+            add({'number': issue['number'], 'pull_request': False, 'state': issue['state'], 'title': issue['title'],
+                 'labels': ','.join(label['name'].lower() for label in issue.get('labels') or []), 'merge_commit_sha': '', 'closes': ''})
+
+    for page in iter_pages(session, f'{base_url}/pulls', {'state': 'all'}, cache):
+        for pull in page:
+            closes = CLOSING_REFERENCE.findall(pull.get('body') or '')
+            add({'number': pull['number'], 'pull_request': True, 'state': 'merged' if pull.get('merged_at') else pull['state'], 'title': pull['title'],
+                 'labels': ','.join(label['name'].lower() for label in pull.get('labels') or []),
+                 'merge_commit_sha': pull.get('merge_commit_sha') if pull.get('merged_at') else '', 'closes': ','.join(closes)})
+
+    store.append(rows)
+    return store_path
+
+# Function to link every commit to the issues and pull requests it resolves
+def build_issue_index(commit_store: ColumnarStore, issue_store: ColumnarStore) -> IssueIndex:
+    """
+    Makes one pass over the commit messages. A commit is linked to the pull
+    request it is the merge commit of, to the issues that pull request closes,
+    and to every issue its message closes with a keyword. References to
+    numbers that are not in the issue store are ignored.
+
+    Returns:
+        IssueIndex: The index.
+    """
+    labels: Dict[int, List[str]] = {}
+    merge_shas: Dict[str, int] = {}
+    pull_closes: Dict[int, List[int]] = {}
+    for number, pull_request, issue_labels, merge_commit_sha, closes in issue_store.iter_rows(['number', 'pull_request', 'labels', 'merge_commit_sha', 'closes']):
+        labels[number] = [label for label in issue_labels.split(',') if label]
+        if pull_request and merge_commit_sha:
+            merge_shas[merge_commit_sha] = number
+            pull_closes[number] = [int(closed) for closed in closes.split(',') if closed]
+
+    commit_rows: List[int] = []
+    numbers: List[int] = []
+    for row, (sha, message) in enumerate(commit_store.iter_rows(['sha', 'message'])):
+        linked = [int(number) for number in CLOSING_REFERENCE.findall(message)]
+        if sha in merge_shas:
+            linked.append(merge_shas[sha])
+            linked.extend(pull_closes[merge_shas[sha]])
+        for number in set(linked):
+            if number in labels:
+                commit_rows.append(row)
+                numbers.append(number)
+
+    return IssueIndex(np.array(commit_rows, dtype=np.int64), np.array(numbers, dtype=np.int64), labels)
+
+# Function to save an issue index together with what it was built from
+def save_issue_index(path: str, index: IssueIndex, source_digest: str):
+    temp_file = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(temp_file, commit_rows=index.commit_rows, numbers=index.numbers,
+             meta=np.array(json.dumps({'source': source_digest, 'labels': {str(number): labels for number, labels in index.labels.items()}})))
+    os.replace(temp_file, path)
+
+# Function to load a saved issue index if it is still current
+def load_issue_index(path: str, source_digest: str) -> Optional[IssueIndex]:
+    """
+    Returns:
+        IssueIndex: The saved index, or None if it is missing or the commit or
+        issue stores changed since it was built.
+    """
+    try:
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta['source'] != source_digest:
+                return None
+            return IssueIndex(data['commit_rows'], data['numbers'], {int(number): labels for number, labels in meta['labels'].items()})
+    except (OSError, KeyError, ValueError):
+        return None
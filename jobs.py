@@ -0,0 +1,95 @@
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+from progress import Progress, track
+
+# Default number of analyses that may run at the same time
+DEFAULT_WORKERS = 4
+
+# Number of finished jobs remembered for status lookups
+MAX_FINISHED_JOBS = 1000
+
+class JobQueue:
+    """
+    Runs long analyses on a background thread pool and tracks their status.
+
+    submit() returns a job ID immediately; the job moves through the states
+    'queued', 'running' and then 'done' or 'failed'. Jobs submitted with the
+    same key while one is still queued or running share that job instead of
+    starting another. Job records live in the memory of the process that
+    accepted them, together with the Progress the job reports to.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='devpie-job')
+        self.jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self.progress: Dict[str, Progress] = {}
+        self.active_keys: Dict[Hashable, str] = {}
+        self.lock = threading.Lock()
+
+    def submit(self, function: Callable, *args, key: Optional[Hashable] = None, **metadata) -> str:
+        """
+        Queues function(*args) and returns the ID of the new job. Keyword
+        arguments are stored on the job record (e.g. owner and repo).
+
+        Returns:
+            str: The job ID, or the ID of the unfinished job with the same key.
+        """
+        with self.lock:
+            if key is not None and key in self.active_keys:
+                return self.active_keys[key]
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {'id': job_id, 'status': 'queued', 'error': None, 'submitted_at': time.time(), 'finished_at': None, **metadata}
+            self.progress[job_id] = Progress()
+            if key is not None:
+                self.active_keys[key] = job_id
+            self._evict()
+        self.executor.submit(self._run, job_id, key, function, args)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        Returns a copy of the job record, or None for an unknown job ID.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def get_progress(self, job_id: str) -> Optional[Progress]:
+        """
+        Returns the progress of a job, or None for an unknown job ID.
+        """
+        with self.lock:
+            return self.progress.get(job_id)
+
+    def _run(self, job_id: str, key: Optional[Hashable], function: Callable, args: tuple):
+        self._update(job_id, status='running', started_at=time.time())
+        progress = self.get_progress(job_id) or Progress()
+        try:
+            track(progress, function, *args)
+        except Exception as error:
+            traceback.print_exc()
+            self._update(job_id, status='failed', error=str(error), finished_at=time.time())
+            progress.finish('failed')
+        else:
+            self._update(job_id, status='done', finished_at=time.time())
+            progress.finish('done')
+        finally:
+            with self.lock:
+                if key is not None and self.active_keys.get(key) == job_id:
+                    del self.active_keys[key]
+
+    def _update(self, job_id: str, **fields):
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs[job_id].update(fields)
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] in ('done', 'failed')]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+            self.progress.pop(job_id, None)
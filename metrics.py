@@ -0,0 +1,176 @@
+import contextlib
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple
+from urllib.parse import urlparse
+import progress
+
+# Upper bounds in seconds of the histogram buckets, from single API calls to whole stages
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# Type and help text of every metric, in the order they are exposed
+METRICS = {
+    'devpie_stage_seconds': ('histogram', 'Duration of pipeline stages.'),
+    'devpie_github_request_seconds': ('histogram', 'Duration of GitHub API requests by endpoint, including the response body.'),
+    'devpie_github_requests_total': ('counter', 'GitHub API responses by endpoint and status code; "error" for connection failures.'),
+    'devpie_github_retries_total': ('counter', 'GitHub API requests retried, by reason.'),
+    'devpie_github_rate_limit_remaining': ('gauge', 'Requests left in the rate-limit window of each token and resource, by position in the token list.'),
+    'devpie_cache_lookups_total': ('counter', 'Lookups in the commit cache by kind and result.'),
+    'devpie_store_append_seconds': ('histogram', 'Duration of appending a batch of rows to a columnar store.'),
+    'devpie_store_rows_written_total': ('counter', 'Rows appended to columnar stores.'),
+    'devpie_chart_render_seconds': ('histogram', 'Duration of drawing a chart, including the wait for a render worker.'),
+    'devpie_charts_total': ('counter', 'Charts requested, by kind and whether they were drawn or unchanged.'),
+}
+
+# Parts of API paths that vary per repository, commit or issue, replaced to keep the number of endpoints small
+SHA_PART = re.compile(r'^[0-9a-f]{40}$')
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class Metrics:
+    """
+    Counters, gauges and histograms of one process, exposed in the Prometheus
+    text format.
+
+    Every web, job and worker thread records into the same registry, so the
+    numbers cover all analyses the process has run since it started. Each
+    process of a multi-process server (and each batch worker) keeps its own.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values: Dict[str, Dict[LabelKey, float]] = {name: {} for name in METRICS}
+        # Per label set: the count of each bucket, then the total count and sum
+        self.histograms: Dict[str, Dict[LabelKey, List[float]]] = {name: {} for name, (kind, _) in METRICS.items() if kind == 'histogram'}
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[name][key] = self.values[name].get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.values[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histogram = self.histograms[name].setdefault(key, [0] * (len(DURATION_BUCKETS) + 2))
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram[index] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self) -> str:
+        """
+        Returns:
+            str: Every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            for name, (kind, help_text) in METRICS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                if kind != 'histogram':
+                    lines.extend(f'{name}{format_labels(key)} {format_value(value)}' for key, value in sorted(self.values[name].items()))
+                    continue
+                for key, histogram in sorted(self.histograms[name].items()):
+                    for bound, count in zip(DURATION_BUCKETS, histogram):
+                        lines.append(f'{name}_bucket{format_labels(key + (("le", format_value(bound)),))} {count}')
+                    lines.append(f'{name}_bucket{format_labels(key + (("le", "+Inf"),))} {histogram[-2]}')
+                    lines.append(f'{name}_sum{format_labels(key)} {format_value(histogram[-1])}')
+                    lines.append(f'{name}_count{format_labels(key)} {histogram[-2]}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: A plain-text report of stage durations, API requests, retries,
+            cache hit ratios and chart rendering, e.g. for the end of a script run.
+        """
+        with self.lock:
+            stages = {dict(key)['stage']: histogram for key, histogram in self.histograms['devpie_stage_seconds'].items()}
+            requests_by_endpoint = {dict(key)['endpoint']: histogram for key, histogram in self.histograms['devpie_github_request_seconds'].items()}
+            statuses = dict(self.values['devpie_github_requests_total'])
+            retries = dict(self.values['devpie_github_retries_total'])
+            remaining = dict(self.values['devpie_github_rate_limit_remaining'])
+            lookups = dict(self.values['devpie_cache_lookups_total'])
+            charts = dict(self.values['devpie_charts_total'])
+            renders = {dict(key)['kind']: histogram for key, histogram in self.histograms['devpie_chart_render_seconds'].items()}
+            appends = [histogram for histogram in self.histograms['devpie_store_append_seconds'].values()]
+
+        lines = ['Stages:']
+        lines.extend(f'  {stage:<28} {histogram[-1]:9.2f}s' for stage, histogram in stages.items())
+        lines.append('GitHub requests:')
+        for endpoint, histogram in sorted(requests_by_endpoint.items(), key=lambda item: -item[1][-1]):
+            codes = ', '.join(f"{dict(key)['status']}: {int(count)}" for key, count in sorted(statuses.items()) if dict(key)['endpoint'] == endpoint)
+            lines.append(f'  {endpoint:<40} {int(histogram[-2]):6} requests {histogram[-1]:9.2f}s (avg {histogram[-1] / histogram[-2]:.3f}s; {codes})')
+        if retries:
+            lines.append('  Retries: ' + ', '.join(f"{dict(key)['reason']}: {int(count)}" for key, count in sorted(retries.items())))
+        if remaining:
+            lines.append('  Rate limit remaining: ' + ', '.join(f"token {dict(key)['token']} {dict(key).get('resource', 'core')}: {int(value)}" for key, value in sorted(remaining.items())))
+        lines.append('Cache:')
+        for kind in sorted({dict(key)['kind'] for key in lookups}):
+            hits = lookups.get((('kind', kind), ('result', 'hit')), 0)
+            misses = lookups.get((('kind', kind), ('result', 'miss')), 0)
+            lines.append(f'  {kind:<28} {int(hits)} hits, {int(misses)} misses ({100 * hits / max(1, hits + misses):.1f}% hit ratio)')
+        if appends:
+            lines.append(f'Store appends: {sum(int(histogram[-2]) for histogram in appends)} batches, {sum(histogram[-1] for histogram in appends):.2f}s')
+        lines.append('Charts:')
+        for kind in sorted({dict(key)['kind'] for key in charts}):
+            drawn = charts.get((('kind', kind), ('result', 'drawn')), 0)
+            unchanged = charts.get((('kind', kind), ('result', 'unchanged')), 0)
+            seconds = renders[kind][-1] if kind in renders else 0.0
+            lines.append(f'  {kind:<28} {int(drawn)} drawn in {seconds:.2f}s, {int(unchanged)} unchanged')
+        return '\n'.join(lines)
+
+# Function to format a label set in the Prometheus text format
+def format_labels(key: LabelKey) -> str:
+    if not key:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in key)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + '}'
+
+# Function to format a sample value in the Prometheus text format
+def format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+# Function to name the API endpoint of a request URL without its variable parts
+def endpoint_of(url: str) -> str:
+    """
+    E.g. https://api.github.com/repos/octo/cat/commits/<sha>?page=2 becomes
+    /repos/:owner/:repo/commits/:sha, so requests group by what they ask for.
+    """
+    parts = urlparse(url).path.strip('/').split('/')
+    if len(parts) >= 3 and parts[0] == 'repos':
+        parts[1:3] = [':owner', ':repo']
+    elif len(parts) >= 2 and parts[0] in ('orgs', 'users'):
+        parts[1] = ':' + parts[0][:-1]
+    return '/' + '/'.join(':sha' if SHA_PART.match(part) else ':number' if part.isdigit() else part for part in parts)
+
+# Function to time a pipeline stage and report it as the job's current stage
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    progress.stage(name)
+    with registry.timer('devpie_stage_seconds', stage=name):
+        yield
+
+# Function to count commit cache lookups
+def record_lookups(kind: str, hits: int, misses: int):
+    if hits:
+        registry.increment('devpie_cache_lookups_total', hits, kind=kind, result='hit')
+    if misses:
+        registry.increment('devpie_cache_lookups_total', misses, kind=kind, result='miss')
+
+# Registry shared by everything running in this process
+registry = Metrics()
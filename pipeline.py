@@ -0,0 +1,325 @@
+import functools
+import os
+from typing import Dict
+from charts import pie_chart, render_chart
+from columnar_store import APPEND_BATCH_SIZE, open_commit_store, open_contributor_store, open_file_store
+from commit_backends import COMMIT_BACKENDS, DEFAULT_BACKEND, check_backend
+from commit_cache import CACHE_FILE_NAME, CommitCache
+from identities import IDENTITY_FILE_NAME, IdentityIndex, attribute_commits, is_bot
+from github_api import DEFAULT_CONCURRENCY, create_session, fetch_commit_details, fetch_contributor_stats, fetch_head_sha, iter_pages, load_tokens
+from issues import fetch_and_write_issues
+import progress
+from metrics import stage
+from request_scheduler import DEFAULT_MAX_IN_FLIGHT, scheduler
+import results
+from results import current_issue_index, process_contributors_csv, process_csv, process_timeline, scoring_fingerprint, update_totals
+from result_cache import read_result_head, repository_lock, write_result_head
+from scoring import estimate_points, load_commit_table
+from timeline import extend_timeline, load_timeline, save_timeline
+from webhooks import push_commit, utc_date
+
+# Path to the user's local GitHub CLI configuration file
+config_path = os.path.expanduser('~/.config/gh/hosts.yml')
+
+# Root of the GitHub REST API; a local stand-in server (see fake_github.py) can be used instead
+api_url = os.environ.get('DEVPIE_API_URL', 'https://api.github.com').rstrip('/')
+
+# Cap on GitHub requests in flight across all running analyses
+scheduler.set_max_in_flight(int(os.environ.get('DEVPIE_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT)))
+
+# Number of commit detail requests to run concurrently per analysis
+concurrency = int(os.environ.get('DEVPIE_CONCURRENCY', DEFAULT_CONCURRENCY))
+
+# Source of commit data: 'rest' (one request per commit), 'graphql' (100 commits per request)
+# or 'git' (a bare clone kept in the output directory, read with git log --numstat)
+backend = os.environ.get('DEVPIE_BACKEND', DEFAULT_BACKEND)
+
+# Extra backend settings, e.g. {'repo_path': '/path/to/checkout'} (DEVPIE_REPO_PATH) to read an
+# existing clone with the 'git' backend instead of mirroring the repository into the output directory
+backend_options = {'repo_path': os.environ['DEVPIE_REPO_PATH']} if os.environ.get('DEVPIE_REPO_PATH') else {}
+
+# Identity index shared by every repository analysed from this directory (see identities.py)
+identity_index_path = os.environ.get('DEVPIE_IDENTITY_INDEX', IDENTITY_FILE_NAME)
+
+# Function to read the GitHub API tokens the first time a request needs them
+@functools.lru_cache(maxsize=None)
+def github_tokens():
+    """
+    The GitHub CLI configuration is only read once something is fetched, so
+    processes that serve or rescore stored results start without it.
+    Requests are spread over all tokens.
+
+    Returns:
+        list: The tokens, with the CLI's active token first.
+    """
+    tokens = load_tokens(config_path)
+    scheduler.add_tokens(tokens)
+    return tokens
+
+# Function to build the headers of GitHub API requests
+def github_headers() -> Dict[str, str]:
+    return {'Authorization': f'token {github_tokens()[0]}'}
+
+def analyze_repository(owner, repo, incremental=False, quick=False):
+    base_url = f'{api_url}/repos/{owner}/{repo}'
+    headers = github_headers()
+    output_dir = f'{owner}_{repo}'
+
+    # Quick estimates are cheap and do not replace the exact results, so they
+    # neither wait for a running analysis nor record the analysed HEAD
+    if quick:
+        process_repository(owner, repo, quick=True)
+        return
+
+    # Only one analysis per repository runs at a time, across all server processes.
+    # Whoever waited on the lock finds the results already current and returns.
+    progress.stage('waiting for another analysis')
+    with repository_lock(output_dir):
+        progress.stage('checking HEAD')
+        head_sha = fetch_head_sha(create_session(headers, 1), base_url)
+        if read_result_head(output_dir) == head_sha:
+            return
+        process_repository(owner, repo, incremental)
+        write_result_head(output_dir, head_sha)
+
+def apply_push(push):
+    """
+    Brings the results of an analysed repository up to date with a push to
+    its default branch (see webhooks.parse_push), at the cost of that push's
+    commits. A push that does not continue from the analysed HEAD (a delivery
+    was missed or is still queued), was forced or truncated, or comes while
+    the rule set needs issue labels is caught up with an analysis instead.
+    """
+    owner, repo = push['owner'], push['repo']
+    output_dir = f'{owner}_{repo}'
+
+    progress.stage('waiting for another analysis')
+    with repository_lock(output_dir):
+        result_head = read_result_head(output_dir)
+        if result_head == push['after']:
+            return
+        if result_head == push['before'] and push['commits'] and not push['forced'] and not push['truncated'] and not results.rule_set.label_multipliers:
+            process_push(owner, repo, push)
+            write_result_head(output_dir, push['after'])
+            return
+
+    # The analysis takes the repository lock itself; a forced push rewrote history, so it starts over
+    analyze_repository(owner, repo, incremental=not push['forced'])
+
+def process_push(owner, repo, push):
+    base_url = f'{api_url}/repos/{owner}/{repo}'
+    headers = github_headers()
+    output_dir = f'{owner}_{repo}'
+    store_path = os.path.join(output_dir, f'{owner}_{repo}_commits.store')
+    timeline_path = os.path.join(output_dir, f'{owner}_{repo}_timeline.npz')
+    cache = CommitCache(os.path.join(output_dir, CACHE_FILE_NAME), owner, repo)
+
+    # The payload has the messages and names; details add the accounts, dates, line counts and files
+    with stage('commits'):
+        entries = push['commits']
+        details = fetch_commit_details(create_session(headers, concurrency), base_url, [entry['id'] for entry in entries], concurrency, cache)
+
+        store = open_commit_store(store_path)
+        file_store = open_file_store(store_path)
+        previous_rows = store.rows
+        timeline = load_timeline(timeline_path, previous_rows, scoring_fingerprint())
+        identities = IdentityIndex(identity_index_path)
+        try:
+            # Newest first, like the commits an incremental fetch appends
+            pairs = [(push_commit(entry, commit_details), commit_details) for entry, commit_details in reversed(list(zip(entries, details)))]
+            append_commits(store, file_store, pairs, identities, create_session(headers, 1), base_url)
+        finally:
+            identities.close()
+        cache.set_refresh_state(push['after'], utc_date(entries[-1]['timestamp']))
+
+    # The cached totals cover the rows before the push, so only the pushed commits are scored
+    with stage('scoring'):
+        process_csv(store_path, output_dir, cache)
+        cache.close()
+
+    with stage('timeline'):
+        if timeline is not None:
+            table, row_count = load_commit_table(store_path, previous_rows)
+            save_timeline(timeline_path, extend_timeline(timeline, table, results.rule_set), row_count, scoring_fingerprint())
+        process_timeline(owner, repo, output_dir)
+
+def analyze_repository_totals(owner, repo, incremental=False):
+    """
+    Analyzes one repository of a batch, in a batch worker process.
+
+    Returns:
+        tuple: The points per user ID and the names seen for each user ID.
+    """
+    analyze_repository(owner, repo, incremental)
+    output_dir = f'{owner}_{repo}'
+    cache = CommitCache(os.path.join(output_dir, CACHE_FILE_NAME), owner, repo)
+    try:
+        return update_totals(os.path.join(output_dir, f'{owner}_{repo}_commits.store'), cache, issue_index=current_issue_index(owner, repo))
+    finally:
+        cache.close()
+
+def process_repository(owner, repo, incremental=False, quick=False):
+    base_url = f'{api_url}/repos/{owner}/{repo}'
+    headers = github_headers()
+    output_dir = f'{owner}_{repo}'
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Commit details and list pages are reused from earlier analyses of this repo
+    cache = CommitCache(os.path.join(output_dir, CACHE_FILE_NAME), owner, repo)
+
+    # A quick estimate needs a single request for the whole repository
+    if quick:
+        with stage('statistics'):
+            process_contributor_stats(owner, repo, base_url, headers, output_dir, cache)
+        cache.close()
+        return
+
+    # Fetch commit data and append it to the commit store
+    with stage('commits'):
+        store_path = fetch_and_write_commits(owner, repo, base_url, headers, output_dir, concurrency, cache, incremental, backend, backend_options)
+
+    # Issues and pull requests are only needed when the rule set weighs commits by their labels
+    if results.rule_set.label_multipliers:
+        with stage('issues'):
+            fetch_and_write_issues(create_session(headers), base_url, os.path.join(output_dir, f'{owner}_{repo}_issues.store'), cache)
+
+    # Process the commit store
+    with stage('scoring'):
+        process_csv(store_path, output_dir, cache, current_issue_index(owner, repo))
+
+    # Index the points by commit date and chart each contributor's share over time
+    with stage('timeline'):
+        process_timeline(owner, repo, output_dir)
+
+    # Fetch contributors data and write it to the contributor store
+    with stage('contributors'):
+        contributors_store_path = fetch_and_write_contributors(owner, repo, base_url, headers, output_dir, cache)
+        cache.close()
+
+        # Process the contributor store
+        process_contributors_csv(contributors_store_path, output_dir, owner, repo)
+
+def fetch_and_write_commits(owner, repo, base_url, headers, output_dir, concurrency=DEFAULT_CONCURRENCY, cache=None, incremental=False, backend=DEFAULT_BACKEND, backend_options=None):
+    check_backend(backend, results.rule_set)
+    session = create_session(headers, concurrency)
+    backend_options = backend_options or {}
+
+    store_path = os.path.join(output_dir, f'{owner}_{repo}_commits.store')
+    store = open_commit_store(store_path)
+
+    # Incremental runs append only the commits newer than the last one processed
+    refresh_state = cache.get_refresh_state() if cache and incremental and store.rows else None
+    params = {'since': refresh_state[1]} if refresh_state else None
+    if cache and not refresh_state:
+        cache.reset_totals()
+    if not refresh_state:
+        store.clear()
+    # Per-file line counts live inside the commit store and are cleared with it
+    file_store = open_file_store(store_path)
+    identities = IdentityIndex(identity_index_path)
+    # The git backend resolves the emails in its history through the same index
+    if backend == 'git':
+        backend_options = {**backend_options, 'identities': identities}
+    newest_commit = None
+    pairs = []
+
+    # Commits stream in page by page from the configured backend
+    try:
+        for commit, commit_details in COMMIT_BACKENDS[backend](session, base_url, concurrency, params, cache, **backend_options):
+            sha = commit['sha']
+            if refresh_state and sha == refresh_state[0]:
+                break
+            if newest_commit is None:
+                newest_commit = commit
+
+            pairs.append((commit, commit_details))
+            if len(pairs) >= APPEND_BATCH_SIZE:
+                append_commits(store, file_store, pairs, identities, session, base_url)
+                pairs = []
+        append_commits(store, file_store, pairs, identities, session, base_url)
+    finally:
+        identities.close()
+
+    if cache and newest_commit:
+        cache.set_refresh_state(newest_commit['sha'], newest_commit['commit']['committer']['date'])
+
+    return store_path
+
+def append_commits(store, file_store, pairs, identities, session, base_url):
+    # Unlinked authors and committers are attributed a batch at a time, so each new identity costs one lookup
+    attribute_commits(pairs, identities, session, base_url.rpartition('/repos/')[0])
+    rows = []
+    file_rows = []
+    for commit, commit_details in pairs:
+        row, commit_file_rows = commit_row(commit, commit_details, store.rows + len(rows))
+        if row:
+            rows.append(row)
+            file_rows.extend(commit_file_rows)
+    store.append(rows)
+    file_store.append(file_rows)
+    progress.report('commits', count=len(rows))
+
+def commit_row(commit, commit_details, row_number):
+    """
+    Turns a commit and its details into a commit store row scored under the
+    current rule set, plus file store rows pointing at row_number. Commits by
+    GitHub or bots (see identities.is_bot) lose their IDs, and commits without
+    an author ID are left out.
+
+    Returns:
+        tuple: The row, or None if the commit is left out, and its file rows.
+    """
+    author = commit['commit']['author']['name']
+    author_id = commit['author']['id'] if commit['author'] else None
+    committer = commit['commit']['committer']['name']
+    committer_id = commit['committer']['id'] if commit['committer'] else None
+    date = commit['commit']['author']['date']
+    message = commit['commit']['message']
+
+    stats = commit_details.get('stats', {})
+    lines_added = stats.get('additions', 0)
+    lines_deleted = stats.get('deletions', 0)
+
+    verification = commit_details['commit'].get('verification', {})
+    verified = verification.get('verified', False)
+
+    points = results.rule_set.score_one(message, lines_added, lines_deleted, verified, commit_details.get('files'))
+
+    if is_bot(commit['commit']['author'], commit['author']):
+        author_id = None
+    if is_bot(commit['commit']['committer'], commit['committer']):
+        committer_id = None
+
+    if not author_id:
+        return None, []
+    file_rows = [{'commit_row': row_number, 'path': file['filename'], 'additions': file.get('additions', 0), 'deletions': file.get('deletions', 0)}
+                 for file in commit_details.get('files') or []]
+    return {'sha': commit['sha'], 'author': author, 'author_id': author_id, 'committer': committer, 'committer_id': committer_id, 'date': date,
+            'message': message, 'lines_added': lines_added, 'lines_deleted': lines_deleted, 'verified': verified, 'points': points}, file_rows
+
+def fetch_and_write_contributors(owner, repo, base_url, headers, output_dir, cache=None):
+    session = create_session(headers)
+    contributors_url = f'{base_url}/contributors'
+
+    store_path = os.path.join(output_dir, f'{owner}_{repo}_contributors.store')
+    store = open_contributor_store(store_path)
+    store.clear()
+    rows = []
+
+    for contributor in (contributor for page in iter_pages(session, contributors_url, cache=cache) for contributor in page):
+        if contributor['type'] == 'Bot':
+            continue
+        rows.append({'login': contributor['login'], 'id': contributor['id'], 'contributions': contributor['contributions']})
+    store.append(rows)
+
+    return store_path
+
+def process_contributor_stats(owner, repo, base_url, headers, output_dir, cache=None):
+    session = create_session(headers, 1)
+    points, user_id_to_names = estimate_points(fetch_contributor_stats(session, base_url, cache), results.rule_set)
+
+    labels = [f"{', '.join(sorted(user_id_to_names[user_id]))} ({user_id})" for user_id in points.keys()]
+    scores = list(points.values())
+
+    output_file = os.path.join(output_dir, f'{owner}_{repo}_quick.png')
+    render_chart(pie_chart(labels, scores, 'Contribution Points Distribution'), output_file, results.chart_pool)
@@ -0,0 +1,167 @@
+import contextvars
+import functools
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlparse
+
+# Seconds between progress snapshots sent to a client while nothing else changes
+KEEPALIVE_INTERVAL = 15
+
+class Progress:
+    """
+    Counters describing how far one analysis has got.
+
+    Code deep inside the fetch, score and render pipeline reports events through
+    report(), which goes to the Progress of the job running in the current
+    thread (see track) and does nothing outside of a job. Readers wait for the
+    version to change and then take a snapshot, so a client that falls behind
+    skips straight to the latest state instead of replaying every event.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+        self.started_at = time.time()
+        self.stage: Optional[str] = None
+        self.stage_started_at = self.started_at
+        self.status = 'running'
+        self.finished_at: Optional[float] = None
+        self.counters = {
+            'pages': 0,
+            'pages_cached': 0,
+            'commits': 0,
+            'details_fetched': 0,
+            'details_cached': 0,
+            'rate_limit_waits': 0,
+            'retry_waits': 0,
+            'waited_seconds': 0.0,
+            'repositories': 0,
+        }
+        # Position in the list endpoint being walked, for the ETA
+        self.listing_pages = 0
+        self.listing_total: Optional[int] = None
+        self.listing_started_at = self.started_at
+        self.repositories_total: Optional[int] = None
+
+    def report(self, event: str, **fields):
+        with self.condition:
+            now = time.time()
+            if event == 'stage':
+                self.stage = fields['name']
+                self.stage_started_at = now
+            elif event == 'listing':
+                self.listing_pages = 0
+                self.listing_total = None
+                self.listing_started_at = now
+            elif event == 'page':
+                self.counters['pages'] += 1
+                self.counters['pages_cached'] += bool(fields.get('cached'))
+                self.listing_pages += 1
+                self.listing_total = fields.get('last') or self.listing_total
+            elif event == 'details':
+                self.counters['details_fetched'] += fields.get('fetched', 0)
+                self.counters['details_cached'] += fields.get('cached', 0)
+            elif event == 'commits':
+                self.counters['commits'] += fields['count']
+            elif event == 'wait':
+                self.counters['rate_limit_waits' if fields.get('reason') == 'rate_limit' else 'retry_waits'] += 1
+                self.counters['waited_seconds'] += fields['seconds']
+            elif event == 'repositories':
+                self.repositories_total = fields['total']
+            elif event == 'repository':
+                self.counters['repositories'] += 1
+            self.version += 1
+            self.condition.notify_all()
+
+    def finish(self, status: str):
+        with self.condition:
+            self.status = status
+            self.finished_at = time.time()
+            self.version += 1
+            self.condition.notify_all()
+
+    def eta(self, now: float) -> Optional[float]:
+        """
+        Extrapolates the rate of the work with a known size: the repositories of
+        a batch, or otherwise the pages of the list endpoint being walked, which
+        for commits include fetching their details.
+
+        Returns:
+            float: Estimated seconds left, or None if the amount of work left is unknown.
+        """
+        if self.repositories_total:
+            done, total, started_at = self.counters['repositories'], self.repositories_total, self.started_at
+        elif self.listing_total:
+            done, total, started_at = self.listing_pages, self.listing_total, self.listing_started_at
+        else:
+            return None
+        if not done:
+            return None
+        return max(0.0, (now - started_at) / done * (total - done))
+
+    def snapshot(self) -> dict:
+        with self.condition:
+            now = self.finished_at or time.time()
+            eta = self.eta(now) if self.finished_at is None else None
+            return {
+                'version': self.version,
+                'status': self.status,
+                'stage': self.stage,
+                'elapsed': round(now - self.started_at, 1),
+                'stage_elapsed': round(now - self.stage_started_at, 1),
+                'listing': {'page': self.listing_pages, 'last_page': self.listing_total},
+                'repositories_total': self.repositories_total,
+                'eta': round(eta, 1) if eta is not None else None,
+                **{name: round(value, 1) if isinstance(value, float) else value for name, value in self.counters.items()},
+            }
+
+    def wait_for_change(self, version: int, timeout: float = KEEPALIVE_INTERVAL) -> bool:
+        """
+        Blocks until the version moves past the given one or the timeout passes.
+
+        Returns:
+            bool: True if there is news since that version.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.version != version, timeout=timeout)
+
+# Progress of the job running in the current thread, if any
+current: contextvars.ContextVar = contextvars.ContextVar('devpie_progress', default=None)
+
+# Function to report a progress event to the job running in this thread
+def report(event: str, **fields):
+    progress = current.get()
+    if progress is not None:
+        progress.report(event, **fields)
+
+# Function to report the start of a pipeline stage
+def stage(name: str):
+    report('stage', name=name)
+
+# Function to run a function with reports going to the given progress
+def track(progress: Progress, function: Callable, *args):
+    token = current.set(progress)
+    try:
+        return function(*args)
+    finally:
+        current.reset(token)
+
+# Function to carry the current progress over to a worker thread
+def bind(function: Callable) -> Callable:
+    """
+    Worker threads start without the job's context, so functions handed to a
+    thread pool are wrapped to report to the job that submitted them.
+
+    Returns:
+        Callable: The wrapped function, or the function itself outside of a job.
+    """
+    progress = current.get()
+    if progress is None:
+        return function
+    return functools.partial(track, progress, function)
+
+# Function to read the page number of the rel="last" link of a list response
+def last_page(links: dict) -> Optional[int]:
+    page = parse_qs(urlparse(links.get('last', {}).get('url', '')).query).get('page')
+    return int(page[0]) if page and page[0].isdigit() else None
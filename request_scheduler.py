@@ -0,0 +1,259 @@
+import math
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+import requests # type: ignore
+import progress
+from metrics import endpoint_of, registry
+
+# Default cap on GitHub requests in flight across all sessions of the process
+DEFAULT_MAX_IN_FLIGHT = 16
+
+# Number of times a request is retried after rate limiting, server errors or connection failures
+MAX_RETRIES = 5
+
+# Below this fraction of a token's hourly budget, requests are paced until the reset time
+LOW_BUDGET_FRACTION = 0.1
+
+# Wait used for secondary rate limits that do not send Retry-After, as GitHub recommends
+SECONDARY_LIMIT_WAIT = 60
+
+# Server errors that are worth retrying
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+
+# Rate-limit resource of requests that GitHub does not count against the REST core budget
+PATH_RESOURCES = {'graphql': 'graphql', 'search': 'search'}
+
+class TokenState:
+    """
+    Rate-limit budget of one token for one resource (core, graphql, search, ...),
+    as last reported by the X-RateLimit-* headers.
+    """
+
+    def __init__(self, token: Optional[str], resource: str = 'core'):
+        self.token = token
+        self.resource = resource
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+        self.next_request_at = 0.0
+
+    def available_at(self, now: float) -> float:
+        """
+        Returns the earliest time a request may be sent with this token.
+        """
+        available = max(self.blocked_until, self.next_request_at)
+        if self.remaining == 0 and self.reset_at > now:
+            available = max(available, self.reset_at)
+        return available
+
+class RequestScheduler:
+    """
+    Central gate that every GitHub API request of the process goes through.
+
+    It keeps the remaining budget of each configured token from the response
+    headers, separately for every rate-limit resource (X-RateLimit-Resource),
+    and always sends with the token that has the most budget left for the
+    resource the request counts against. Several tokens are thus spread evenly,
+    and an exhausted GraphQL budget does not hold back REST requests.
+    Concurrency is adjusted additively up and multiplicatively down: secondary
+    rate limits halve the number of requests in flight, and successes slowly
+    restore it. When a token drops below LOW_BUDGET_FRACTION of its budget, its
+    remaining requests are spaced out until the reset time instead of running
+    into the limit. Rate-limited responses are retried after Retry-After,
+    X-RateLimit-Reset or, when GitHub gives neither, an exponential backoff.
+    """
+
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self.in_flight_limit = max_in_flight
+        self.in_flight = 0
+        self.successes = 0
+        self.tokens: List[Optional[str]] = []
+        self.states: Dict[Tuple[Optional[str], str], TokenState] = {}
+        self.condition = threading.Condition()
+
+    def add_tokens(self, tokens: Iterable[str]):
+        """
+        Adds tokens to the pool used for all requests. Without any tokens,
+        requests are sent with the session's own Authorization header.
+        """
+        with self.condition:
+            for token in tokens:
+                if token and token not in self.tokens:
+                    # Requests sent before any token was added used the session's own header
+                    if None in self.tokens:
+                        self.tokens.remove(None)
+                        self.states = {key: state for key, state in self.states.items() if key[0] is not None}
+                    self.tokens.append(token)
+
+    def set_max_in_flight(self, max_in_flight: int):
+        with self.condition:
+            self.max_in_flight = max(1, max_in_flight)
+            self.in_flight_limit = min(self.in_flight_limit, self.max_in_flight)
+            self.condition.notify_all()
+
+    def budget(self) -> List[dict]:
+        """
+        Returns the last known rate-limit budget of every token and resource, without the tokens themselves.
+        """
+        with self.condition:
+            return [{'token': self.tokens.index(state.token), 'resource': state.resource, 'limit': state.limit, 'remaining': state.remaining, 'reset_at': state.reset_at}
+                    for state in self.states.values() if state.token in self.tokens]
+
+    def send(self, send_request, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a request through send_request(method, url, **kwargs) once a slot
+        and a token with budget are available, retrying when GitHub asks to.
+
+        Returns:
+            requests.Response: The final response.
+        """
+        resource = resource_of(url)
+        for attempt in range(MAX_RETRIES + 1):
+            state = self._acquire(resource)
+            if state.token:
+                kwargs['headers'] = {**(kwargs.get('headers') or {}), 'Authorization': f'token {state.token}'}
+            endpoint = endpoint_of(url)
+            started = time.perf_counter()
+            try:
+                response = send_request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._release()
+                registry.increment('devpie_github_requests_total', endpoint=endpoint, status='error')
+                if attempt == MAX_RETRIES:
+                    raise
+                registry.increment('devpie_github_retries_total', reason='connection')
+                time.sleep(self._backoff(attempt))
+                continue
+            registry.observe('devpie_github_request_seconds', time.perf_counter() - started, endpoint=endpoint)
+            registry.increment('devpie_github_requests_total', endpoint=endpoint, status=str(response.status_code))
+
+            wait = self._record(state, response, attempt)
+            self._release()
+            if wait is None or attempt == MAX_RETRIES:
+                return response
+            rate_limited = response.status_code in (403, 429)
+            registry.increment('devpie_github_retries_total', reason='rate_limit' if rate_limited else 'server_error')
+            progress.report('wait', reason='rate_limit' if rate_limited else 'server_error', seconds=self._wait_time(resource) if rate_limited else wait)
+            time.sleep(wait)
+        return response
+
+    def _state(self, token: Optional[str], resource: str) -> TokenState:
+        # Called with the condition held
+        if (token, resource) not in self.states:
+            self.states[(token, resource)] = TokenState(token, resource)
+        return self.states[(token, resource)]
+
+    def _wait_time(self, resource: str) -> float:
+        # Rate-limited requests wait until any token may send again for the resource
+        with self.condition:
+            now = time.time()
+            return max(0.0, min(self._state(token, resource).available_at(now) for token in self.tokens) - now)
+
+    def _acquire(self, resource: str) -> TokenState:
+        with self.condition:
+            while True:
+                now = time.time()
+                if not self.tokens:
+                    self.tokens.append(None)
+                # Prefer the token with the most budget left for the resource among those that may send now
+                state = min((self._state(token, resource) for token in self.tokens), key=lambda state: (max(now, state.available_at(now)), -(state.remaining if state.remaining is not None else math.inf)))
+                available_at = state.available_at(now)
+                if self.in_flight < self.in_flight_limit and available_at <= now:
+                    self.in_flight += 1
+                    self._pace(state, now)
+                    if state.remaining:
+                        state.remaining -= 1
+                    return state
+                self.condition.wait(timeout=max(0.01, available_at - now) if available_at > now else None)
+
+    def _release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def _pace(self, state: TokenState, now: float):
+        # Spread the last part of a token's budget evenly over the time left until its reset
+        if state.limit and state.remaining is not None and state.remaining < state.limit * LOW_BUDGET_FRACTION and state.reset_at > now:
+            state.next_request_at = now + (state.reset_at - now) / max(1, state.remaining)
+        else:
+            state.next_request_at = 0.0
+
+    def _record(self, state: TokenState, response: requests.Response, attempt: int) -> Optional[float]:
+        """
+        Updates the token budget and concurrency from a response.
+
+        Returns:
+            float: Seconds to wait before retrying, or None if the response is final.
+        """
+        headers = response.headers
+        now = time.time()
+        with self.condition:
+            # GitHub names the budget a response was counted against; trust it over the guess from the URL
+            if headers.get('X-RateLimit-Resource') and headers['X-RateLimit-Resource'] != state.resource:
+                state = self._state(state.token, headers['X-RateLimit-Resource'])
+            if 'X-RateLimit-Remaining' in headers:
+                state.remaining = int(headers['X-RateLimit-Remaining'])
+                state.limit = int(headers.get('X-RateLimit-Limit', state.limit or 0)) or state.limit
+                state.reset_at = float(headers.get('X-RateLimit-Reset', state.reset_at))
+                if state.token in self.tokens:
+                    registry.set('devpie_github_rate_limit_remaining', state.remaining, token=str(self.tokens.index(state.token)), resource=state.resource)
+
+            if response.status_code in (403, 429):
+                retry_after = headers.get('Retry-After')
+                if retry_after is not None:
+                    wait = float(retry_after)
+                elif state.remaining == 0 and state.reset_at > now:
+                    # Primary limit: another token may still have budget, otherwise wait for the reset
+                    self.condition.notify_all()
+                    return 0.0
+                elif state.remaining == 0:
+                    # Primary limit without a reset time: back off this token rather than retrying at once
+                    state.blocked_until = now + self._backoff(attempt)
+                    self.condition.notify_all()
+                    return 0.0
+                elif 'rate limit' in response.text.lower():
+                    wait = SECONDARY_LIMIT_WAIT * (2 ** attempt)
+                elif response.status_code == 429:
+                    # Too Many Requests is always a rate limit, even without any hint how long it lasts
+                    wait = self._backoff(attempt)
+                else:
+                    # An ordinary permission error
+                    return None
+                state.blocked_until = now + wait
+                self.in_flight_limit = max(1, self.in_flight_limit // 2)
+                self.successes = 0
+                return 0.0
+
+            if response.status_code in RETRY_STATUS_CODES:
+                return self._backoff(attempt)
+
+            # Additive increase: one more slot after as many successes as there are slots
+            self.successes += 1
+            if self.in_flight_limit < self.max_in_flight and self.successes >= self.in_flight_limit:
+                self.in_flight_limit += 1
+                self.successes = 0
+                self.condition.notify_all()
+        return None
+
+    def _backoff(self, attempt: int) -> float:
+        return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+# Function to tell which rate-limit budget a request counts against
+def resource_of(url: str) -> str:
+    """
+    E.g. https://api.github.com/graphql counts against 'graphql' and
+    /search/commits against 'search'; everything else against 'core'.
+    """
+    parts = urlparse(url).path.strip('/').split('/')
+    # GitHub Enterprise serves the API under /api/v3, and GraphQL at /api/graphql
+    while parts and parts[0] in ('api', 'v3'):
+        parts = parts[1:]
+    return PATH_RESOURCES.get(parts[0] if parts else '', 'core')
+
+# Scheduler shared by every session created in this process
+scheduler = RequestScheduler()
@@ -0,0 +1,51 @@
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Files kept in each repository's output directory
+LOCK_FILE_NAME = '.analysis.lock'
+RESULT_FILE_NAME = 'result.json'
+
+# Function to serialise analyses of one repository across threads and server processes
+@contextmanager
+def repository_lock(output_dir: str):
+    """
+    Holds an exclusive flock on the repository's lock file for the duration of
+    the block. Because the lock lives on disk, analyses started by different
+    server processes for the same repository wait for each other instead of
+    writing the same output directory at once.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, LOCK_FILE_NAME), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# Function to read the HEAD SHA that the current results were computed for
+def read_result_head(output_dir: str) -> Optional[str]:
+    """
+    Returns:
+        str: The HEAD SHA of the last completed analysis, or None if there is none.
+    """
+    try:
+        with open(os.path.join(output_dir, RESULT_FILE_NAME), 'r') as file:
+            return json.load(file).get('head_sha')
+    except (OSError, ValueError):
+        return None
+
+# Function to record that the results in output_dir match the given HEAD SHA
+def write_result_head(output_dir: str, head_sha: str):
+    """
+    Writes the result marker atomically, so readers in other processes never
+    see a partially written file.
+    """
+    result_file = os.path.join(output_dir, RESULT_FILE_NAME)
+    temp_file = f'{result_file}.{os.getpid()}.tmp'
+    with open(temp_file, 'w') as file:
+        json.dump({'head_sha': head_sha, 'finished_at': time.time()}, file)
+    os.replace(temp_file, result_file)
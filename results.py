@@ -0,0 +1,218 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Set
+from charts import DEFAULT_RENDER_WORKERS, bar_chart, line_chart, pie_chart, render_chart
+from columnar_store import open_commit_store, open_contributor_store
+from commit_cache import CACHE_FILE_NAME, CommitCache
+from issues import build_issue_index, load_issue_index, open_issue_store, save_issue_index
+from result_cache import read_result_head
+from scoring import DEFAULT_RULE_SET, aggregate_points, compare_rule_sets, get_rule_set, load_commit_table, load_rule_sets, split_rows
+from timeline import build_timeline, load_timeline, save_timeline
+
+# Scoring and charts of the stored results. Nothing here talks to GitHub, so serving
+# or rescoring stored results does not load the HTTP client (see pipeline.py for fetching).
+
+# Charts are drawn in worker processes with the Agg backend, off the web and job threads. Workers
+# are spawned, as forking a threaded server can deadlock on a lock another thread holds. Processes
+# that are themselves workers (batch workers, spawned render workers importing the server) and the
+# command line tool have no pool and draw in the calling thread.
+chart_pool = (ProcessPoolExecutor(int(os.environ.get('DEVPIE_RENDER_WORKERS', DEFAULT_RENDER_WORKERS)), mp_context=multiprocessing.get_context('spawn'))
+              if multiprocessing.current_process().name == 'MainProcess' else None)
+
+# Number of contributors drawn in the share-over-time chart
+TIMELINE_CHART_USERS = 10
+
+# Point policy from rule_sets.yml used to score commits
+rule_set = get_rule_set(os.environ.get('DEVPIE_RULE_SET', DEFAULT_RULE_SET))
+
+def split_summary(owner, repo, since=None, until=None):
+    """
+    Collects the results of the last analysis of a repository as plain data: the
+    points, share of the pie and name aliases of every contributor, and the
+    contribution counts GitHub reports. Totals are read from the cache, so no
+    commits are rescored unless the rule set changed. Nothing is written back,
+    since an analysis may be rewriting the store at the same time. With since
+    and/or until, points come from the timeline and only cover that window;
+    contribution counts are always all-time.
+
+    Returns:
+        dict: The JSON payload of the split API.
+    """
+    output_dir = f'{owner}_{repo}'
+    if since is not None or until is not None:
+        timeline = current_timeline(owner, repo)
+        points, user_id_to_names = timeline.points(since, until), timeline.names
+    else:
+        cache = CommitCache(os.path.join(output_dir, CACHE_FILE_NAME), owner, repo)
+        try:
+            points, user_id_to_names = update_totals(os.path.join(output_dir, f'{owner}_{repo}_commits.store'), cache, save=False,
+                                                     issue_index=current_issue_index(owner, repo))
+        finally:
+            cache.close()
+
+    store = open_contributor_store(os.path.join(output_dir, f'{owner}_{repo}_contributors.store'))
+    contributors = [{'login': login, 'id': user_id, 'contributions': contributions}
+                    for login, user_id, contributions in store.iter_rows(['login', 'id', 'contributions'])]
+    contributions_by_id = {str(contributor['id']): contributor['contributions'] for contributor in contributors}
+
+    rows = split_rows(points, user_id_to_names)
+    for row in rows:
+        row['contributions'] = contributions_by_id.get(row['user_id'])
+
+    return {
+        'owner': owner,
+        'repo': repo,
+        'head_sha': read_result_head(output_dir),
+        'rule_set': rule_set.name,
+        'since': str(since) if since is not None else None,
+        'until': str(until) if until is not None else None,
+        'total_points': sum(points.values()),
+        'split': rows,
+        'contributors': contributors,
+    }
+
+def scoring_fingerprint(issue_index=None):
+    # With label multipliers, scores depend on the issue links as well as on the rule set
+    return f'{rule_set.fingerprint}:{issue_index.digest}' if issue_index is not None else rule_set.fingerprint
+
+def update_totals(file_path: str, cache=None, save=True, issue_index=None):
+    points: Dict[str, int] = {}
+    user_id_to_names: Dict[str, Set[str]] = {}
+    offset = 0
+    fingerprint = scoring_fingerprint(issue_index)
+
+    # Continue from the stored totals, scoring only the rows appended since
+    if cache:
+        offset, points, user_id_to_names = cache.get_totals(fingerprint)
+
+    table, row_count = load_commit_table(file_path, offset, issue_index)
+    if row_count != offset:
+        points, user_id_to_names = aggregate_points(table, rule_set, points, user_id_to_names)
+        if cache and save:
+            cache.put_totals(row_count, points, user_id_to_names, fingerprint)
+    return points, user_id_to_names
+
+def process_csv(file_path: str, output_dir: str, cache=None, issue_index=None):
+    points, user_id_to_names = update_totals(file_path, cache, issue_index=issue_index)
+
+    labels = [f"{', '.join(sorted(user_id_to_names[user_id]))} ({user_id})" for user_id in points.keys()]
+    scores = list(points.values())
+
+    output_file = os.path.join(output_dir, os.path.splitext(os.path.basename(file_path))[0] + '.png')
+    render_chart(pie_chart(labels, scores, 'Contribution Points Distribution'), output_file, chart_pool)
+
+def current_timeline(owner, repo):
+    """
+    Loads the repository's cumulative points index, rebuilding and saving it when
+    the commit store grew or the rule set changed since it was built.
+
+    Returns:
+        Timeline: The timeline of the repository.
+    """
+    output_dir = f'{owner}_{repo}'
+    timeline_path = os.path.join(output_dir, f'{owner}_{repo}_timeline.npz')
+    issue_index = current_issue_index(owner, repo)
+    table, rows = load_commit_table(os.path.join(output_dir, f'{owner}_{repo}_commits.store'), issue_index=issue_index)
+    timeline = load_timeline(timeline_path, rows, scoring_fingerprint(issue_index))
+    if timeline is None:
+        timeline = build_timeline(table, rule_set)
+        save_timeline(timeline_path, timeline, rows, scoring_fingerprint(issue_index))
+    return timeline
+
+def current_issue_index(owner, repo, uses_labels=None):
+    """
+    Loads the repository's commit/issue index, rebuilding and saving it when the
+    commit or issue store changed since it was built. Only rule sets with label
+    multipliers use it; uses_labels defaults to whether the current one has any.
+
+    Returns:
+        IssueIndex: The index, or None if the rule set does not use labels or no issues were fetched.
+    """
+    output_dir = f'{owner}_{repo}'
+    issue_store_path = os.path.join(output_dir, f'{owner}_{repo}_issues.store')
+    if uses_labels is None:
+        uses_labels = bool(rule_set.label_multipliers)
+    if not uses_labels or not os.path.exists(issue_store_path):
+        return None
+
+    commit_store = open_commit_store(os.path.join(output_dir, f'{owner}_{repo}_commits.store'))
+    issue_store = open_issue_store(issue_store_path)
+    index_path = os.path.join(output_dir, f'{owner}_{repo}_issue_index.npz')
+    # Keyed on the analysed HEAD and the stores' versions, not their contents, as this runs on every request
+    source_digest = f'{read_result_head(output_dir)}:{commit_store.version()}:{issue_store.version()}'
+    issue_index = load_issue_index(index_path, source_digest)
+    if issue_index is None:
+        issue_index = build_issue_index(commit_store, issue_store)
+        save_issue_index(index_path, issue_index, source_digest)
+    return issue_index
+
+# Function to compare the split of a repository's stored commits under several rule sets
+def compare_split(owner, repo, rule_set_names: List[str]):
+    """
+    Rescores every stored commit under each of the named rule sets. Nothing is
+    cached, as only the current rule set's totals are kept.
+
+    Returns:
+        list: The user ID, names and percentage of the pie under each rule set of every contributor, largest first under the first rule set.
+    """
+    output_dir = f'{owner}_{repo}'
+    rule_sets = load_rule_sets()
+    compared = {name: rule_sets[name] for name in rule_set_names}
+    issue_index = current_issue_index(owner, repo, any(compared_set.label_multipliers for compared_set in compared.values()))
+    table, _ = load_commit_table(os.path.join(output_dir, f'{owner}_{repo}_commits.store'), issue_index=issue_index)
+    splits, user_id_to_names = compare_rule_sets(table, compared)
+
+    user_ids = sorted(set().union(*splits.values()), key=lambda user_id: -splits[rule_set_names[0]].get(user_id, 0.0))
+    return [{
+        'user_id': user_id,
+        'names': sorted(user_id_to_names.get(user_id, ())),
+        'percentages': {name: splits[name].get(user_id, 0.0) for name in rule_set_names},
+    } for user_id in user_ids]
+
+def process_timeline(owner, repo, output_dir):
+    timeline = current_timeline(owner, repo)
+    dates, shares = timeline.shares()
+
+    # Only the largest contributors get a line, so the legend stays readable
+    points = timeline.points()
+    top_users = sorted(points, key=lambda user_id: -points[user_id])[:TIMELINE_CHART_USERS]
+    series = {f"{', '.join(sorted(timeline.names[user_id]))} ({user_id})": shares[user_id].round(2).tolist() for user_id in top_users}
+
+    output_file = os.path.join(output_dir, f'{owner}_{repo}_timeline.png')
+    render_chart(line_chart([str(date) for date in dates], series, 'Share of Contribution Points Over Time', 'Share of points (%)'), output_file, chart_pool)
+
+def window_chart(owner, repo, since=None, until=None) -> dict:
+    """
+    Describes the pie of the commits dated in [since, until) from the timeline.
+
+    Returns:
+        dict: The chart, as charts.render_chart and render_chart_png take it.
+    """
+    timeline = current_timeline(owner, repo)
+    points = timeline.points(since, until)
+    labels = [f"{', '.join(sorted(timeline.names[user_id]))} ({user_id})" for user_id in points.keys()]
+    return pie_chart(labels, list(points.values()), 'Contribution Points Distribution')
+
+def render_window_chart(owner, repo, since=None, until=None):
+    """
+    Draws the pie of the commits dated in [since, until) to a file in the output
+    directory. The web app draws windows in memory instead (see window_chart),
+    since visitors can ask for any number of them.
+
+    Returns:
+        tuple: The image file name and the hash of its data.
+    """
+    output_dir = f'{owner}_{repo}'
+    window = '_'.join(str(date).replace(':', '') if date is not None else default for date, default in ((since, 'start'), (until, 'now')))
+    file_name = f'{owner}_{repo}_commits_{window}.png'
+    digest = render_chart(window_chart(owner, repo, since, until), os.path.join(output_dir, file_name), chart_pool)
+    return file_name, digest
+
+def process_contributors_csv(file_path: str, output_dir: str, owner, repo):
+    store = open_contributor_store(file_path)
+    contributors = store.column('login').materialize().tolist()
+    contributions = store.column('contributions').tolist()
+
+    output_file = os.path.join(output_dir, f'{owner}_{repo}_contributors.png')
+    render_chart(bar_chart(contributors, contributions, f'{repo} Contributors', 'Number of Contributions'), output_file, chart_pool)
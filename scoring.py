@@ -0,0 +1,393 @@
+import fnmatch
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np # type: ignore
+import yaml # type: ignore
+from columnar_store import STRING_DTYPE, BlobColumn, DictColumn, open_commit_store, open_file_store
+
+# Point policies shipped with DevPie; "default" is the algorithm described in rules.tx
+RULE_SETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rule_sets.yml')
+DEFAULT_RULE_SET = 'default'
+
+# String columns of a commit table
+TEXT_COLUMNS = ['sha', 'author', 'author_id', 'committer', 'committer_id', 'date', 'message']
+
+class CommitTable:
+    """
+    Raw commit data held as one numpy array per column.
+
+    Columns read from a commit store stay encoded (DictColumn, BlobColumn) and
+    are only decoded when a caller indexes them; keyword matching and ID
+    factorization work on the encoded form directly. Keyword and name matches
+    are computed once per table and reused, so scoring the same commits under
+    several rule sets only repeats the arithmetic.
+
+    Per-file line counts, when known, are held in `files`: the table row of
+    each file's commit, its path as a DictColumn, and its additions and
+    deletions. Commits without files keep their commit-level totals.
+    """
+
+    def __init__(self, columns: Dict[str, object], files: Optional[Dict[str, object]] = None):
+        self.columns = columns
+        self.files = files
+        self._lowercase: Dict[str, np.ndarray] = {}
+        self._matches: Dict[Tuple[str, Tuple[str, ...]], np.ndarray] = {}
+        self._codes: Dict[Tuple[str, ...], Tuple[np.ndarray, List[np.ndarray]]] = {}
+        self._weighted: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self):
+        return len(self.columns['sha'])
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        if isinstance(self.columns[column], (DictColumn, BlobColumn)):
+            self.columns[column] = self.columns[column].materialize()
+        return self.columns[column]
+
+    def slice(self, begin: int, end: int) -> 'CommitTable':
+        """
+        Returns the rows [begin, end) as a table of their own, still encoded, with
+        their files. Scoring a large store one slice at a time keeps only a slice
+        of its messages in memory.
+        """
+        columns = {name: column.slice(begin, end) if isinstance(column, (DictColumn, BlobColumn)) else column[begin:end] for name, column in self.columns.items()}
+        if self.files is None:
+            return CommitTable(columns)
+        first, last = np.searchsorted(self.files['commit_row'], [begin, end], side='left').tolist()
+        return CommitTable(columns, {
+            'commit_row': self.files['commit_row'][first:last] - begin,
+            'path': self.files['path'].slice(first, last),
+            'additions': self.files['additions'][first:last],
+            'deletions': self.files['deletions'][first:last],
+        })
+
+    def contains_any(self, column: str, keywords: Iterable[str]) -> np.ndarray:
+        """
+        Returns a boolean mask of the rows whose lowercased column contains any of the keywords.
+        """
+        keywords = tuple(sorted(keyword.lower() for keyword in keywords))
+        key = (column, keywords)
+        if key not in self._matches and isinstance(self.columns[column], (DictColumn, BlobColumn)):
+            self._matches[key] = self.columns[column].contains_any(list(keywords))
+        if key not in self._matches:
+            if column not in self._lowercase:
+                self._lowercase[column] = np.strings.lower(self.columns[column])
+            mask = np.zeros(len(self), dtype=bool)
+            for keyword in keywords:
+                mask |= np.strings.find(self._lowercase[column], keyword) >= 0
+            self._matches[key] = mask
+        return self._matches[key]
+
+    def codes(self, columns: Tuple[str, ...]) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """
+        Factorizes several columns over one shared set of values, e.g. author and
+        committer IDs, so they can be aggregated with integer operations.
+
+        Returns:
+            tuple: The distinct values and, per column, the index of each row's value.
+        """
+        encoded = [self.columns[column] for column in columns]
+        if columns not in self._codes and all(isinstance(column, DictColumn) and column.values is encoded[0].values for column in encoded):
+            # Columns sharing a store's string table are already factorized
+            self._codes[columns] = (encoded[0].values, [column.codes for column in encoded])
+        if columns not in self._codes:
+            values, inverse = np.unique(np.concatenate([self.columns[column] for column in columns]), return_inverse=True)
+            self._codes[columns] = (values, np.split(inverse.reshape(-1), len(columns)))
+        return self._codes[columns]
+
+    def weighted_lines(self, path_rules: List[dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Discounts the lines of files matched by path rules from the commit totals.
+        Paths are matched once per distinct path, and the discounted lines of all
+        files are summed per commit with a bincount.
+
+        Returns:
+            tuple: The weighted lines added and deleted of every commit.
+        """
+        lines_added = self['lines_added'].astype(np.float64)
+        lines_deleted = self['lines_deleted'].astype(np.float64)
+        if not path_rules or self.files is None or not len(self.files['commit_row']):
+            return lines_added, lines_deleted
+
+        key = json.dumps(path_rules, sort_keys=True)
+        if key not in self._weighted:
+            paths = self.files['path']
+            discount = (1 - path_weights(paths.values, path_rules))[paths.codes]
+            rows = self.files['commit_row']
+            self._weighted[key] = (
+                np.maximum(lines_added - np.bincount(rows, weights=self.files['additions'] * discount, minlength=len(self)), 0),
+                np.maximum(lines_deleted - np.bincount(rows, weights=self.files['deletions'] * discount, minlength=len(self)), 0),
+            )
+        return self._weighted[key]
+
+class RuleSet:
+    """
+    A declarative point policy, evaluated as column operations over a CommitTable.
+
+    For every commit:
+        points = flat points of the first matching flat rule, or
+                 base_points + points_per_line_added * added + points_per_line_deleted * deleted
+        added and deleted count a file's lines times the factor of the first
+                 path rule with a glob matching its path (1 if none matches)
+        points *= factor of every matching multiplier
+        points *= factor of every label multiplier matching a label of a linked issue
+        points += verified_bonus if the commit is verified
+    Authors and committers whose names contain one of excluded_names earn nothing.
+    """
+
+    def __init__(self, name: str, spec: dict):
+        self.name = name
+        self.spec = spec
+        self.base_points = spec.get('base_points', 0)
+        self.points_per_line_added = spec.get('points_per_line_added', 0)
+        self.points_per_line_deleted = spec.get('points_per_line_deleted', 0)
+        self.verified_bonus = spec.get('verified_bonus', 0)
+        self.flat_rules: List[dict] = spec.get('flat_rules') or []
+        self.multipliers: List[dict] = spec.get('multipliers') or []
+        self.label_multipliers: List[dict] = spec.get('label_multipliers') or []
+        self.path_rules: List[dict] = spec.get('path_rules') or []
+        self.excluded_names: List[str] = spec.get('excluded_names') or []
+        self.fingerprint = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+    def score(self, table: CommitTable) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: The integer points of every commit in the table.
+        """
+        lines_added, lines_deleted = table.weighted_lines(self.path_rules)
+        points = self.base_points + self.points_per_line_added * lines_added + self.points_per_line_deleted * lines_deleted
+
+        # Earlier flat rules take precedence, so apply them from last to first
+        for rule in reversed(self.flat_rules):
+            points = np.where(table.contains_any('message', rule['keywords']), rule['points'], points)
+        for multiplier in self.multipliers:
+            points = np.where(table.contains_any('message', multiplier['keywords']), points * multiplier['factor'], points)
+        # Label columns hold ",label,other," so whole labels can be matched as substrings
+        if self.label_multipliers and 'labels' in table.columns:
+            for multiplier in self.label_multipliers:
+                labels = [f',{label},' for label in multiplier['labels']]
+                points = np.where(table.contains_any('labels', labels), points * multiplier['factor'], points)
+
+        points = points + np.where(table['verified'], self.verified_bonus, 0)
+        return np.rint(points).astype(np.int64)
+
+    def score_one(self, message: str, lines_added: int, lines_deleted: int, verified: bool, files: Optional[List[dict]] = None) -> int:
+        """
+        Scores a single commit, e.g. while it is being written to the commit store.
+        files are its {'filename', 'additions', 'deletions'} entries, if known.
+        """
+        return int(self.score(table_from_rows([{'message': message, 'lines_added': lines_added, 'lines_deleted': lines_deleted, 'verified': verified, 'files': files}]))[0])
+
+    def excluded(self, table: CommitTable, column: str) -> np.ndarray:
+        """
+        Returns a mask of the rows whose name column matches one of excluded_names.
+        """
+        return table.contains_any(column, self.excluded_names) if self.excluded_names else np.zeros(len(table), dtype=bool)
+
+# Function to load the named rule sets from a YAML file
+def load_rule_sets(path: str = RULE_SETS_FILE) -> Dict[str, RuleSet]:
+    """
+    Reads rule sets from YAML. A rule set may name another one under `extends`
+    and only list the settings it changes.
+
+    Returns:
+        dict: The rule sets by name.
+    """
+    with open(path, 'r') as file:
+        specs = yaml.safe_load(file)
+
+    def resolve(name, seen=()):
+        if name in seen:
+            raise ValueError(f"Rule set '{name}' extends itself")
+        spec = dict(specs[name])
+        parent = spec.pop('extends', None)
+        return {**resolve(parent, seen + (name,)), **spec} if parent else spec
+
+    return {name: RuleSet(name, resolve(name)) for name in specs}
+
+# Function to load a rule set by name
+def get_rule_set(name: str = DEFAULT_RULE_SET, path: str = RULE_SETS_FILE) -> RuleSet:
+    return load_rule_sets(path)[name]
+
+# Function to build a commit table from row dictionaries keyed by table column
+def table_from_rows(rows: List[dict]) -> CommitTable:
+    columns: Dict[str, np.ndarray] = {}
+    for column in TEXT_COLUMNS:
+        columns[column] = np.array([str(row.get(column) or '') for row in rows], dtype=STRING_DTYPE)
+    columns['lines_added'] = np.array([int(row.get('lines_added') or 0) for row in rows], dtype=np.int64)
+    columns['lines_deleted'] = np.array([int(row.get('lines_deleted') or 0) for row in rows], dtype=np.int64)
+    columns['verified'] = np.array([row.get('verified') in (True, 'True') for row in rows], dtype=bool)
+
+    files = [(index, file) for index, row in enumerate(rows) for file in row.get('files') or []]
+    if not files:
+        return CommitTable(columns)
+    paths, codes = np.unique(np.array([file['filename'] for _, file in files], dtype=STRING_DTYPE), return_inverse=True)
+    return CommitTable(columns, {
+        'commit_row': np.array([index for index, _ in files], dtype=np.int64),
+        'path': DictColumn(codes.reshape(-1), paths),
+        'additions': np.array([file.get('additions') or 0 for _, file in files], dtype=np.int64),
+        'deletions': np.array([file.get('deletions') or 0 for _, file in files], dtype=np.int64),
+    })
+
+# Function to load the raw commit columns of a commit store
+def load_commit_table(store_path: str, offset: int = 0, issue_index=None) -> Tuple[CommitTable, int]:
+    """
+    Maps the raw columns of a commit store, ignoring its stored points column,
+    and the per-file line counts kept in its file store. With an offset, only
+    the rows from that position on are included. With an IssueIndex, a labels
+    column holds the labels of the issues each commit resolves.
+
+    Returns:
+        tuple: The commit table and the number of rows in the store.
+    """
+    store = open_commit_store(store_path)
+    columns = {column: store.column(column, offset) for column in TEXT_COLUMNS + ['lines_added', 'lines_deleted', 'verified']}
+    if issue_index is not None:
+        columns['labels'] = issue_index.labels_column(store.rows, offset)
+
+    # File rows are appended in commit row order, so the files of the included commits are one slice
+    file_store = open_file_store(store_path)
+    commit_rows = file_store.column('commit_row')
+    first, last = np.searchsorted(commit_rows, [offset, store.rows], side='left').tolist()
+    paths = file_store.column('path')
+    files = {
+        'commit_row': commit_rows[first:last] - offset,
+        'path': DictColumn(paths.codes[first:last], paths.values),
+        'additions': file_store.column('additions')[first:last],
+        'deletions': file_store.column('deletions')[first:last],
+    }
+    return CommitTable(columns, files), store.rows
+
+# Function to weigh paths by the first path rule with a matching glob
+def path_weights(paths: np.ndarray, path_rules: List[dict]) -> np.ndarray:
+    """
+    Globs without a slash match the file name in any directory (*.lock), others
+    match the whole path, where * also crosses directories (dist/**). A leading
+    **/ also matches at the top level.
+
+    Returns:
+        np.ndarray: The factor of each path, 1 where no rule matches.
+    """
+    weights = np.ones(len(paths))
+    for index, path in enumerate(paths.tolist()):
+        name = path.rsplit('/', 1)[-1]
+        for rule in path_rules:
+            if any(fnmatch.fnmatchcase(name if '/' not in glob else path, glob)
+                   or (glob.startswith('**/') and fnmatch.fnmatchcase(path, glob[3:])) for glob in rule['globs']):
+                weights[index] = rule['factor']
+                break
+    return weights
+
+# Function to total the points of every author and committer
+def aggregate_points(table: CommitTable, rule_set: RuleSet, points: Optional[Dict[str, int]] = None, user_id_to_names: Optional[Dict[str, Set[str]]] = None) -> Tuple[Dict[str, int], Dict[str, Set[str]]]:
+    """
+    Scores the table and adds every commit's points to both its author and its
+    committer, skipping excluded names and missing IDs. Existing totals can be
+    passed in to be updated.
+
+    Returns:
+        tuple: The points per user ID and the names seen for each user ID.
+    """
+    points = dict(points or {})
+    user_id_to_names = {user_id: set(names) for user_id, names in (user_id_to_names or {}).items()}
+    if not len(table):
+        return points, user_id_to_names
+
+    commit_points = rule_set.score(table)
+    user_ids, id_codes = table.codes(('author_id', 'committer_id'))
+    names, name_codes = table.codes(('author', 'committer'))
+
+    totals = np.zeros(len(user_ids))
+    counts = np.zeros(len(user_ids), dtype=np.int64)
+    pairs = []
+    has_id = user_ids != ''
+    for role, role_id_codes, role_name_codes in zip(('author', 'committer'), id_codes, name_codes):
+        valid = has_id[role_id_codes] & ~rule_set.excluded(table, role)
+        totals += np.bincount(role_id_codes[valid], weights=commit_points[valid], minlength=len(user_ids))
+        counts += np.bincount(role_id_codes[valid], minlength=len(user_ids))
+        pairs.append(role_id_codes[valid].astype(np.int64) * len(names) + role_name_codes[valid])
+
+    for code in np.flatnonzero(counts).tolist():
+        user_id = str(user_ids[code])
+        points[user_id] = points.get(user_id, 0) + int(totals[code])
+    for pair in np.unique(np.concatenate(pairs)).tolist():
+        user_id_to_names.setdefault(str(user_ids[pair // len(names)]), set()).add(str(names[pair % len(names)]))
+    return points, user_id_to_names
+
+# Function to estimate the points of every author from weekly contributor statistics
+def estimate_points(stats: List[dict], rule_set: RuleSet) -> Tuple[Dict[str, int], Dict[str, Set[str]]]:
+    """
+    Approximates the split from /stats/contributors without any per-commit
+    requests: every commit earns base_points and every line its per-line
+    points. Flat rules, multipliers and the verified bonus depend on individual
+    commits and are not applied, and points only go to authors, as the
+    statistics do not name committers. GitHub also omits line counts for
+    repositories with 10,000 or more commits.
+
+    Returns:
+        tuple: The points per user ID and the login of each user ID.
+    """
+    points: Dict[str, int] = {}
+    user_id_to_names: Dict[str, Set[str]] = {}
+    for entry in stats:
+        author = entry.get('author')
+        if not author or author.get('type') == 'Bot':
+            continue
+        if any(name in author['login'].lower() for name in rule_set.excluded_names):
+            continue
+        weeks = np.array([[week['a'], week['d'], week['c']] for week in entry.get('weeks') or []], dtype=np.int64).reshape(-1, 3)
+        additions, deletions, commits = weeks.sum(axis=0).tolist()
+        user_points = round(rule_set.base_points * commits + rule_set.points_per_line_added * additions + rule_set.points_per_line_deleted * deletions)
+        if user_points:
+            user_id = str(author['id'])
+            points[user_id] = points.get(user_id, 0) + user_points
+            user_id_to_names.setdefault(user_id, set()).add(author['login'])
+    return points, user_id_to_names
+
+# Function to merge per-contributor totals, e.g. of several repositories
+def merge_totals(totals: Iterable[Tuple[Dict[str, int], Dict[str, Set[str]]]]) -> Tuple[Dict[str, int], Dict[str, Set[str]]]:
+    """
+    Adds up points by GitHub user ID, which stays the same across repositories
+    even when a contributor commits under different names.
+
+    Returns:
+        tuple: The combined points per user ID and the names seen for each user ID.
+    """
+    points: Dict[str, int] = {}
+    user_id_to_names: Dict[str, Set[str]] = {}
+    for user_points, names in totals:
+        for user_id, value in user_points.items():
+            points[user_id] = points.get(user_id, 0) + value
+            user_id_to_names.setdefault(user_id, set()).update(names.get(user_id, ()))
+    return points, user_id_to_names
+
+# Function to describe a split as rows of plain data
+def split_rows(points: Dict[str, int], user_id_to_names: Dict[str, Set[str]]) -> List[dict]:
+    """
+    Returns:
+        list: The user ID, names, points and percentage of the pie of every contributor, largest first.
+    """
+    total = sum(points.values())
+    return [{
+        'user_id': user_id,
+        'names': sorted(user_id_to_names.get(user_id, ())),
+        'points': user_points,
+        'percentage': 100 * user_points / total if total else 0.0,
+    } for user_id, user_points in sorted(points.items(), key=lambda item: -item[1])]
+
+# Function to compare the splits produced by several point policies
+def compare_rule_sets(table: CommitTable, rule_sets: Dict[str, RuleSet]) -> Tuple[Dict[str, Dict[str, float]], Dict[str, Set[str]]]:
+    """
+    Scores the same commits under every rule set, without any API calls.
+
+    Returns:
+        tuple: For each rule set name, the percentage of the pie per user ID, and the names seen for each user ID.
+    """
+    splits: Dict[str, Dict[str, float]] = {}
+    user_id_to_names: Dict[str, Set[str]] = {}
+    for name, rule_set in rule_sets.items():
+        points, user_id_to_names = aggregate_points(table, rule_set, user_id_to_names=user_id_to_names)
+        total = sum(points.values()) or 1
+        splits[name] = {user_id: 100 * user_points / total for user_id, user_points in points.items()}
+    return splits, user_id_to_names
@@ -0,0 +1,89 @@
+// Draws the DevPie charts in the browser from the JSON of the split API,
+// matching the layout of the server-rendered PNGs.
+
+const CHART_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'];
+
+function drawPieChart(canvas, labels, values, title) {
+    const context = canvas.getContext('2d');
+    const total = values.reduce((sum, value) => sum + value, 0) || 1;
+    const radius = Math.min(canvas.width, canvas.height) / 2 - 60;
+    const centerX = canvas.width / 2;
+    const centerY = canvas.height / 2 + 10;
+
+    context.clearRect(0, 0, canvas.width, canvas.height);
+    context.font = '16px sans-serif';
+    context.fillStyle = '#000';
+    context.textAlign = 'left';
+    context.fillText(title, 10, 24);
+
+    // Slices run counterclockwise from 140 degrees, like matplotlib's startangle=140
+    let angle = -140 * Math.PI / 180;
+    values.forEach((value, index) => {
+        const sweep = 2 * Math.PI * value / total;
+        context.beginPath();
+        context.moveTo(centerX, centerY);
+        context.arc(centerX, centerY, radius, angle, angle - sweep, true);
+        context.closePath();
+        context.fillStyle = CHART_COLORS[index % CHART_COLORS.length];
+        context.fill();
+
+        const middle = angle - sweep / 2;
+        context.fillStyle = '#000';
+        context.font = '12px sans-serif';
+        context.textAlign = Math.cos(middle) >= 0 ? 'left' : 'right';
+        context.fillText(labels[index], centerX + (radius + 10) * Math.cos(middle), centerY + (radius + 10) * Math.sin(middle));
+        context.textAlign = 'center';
+        context.fillText((100 * value / total).toFixed(1) + '%', centerX + radius * 0.6 * Math.cos(middle), centerY + radius * 0.6 * Math.sin(middle));
+        angle -= sweep;
+    });
+}
+
+function drawBarChart(canvas, labels, values, title, ylabel) {
+    const context = canvas.getContext('2d');
+    const maximum = Math.max(1, ...values);
+    const left = 70, right = 20, top = 40, bottom = 40;
+    const width = canvas.width - left - right;
+    const height = canvas.height - top - bottom;
+    const slot = width / Math.max(1, values.length);
+
+    context.clearRect(0, 0, canvas.width, canvas.height);
+    context.fillStyle = '#000';
+    context.font = '16px sans-serif';
+    context.textAlign = 'center';
+    context.fillText(title, canvas.width / 2, 24);
+
+    context.save();
+    context.translate(20, top + height / 2);
+    context.rotate(-Math.PI / 2);
+    context.font = '12px sans-serif';
+    context.fillText(ylabel, 0, 0);
+    context.restore();
+
+    context.font = '12px sans-serif';
+    values.forEach((value, index) => {
+        const barHeight = height * value / maximum;
+        const x = left + index * slot + slot * 0.1;
+        context.fillStyle = CHART_COLORS[0];
+        context.fillRect(x, top + height - barHeight, slot * 0.8, barHeight);
+        context.fillStyle = '#000';
+        context.fillText(String(value), x + slot * 0.4, top + height - barHeight - 4);
+        context.fillText(labels[index], x + slot * 0.4, top + height + 16);
+    });
+}
+
+async function loadSplitCharts(splitUrl, repo) {
+    const summary = await (await fetch(splitUrl)).json();
+    drawPieChart(
+        document.getElementById('split-chart'),
+        summary.split.map(row => `${row.names.join(', ')} (${row.user_id})`),
+        summary.split.map(row => row.points),
+        'Contribution Points Distribution'
+    );
+    drawBarChart(
+        document.getElementById('contributors-chart'),
+        summary.contributors.map(contributor => contributor.login),
+        summary.contributors.map(contributor => contributor.contributions),
+        `${repo} Contributors`,
+        'Number of Contributions'
+    );
+}
@@ -0,0 +1,45 @@
+import socket
+import threading
+import time
+import pipeline
+import flask_app
+from result_cache import write_result_head
+
+# Function to listen on a local port that accepts connections but never answers
+def silent_server():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+    connections = []
+
+    def accept():
+        while True:
+            try:
+                connections.append(listener.accept()[0])
+            except OSError:
+                return
+
+    threading.Thread(target=accept, daemon=True).start()
+    return listener, connections
+
+def test_submission_does_not_wait_on_github(monkeypatch, tmp_path):
+    # Stored results make the HEAD worth checking, which the job does rather than the request
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'octo_cat').mkdir()
+    write_result_head('octo_cat', 'a' * 40)
+    listener, connections = silent_server()
+    monkeypatch.setattr(pipeline, 'api_url', f'http://127.0.0.1:{listener.getsockname()[1]}')
+    monkeypatch.setattr(pipeline, 'github_headers', lambda: {'Authorization': 'token test'})
+    submitted = []
+    monkeypatch.setattr(flask_app.job_queue, 'submit', lambda function, *args, **kwargs: submitted.append((function, args)) or 'job')
+
+    started = time.monotonic()
+    response = flask_app.app.test_client().post('/', data={'repo_url': 'https://github.com/octo/cat'}, headers={'Accept': 'application/json'})
+    elapsed = time.monotonic() - started
+    listener.close()
+
+    assert response.status_code == 202
+    assert response.get_json()['job_id'] == 'job'
+    assert submitted == [(pipeline.analyze_repository, ('octo', 'cat', False, False))]
+    assert elapsed < 1
+    assert connections == []
@@ -0,0 +1,27 @@
+import os
+import subprocess
+import requests # type: ignore
+from git_backend import clone_url, resolve_identities
+
+# Stand-in session for a GitHub API that cannot be reached
+class OfflineSession:
+    headers: dict = {}
+
+    def get(self, url, **kwargs):
+        raise requests.ConnectionError(url)
+
+def test_clone_url_follows_the_api_host():
+    assert clone_url('https://api.github.com/repos/octo/cat') == 'https://github.com/octo/cat.git'
+    assert clone_url('https://github.example.com/api/v3/repos/octo/cat') == 'https://github.example.com/octo/cat.git'
+    assert clone_url('http://127.0.0.1:8080/repos/octo/cat') == 'http://127.0.0.1:8080/octo/cat.git'
+
+def test_unresolved_emails_have_no_account(tmp_path):
+    environment = {'GIT_AUTHOR_NAME': 'Ada', 'GIT_COMMITTER_NAME': 'Ada', 'HOME': str(tmp_path), 'PATH': os.environ['PATH']}
+    subprocess.run(['git', 'init', '--quiet', str(tmp_path)], check=True)
+    for email in ('ada@example.com', '1+ada@users.noreply.github.com'):
+        subprocess.run(['git', '-C', str(tmp_path), 'commit', '--quiet', '--allow-empty', '-m', 'Fix parser edge case'], check=True,
+                       env={**environment, 'GIT_AUTHOR_EMAIL': email, 'GIT_COMMITTER_EMAIL': email})
+
+    identities = resolve_identities(OfflineSession(), 'https://api.github.com/repos/octo/cat', str(tmp_path), [])
+    assert identities['ada@example.com'] is None
+    assert identities['1+ada@users.noreply.github.com'] == {'id': 1, 'login': 'ada'}
@@ -0,0 +1,24 @@
+from github_api import graphql_node_to_rest
+
+# Function to build a GraphQL history node with the given dates
+def history_node(authored_date, committed_date):
+    return {
+        'oid': 'a' * 40,
+        'message': 'Fix parser edge case',
+        'authoredDate': authored_date,
+        'committedDate': committed_date,
+        'author': {'name': 'Ada', 'email': 'ada@example.com', 'user': {'databaseId': 1, 'login': 'ada'}},
+        'committer': {'name': 'Ada', 'email': 'ada@example.com', 'user': None},
+        'signature': None,
+        'additions': 3,
+        'deletions': 1,
+    }
+
+def test_graphql_dates_are_converted_to_utc():
+    commit, _ = graphql_node_to_rest(history_node('2024-01-01T01:00:00+02:00', '2023-12-31T18:30:00-05:30'))
+    assert commit['commit']['author']['date'] == '2023-12-31T23:00:00Z'
+    assert commit['commit']['committer']['date'] == '2024-01-01T00:00:00Z'
+
+def test_graphql_utc_dates_are_kept():
+    commit, _ = graphql_node_to_rest(history_node('2024-01-01T10:00:00Z', '2024-01-01T10:00:00Z'))
+    assert commit['commit']['author']['date'] == '2024-01-01T10:00:00Z'
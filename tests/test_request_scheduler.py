@@ -0,0 +1,45 @@
+import time
+import requests # type: ignore
+import request_scheduler
+from request_scheduler import RequestScheduler
+
+# Backoff used instead of the real one, long enough to measure and short enough to wait for
+BACKOFF = 0.2
+
+# Function to build a response with the given status, headers and body
+def response(status_code, headers=None, text=''):
+    result = requests.Response()
+    result.status_code = status_code
+    result.headers.update(headers or {})
+    result._content = text.encode()
+    return result
+
+# Function to send one request through a scheduler that answers with the given responses in turn
+def send(monkeypatch, responses):
+    monkeypatch.setattr(RequestScheduler, '_backoff', lambda self, attempt: BACKOFF)
+    monkeypatch.setattr(request_scheduler.progress, 'report', lambda *args, **kwargs: None)
+    scheduler = RequestScheduler()
+    scheduler.add_tokens(['token'])
+    sent = []
+
+    def send_request(method, url, **kwargs):
+        sent.append(time.monotonic())
+        return responses[len(sent) - 1]
+
+    final = scheduler.send(send_request, 'GET', 'https://api.github.com/repos/octo/cat/commits')
+    return final, sent
+
+def test_bare_429_is_retried_after_a_backoff(monkeypatch):
+    final, sent = send(monkeypatch, [response(429), response(200)])
+    assert final.status_code == 200
+    assert sent[1] - sent[0] >= BACKOFF
+
+def test_primary_limit_without_reset_is_retried_after_a_backoff(monkeypatch):
+    final, sent = send(monkeypatch, [response(403, {'X-RateLimit-Remaining': '0'}, 'API rate limit exceeded'), response(200)])
+    assert final.status_code == 200
+    assert sent[1] - sent[0] >= BACKOFF
+
+def test_permission_error_is_final(monkeypatch):
+    final, sent = send(monkeypatch, [response(403, text='Resource not accessible by integration')])
+    assert final.status_code == 403
+    assert len(sent) == 1
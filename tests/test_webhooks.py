@@ -0,0 +1,31 @@
+import json
+import pytest
+import flask_app
+from webhooks import parse_push, sign
+
+# Function to build a push to the default branch of octo/cat
+def push_payload(**fields):
+    payload = {
+        'ref': 'refs/heads/main',
+        'before': 'a' * 40,
+        'after': 'b' * 40,
+        'repository': {'full_name': 'octo/cat', 'default_branch': 'main'},
+        'commits': [],
+    }
+    payload.update(fields)
+    return {key: value for key, value in payload.items() if value is not None}
+
+def test_push_is_parsed():
+    push = parse_push(push_payload())
+    assert (push['owner'], push['repo'], push['before'], push['after']) == ('octo', 'cat', 'a' * 40, 'b' * 40)
+
+def test_push_without_after_is_rejected():
+    with pytest.raises(ValueError):
+        parse_push(push_payload(after=None))
+
+def test_webhook_answers_400_for_a_push_without_after(monkeypatch):
+    monkeypatch.setattr(flask_app, 'webhook_secret', 's3cret')
+    body = json.dumps(push_payload(after=None)).encode()
+    response = flask_app.app.test_client().post('/webhooks/github', data=body,
+                                                headers={'X-GitHub-Event': 'push', 'X-Hub-Signature-256': sign(body, 's3cret')})
+    assert response.status_code == 400
@@ -0,0 +1,191 @@
+import json
+import os
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np # type: ignore
+from scoring import CommitTable, RuleSet
+
+# Number of points in time sampled for the share-over-time chart
+SERIES_SAMPLES = 50
+
+class Timeline:
+    """
+    Cumulative points of every contributor, ordered by commit date.
+
+    The points each user earned are kept sorted by (user, time) in one array,
+    with a running prefix sum over all of them, so the points of any user in
+    any window are the difference of two prefix sums found by binary search.
+    A split for a window therefore costs O(users * log commits) instead of a
+    rescan of the commit table.
+    """
+
+    def __init__(self, user_ids: np.ndarray, offsets: np.ndarray, times: np.ndarray, prefix: np.ndarray, names: Dict[str, Set[str]]):
+        self.user_ids = user_ids
+        self.offsets = offsets
+        self.times = times
+        self.prefix = prefix
+        self.names = names
+
+    def points(self, since: Optional[np.datetime64] = None, until: Optional[np.datetime64] = None) -> Dict[str, int]:
+        """
+        Returns the points per user ID of the commits dated in [since, until).
+        """
+        since_value = to_seconds(since) if since is not None else None
+        until_value = to_seconds(until) if until is not None else None
+        points = {}
+        for code, user_id in enumerate(self.user_ids.tolist()):
+            start, end = int(self.offsets[code]), int(self.offsets[code + 1])
+            low = start + (int(np.searchsorted(self.times[start:end], since_value, side='left')) if since_value is not None else 0)
+            high = start + (int(np.searchsorted(self.times[start:end], until_value, side='left')) if until_value is not None else end - start)
+            user_points = int(self.prefix[high] - self.prefix[low])
+            if high > low:
+                points[user_id] = user_points
+        return points
+
+    def bounds(self) -> Tuple[Optional[np.datetime64], Optional[np.datetime64]]:
+        """
+        Returns the dates of the first and last commit, or None for an empty timeline.
+        """
+        if not len(self.times):
+            return None, None
+        return np.datetime64(int(self.times.min()), 's'), np.datetime64(int(self.times.max()), 's')
+
+    def shares(self, samples: int = SERIES_SAMPLES) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Samples every contributor's share of all points earned up to and including evenly
+        spaced points in time, from the first commit to the last.
+
+        Returns:
+            tuple: The sample times and the percentage of the pie per user ID at each of them.
+        """
+        first, last = self.bounds()
+        if first is None:
+            return np.array([], dtype='datetime64[s]'), {}
+        sample_times = np.linspace(to_seconds(first), to_seconds(last), samples).astype(np.int64)
+        cumulative = np.zeros((len(self.user_ids), samples))
+        for code in range(len(self.user_ids)):
+            start, end = int(self.offsets[code]), int(self.offsets[code + 1])
+            cumulative[code] = self.prefix[start + np.searchsorted(self.times[start:end], sample_times, side='right')] - self.prefix[start]
+        totals = cumulative.sum(axis=0)
+        shares = np.divide(100 * cumulative, totals, out=np.zeros_like(cumulative), where=totals > 0)
+        return sample_times.astype('datetime64[s]'), {user_id: shares[code] for code, user_id in enumerate(self.user_ids.tolist())}
+
+# Function to convert a date to seconds since the epoch
+def to_seconds(value: np.datetime64) -> int:
+    return int(np.datetime64(value, 's').astype(np.int64))
+
+# Function to parse a since/until query value
+def parse_date(value: Optional[str]) -> Optional[np.datetime64]:
+    """
+    Accepts a date (2024-06-30) or a UTC timestamp (2024-06-30T12:00:00Z).
+
+    Returns:
+        np.datetime64: The point in time, or None for an empty value.
+    """
+    if not value:
+        return None
+    try:
+        return np.datetime64(value.strip().rstrip('Z'), 's')
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}')
+
+# Function to build the timeline of a commit table under a rule set
+def build_timeline(table: CommitTable, rule_set: RuleSet) -> Timeline:
+    """
+    Scores the table and credits every commit to its author and committer on its
+    author date, with the same exclusions as aggregate_points.
+
+    Returns:
+        Timeline: The cumulative points index.
+    """
+    if not len(table):
+        return Timeline(np.array([], dtype=str), np.zeros(1, dtype=np.int64), np.array([], dtype=np.int64), np.zeros(1, dtype=np.int64), {})
+
+    commit_points = rule_set.score(table)
+    # GitHub dates end in Z; the first 19 characters are an ISO timestamp in UTC
+    times = table['date'].astype('U19').astype('datetime64[s]').astype(np.int64)
+    user_ids, id_codes = table.codes(('author_id', 'committer_id'))
+    names, name_codes = table.codes(('author', 'committer'))
+
+    has_id = user_ids != ''
+    codes: List[np.ndarray] = []
+    role_times: List[np.ndarray] = []
+    role_points: List[np.ndarray] = []
+    pairs: List[np.ndarray] = []
+    for role, role_id_codes, role_name_codes in zip(('author', 'committer'), id_codes, name_codes):
+        valid = has_id[role_id_codes] & ~rule_set.excluded(table, role)
+        codes.append(role_id_codes[valid].astype(np.int64))
+        role_times.append(times[valid])
+        role_points.append(commit_points[valid])
+        pairs.append(role_id_codes[valid].astype(np.int64) * len(names) + role_name_codes[valid])
+
+    all_codes = np.concatenate(codes)
+    all_times = np.concatenate(role_times)
+    all_points = np.concatenate(role_points)
+
+    # Renumber the users that earned points, then order by (user, time)
+    used, user_codes = np.unique(all_codes, return_inverse=True)
+    order = np.lexsort((all_times, user_codes))
+    user_codes = user_codes[order]
+    offsets = np.searchsorted(user_codes, np.arange(len(used) + 1), side='left').astype(np.int64)
+    prefix = np.concatenate([[0], np.cumsum(all_points[order])]).astype(np.int64)
+
+    user_id_to_names: Dict[str, Set[str]] = {}
+    for pair in np.unique(np.concatenate(pairs)).tolist():
+        user_id_to_names.setdefault(str(user_ids[pair // len(names)]), set()).add(str(names[pair % len(names)]))
+    return Timeline(np.array([str(user_ids[code]) for code in used.tolist()]), offsets, all_times[order], prefix, user_id_to_names)
+
+# Function to add the commits of a table to an existing timeline
+def extend_timeline(timeline: Timeline, table: CommitTable, rule_set: RuleSet) -> Timeline:
+    """
+    Scores only the new commits and merges their entries into the index. The
+    existing entries are re-sorted with the new ones, but none are rescored,
+    so e.g. a push of a few commits costs a sort rather than a full rebuild.
+
+    Returns:
+        Timeline: The timeline covering the commits of both.
+    """
+    addition = build_timeline(table, rule_set)
+    names = {user_id: set(user_names) for user_id, user_names in timeline.names.items()}
+    for user_id, user_names in addition.names.items():
+        names.setdefault(user_id, set()).update(user_names)
+    if not len(addition.times):
+        return Timeline(timeline.user_ids, timeline.offsets, timeline.times, timeline.prefix, names)
+
+    # Expand both into one (user, time, points) entry per credited commit
+    user_ids, inverse = np.unique(np.concatenate([timeline.user_ids.astype(str), addition.user_ids.astype(str)]), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    codes = np.concatenate([
+        inverse[:len(timeline.user_ids)][np.repeat(np.arange(len(timeline.user_ids)), np.diff(timeline.offsets))],
+        inverse[len(timeline.user_ids):][np.repeat(np.arange(len(addition.user_ids)), np.diff(addition.offsets))],
+    ])
+    times = np.concatenate([timeline.times, addition.times])
+    points = np.concatenate([np.diff(timeline.prefix), np.diff(addition.prefix)])
+
+    order = np.lexsort((times, codes))
+    offsets = np.searchsorted(codes[order], np.arange(len(user_ids) + 1), side='left').astype(np.int64)
+    prefix = np.concatenate([[0], np.cumsum(points[order])]).astype(np.int64)
+    return Timeline(user_ids, offsets, times[order], prefix, names)
+
+# Function to save a timeline together with what it was built from
+def save_timeline(path: str, timeline: Timeline, rows: int, fingerprint: str):
+    temp_file = f'{path}.{os.getpid()}.tmp.npz'
+    np.savez(temp_file, user_ids=timeline.user_ids.astype(str), offsets=timeline.offsets, times=timeline.times, prefix=timeline.prefix,
+             meta=np.array(json.dumps({'rows': rows, 'fingerprint': fingerprint, 'names': {user_id: sorted(names) for user_id, names in timeline.names.items()}})))
+    os.replace(temp_file, path)
+
+# Function to load a saved timeline if it is still current
+def load_timeline(path: str, rows: int, fingerprint: str) -> Optional[Timeline]:
+    """
+    Returns:
+        Timeline: The saved timeline, or None if it is missing or was built from
+        a different number of commit store rows or another rule set.
+    """
+    try:
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta['rows'] != rows or meta['fingerprint'] != fingerprint:
+                return None
+            return Timeline(data['user_ids'], data['offsets'], data['times'], data['prefix'],
+                            {user_id: set(names) for user_id, names in meta['names'].items()})
+    except (OSError, KeyError, ValueError):
+        return None
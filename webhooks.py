@@ -0,0 +1,100 @@
+import hashlib
+import hmac
+import re
+from datetime import datetime, timezone
+from typing import Optional
+
+# Header carrying the HMAC-SHA256 of the request body, keyed with the webhook secret
+SIGNATURE_HEADER = 'X-Hub-Signature-256'
+
+# GitHub lists at most this many commits in a push payload; longer pushes are fetched instead
+PUSH_COMMIT_LIMIT = 2048
+
+# SHA GitHub reports as "before" for a new branch and as "after" for a deleted one
+NULL_SHA = '0' * 40
+
+# Owner and repository names GitHub allows, so a payload cannot point outside the output directories
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]*$')
+
+# Commit SHAs, SHA-1 or SHA-256
+SHA_PATTERN = re.compile(r'^[0-9a-f]{40}([0-9a-f]{24})?$')
+
+# Function to check the signature GitHub sends with a webhook delivery
+def verify_signature(body: bytes, signature: Optional[str], secret: str) -> bool:
+    """
+    Returns:
+        bool: True if the signature is the HMAC-SHA256 of the body under the secret.
+    """
+    if not signature or not signature.startswith('sha256='):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature[len('sha256='):], expected)
+
+# Function to sign a payload the way GitHub does, e.g. to replay recorded deliveries
+def sign(body: bytes, secret: str) -> str:
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+# Function to convert a push payload timestamp to the UTC format of the commit store
+def utc_date(timestamp: str) -> str:
+    # Push payloads carry the committer's offset (2024-05-01T12:00:00+02:00); the API and the store use UTC
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+# Function to read what DevPie needs from a push payload
+def parse_push(payload: dict) -> Optional[dict]:
+    """
+    Keeps pushes to the default branch that add commits, i.e. not the
+    deletion of the branch.
+
+    Returns:
+        dict: The owner, repo, before and after SHAs, whether the push was
+        forced or truncated, and its commits oldest first; or None for pushes
+        that do not change the default branch.
+    """
+    repository = payload.get('repository') or {}
+    owner, _, repo = (repository.get('full_name') or '').partition('/')
+    if not NAME_PATTERN.match(owner) or not NAME_PATTERN.match(repo):
+        raise ValueError('Push payload without a valid repository')
+    if payload.get('ref') != f"refs/heads/{repository.get('default_branch')}" or payload.get('deleted') or payload.get('after') == NULL_SHA:
+        return None
+    if not isinstance(payload.get('after'), str) or not SHA_PATTERN.match(payload['after']):
+        raise ValueError('Push payload without a valid after SHA')
+    if payload.get('before') is not None and (not isinstance(payload['before'], str) or not SHA_PATTERN.match(payload['before'])):
+        raise ValueError('Push payload with an invalid before SHA')
+
+    commits = payload.get('commits') or []
+    if not isinstance(commits, list):
+        raise ValueError('Push payload with invalid commits')
+    return {
+        'owner': owner,
+        'repo': repo,
+        'before': payload.get('before'),
+        'after': payload['after'],
+        'forced': bool(payload.get('forced')),
+        'truncated': len(commits) >= PUSH_COMMIT_LIMIT,
+        'commits': commits,
+    }
+
+# Function to shape a commit of a push payload like a commit of the /commits API
+def push_commit(entry: dict, commit_details: dict) -> dict:
+    """
+    The payload gives the message and names of each commit; the commit details
+    (fetched or cached) give the GitHub accounts behind them and the author and
+    committer dates. The payload has a single timestamp, which is only used for
+    a date the details lack.
+
+    Returns:
+        dict: The commit, as commit_row expects it.
+    """
+    details = commit_details.get('commit') or {}
+    author_date = utc_date((details.get('author') or {}).get('date') or entry['timestamp'])
+    committer_date = utc_date((details.get('committer') or {}).get('date') or entry['timestamp'])
+    return {
+        'sha': entry['id'],
+        'commit': {
+            'author': {'name': entry['author']['name'], 'email': entry['author'].get('email'), 'date': author_date},
+            'committer': {'name': entry['committer']['name'], 'email': entry['committer'].get('email'), 'date': committer_date},
+            'message': entry['message'],
+        },
+        'author': commit_details.get('author'),
+        'committer': commit_details.get('committer'),
+    }